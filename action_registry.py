@@ -0,0 +1,400 @@
+import json
+from typing import Callable, Dict, List, Optional, Tuple
+
+SCREEN_WIDTH = 1080
+SCREEN_HEIGHT = 1920
+
+
+class Param:
+    """
+    One action parameter: its type, whether it is required, default, range,
+    allowed values and how it is shown in the prompt.
+
+    Kinds are "int", "float", "bool", "string", "enum", "list" and "object".
+    """
+
+    def __init__(self, name: str, kind: str, required: bool = True, default=None,
+                 minimum=None, maximum=None, choices: Optional[List[str]] = None,
+                 example: Optional[str] = None, max_length: Optional[int] = None,
+                 fields: Optional[List["Param"]] = None, items: Optional["Param"] = None,
+                 required_if: Optional[Tuple[str, List[str]]] = None):
+        self.name = name
+        self.kind = kind
+        self.required = required and default is None and required_if is None
+        self.default = default
+        self.minimum = minimum
+        self.maximum = maximum
+        self.choices = choices
+        self.example = example
+        self.max_length = max_length
+        self.fields = fields
+        self.items = items
+        self.required_if = required_if
+
+    def prompt_value(self) -> str:
+        """Render the parameter's placeholder for the prompt's action list."""
+        if self.kind in ("int", "float", "bool"):
+            return self.kind
+        if self.kind == "enum":
+            return json.dumps(self.example or "|".join(self.choices))
+        if self.kind == "list":
+            return f"[{self.items.prompt_value()}]"
+        if self.kind == "object":
+            if not self.fields:
+                return "{}"
+            return "{" + ", ".join(f'"{field.name}": {field.prompt_value()}' for field in self.fields) + "}"
+        return json.dumps(self.example or "string")
+
+    def json_schema(self) -> Dict:
+        """JSON Schema for the parameter's value."""
+        if self.kind == "enum":
+            return {"type": "string", "enum": list(self.choices)}
+        if self.kind == "list":
+            return {"type": "array", "items": self.items.json_schema()}
+        if self.kind == "object":
+            if not self.fields:
+                return {"type": "object"}
+            return {
+                "type": "object",
+                "properties": {field.name: field.json_schema() for field in self.fields},
+                "required": [field.name for field in self.fields],
+            }
+        return {"type": {"int": "integer", "float": "number", "bool": "boolean",
+                         "string": "string"}[self.kind]}
+
+
+class ActionSpec:
+    """
+    Declarative description of an action.
+
+    Args:
+        name: Action name as it appears in commands
+        params: Parameters in prompt order
+        handler: AndroidController method that executes it (None if unsupported)
+        args: Command keys passed positionally to the handler
+        changes_screen: Whether executing it invalidates cached screenshots
+    """
+
+    def __init__(self, name: str, params: List[Param] = (), handler: Optional[str] = None,
+                 args: Tuple[str, ...] = (), changes_screen: bool = False):
+        self.name = name
+        self.params = list(params)
+        self.handler = handler
+        self.args = tuple(args)
+        self.changes_screen = changes_screen
+        self.checks = [_compile_check(name, param) for param in self.params]
+
+    def prompt_line(self) -> str:
+        """Render the action as a line of the prompt's action list."""
+        fields = [f'"action": "{self.name}"'] + [f'"{param.name}": {param.prompt_value()}'
+                                                   for param in self.params]
+        return f"- {self.name}: {{{', '.join(fields)}}}"
+
+    def json_schema(self) -> Dict:
+        """JSON Schema branch accepting only this action."""
+        properties = {"action": {"const": self.name}}
+        properties.update((param.name, param.json_schema()) for param in self.params)
+        return {
+            "type": "object",
+            "properties": properties,
+            "required": ["action"] + [param.name for param in self.params if param.required],
+            "additionalProperties": False,
+        }
+
+
+def _to_bool(name: str, value) -> bool:
+    """Accept real booleans and the strings "true"/"false"; reject anything else."""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.strip().lower() in ("true", "false"):
+        return value.strip().lower() == "true"
+    raise ValueError(f"{name} must be true or false, got {value!r}")
+
+
+def _compile_check(action: str, param: Param) -> Callable[[Dict], Optional[str]]:
+    """
+    Build the check for one parameter.
+
+    The check fills in defaults and normalizes the value in place (clamping
+    numbers, coercing booleans, truncating text) and returns an error message
+    or None. Fields of an object parameter are checked the same way.
+    """
+    name = param.name
+    convert = {"int": int, "float": float}.get(param.kind)
+    if param.kind == "bool":
+        convert = lambda value: _to_bool(name, value)
+    if param.kind == "string" and param.max_length:
+        convert = lambda value: str(value)[:param.max_length]
+    low, high = param.minimum, param.maximum
+    choices = set(param.choices) if param.choices else None
+    field_names = [field.name for field in param.fields] if param.fields else None
+    field_checks = [_compile_check(f"{action} {name}", field) for field in param.fields or ()]
+
+    def check(command: Dict) -> Optional[str]:
+        if name not in command:
+            if param.default is not None:
+                # Copy list defaults so commands never share them
+                command[name] = list(param.default) if isinstance(param.default, list) else param.default
+            elif param.required or (param.required_if is not None and
+                                    command.get(param.required_if[0]) in param.required_if[1]):
+                return f"{action} action requires {name}"
+            else:
+                return None
+
+        value = command[name]
+        if convert is not None:
+            value = convert(value)
+            if low is not None:
+                value = max(low, value)
+            if high is not None:
+                value = min(high, value)
+            command[name] = value
+        if choices is not None and value not in choices:
+            return f"{action} {name} must be one of: {param.choices}"
+        if param.kind == "list" and not isinstance(value, list):
+            return f"{action} {name} must be a list"
+        if field_names and not (isinstance(value, dict) and all(key in value for key in field_names)):
+            return f"{action} {name} requires {', '.join(field_names)}"
+        for field_check in field_checks:
+            error = field_check(value)
+            if error:
+                return error
+        return None
+
+    return check
+
+
+# Parameter helpers
+def integer(name, minimum=None, maximum=None, default=None, required=True):
+    return Param(name, "int", required, default, minimum, maximum)
+
+
+def number(name, minimum=None, maximum=None, default=None, required=True):
+    return Param(name, "float", required, default, minimum, maximum)
+
+
+def flag(name, required=True):
+    return Param(name, "bool", required)
+
+
+def text(name, example="string", required=True, max_length=None, required_if=None):
+    return Param(name, "string", required, example=example, max_length=max_length, required_if=required_if)
+
+
+def choice(name, choices, default=None, required=True, example=None):
+    return Param(name, "enum", required, default, choices=choices, example=example)
+
+
+X = integer("x", 0, SCREEN_WIDTH)
+Y = integer("y", 0, SCREEN_HEIGHT)
+PACKAGE = text("package", "com.example.app")
+ENABLED = flag("enabled")
+DIRECTIONS = ["up", "down", "left", "right"]
+KEYCODES = ["BACK", "HOME", "MENU", "POWER", "VOLUME_UP", "VOLUME_DOWN", "ENTER", "DELETE",
+            "TAB", "SPACE", "SEARCH", "CAMERA", "CALL", "ENDCALL"]
+LOCATOR = choice("method", ["text", "id", "class", "xpath"])
+VALUE = text("value")
+
+
+def _swipe_params(duration: int) -> List[Param]:
+    return [integer("start_x", 0, SCREEN_WIDTH), integer("start_y", 0, SCREEN_HEIGHT),
+            integer("end_x", 0, SCREEN_WIDTH), integer("end_y", 0, SCREEN_HEIGHT),
+            integer("duration", 100, 5000, default=duration)]
+
+
+def _toggle(name: str) -> ActionSpec:
+    return ActionSpec(name, [ENABLED])
+
+
+ACTION_SPECS: List[ActionSpec] = [
+    ActionSpec("tap", [X, Y], handler="_tap", args=("x", "y"), changes_screen=True),
+    ActionSpec("long_press", [X, Y, integer("duration", 500, 10000, default=1000)]),
+    ActionSpec("double_tap", [X, Y]),
+    ActionSpec("swipe", _swipe_params(300), handler="_swipe",
+               args=("start_x", "start_y", "end_x", "end_y"), changes_screen=True),
+    ActionSpec("pinch", [X, Y, number("scale", 0.1, 10.0)]),
+    ActionSpec("zoom", [X, Y, number("scale", 0.1, 10.0)]),
+    ActionSpec("type", [text("text", max_length=1000)], handler="_type_text", args=("text",),
+               changes_screen=True),
+    ActionSpec("clear_text"),
+    ActionSpec("paste"),
+    ActionSpec("copy"),
+    ActionSpec("cut"),
+    ActionSpec("key", [choice("keycode", KEYCODES)], handler="_press_key", args=("keycode",),
+               changes_screen=True),
+    ActionSpec("app", [PACKAGE], handler="_open_app", args=("package",), changes_screen=True),
+    ActionSpec("app_info", [PACKAGE]),
+    ActionSpec("force_stop", [PACKAGE]),
+    ActionSpec("uninstall", [PACKAGE]),
+    ActionSpec("install", [text("apk_path", "/path/to/app.apk")]),
+    ActionSpec("screenshot", handler="_take_screenshot"),
+    ActionSpec("screen_record", [integer("duration", 1, 300, default=30)]),
+    ActionSpec("scroll", [choice("direction", DIRECTIONS), integer("distance", 100, 2000, default=500)],
+               handler="_scroll", args=("direction",), changes_screen=True),
+    ActionSpec("fling", [choice("direction", DIRECTIONS), integer("velocity", 100, 5000, default=1000)]),
+    ActionSpec("drag", _swipe_params(1000)),
+    ActionSpec("rotate", [choice("orientation", ["portrait", "landscape", "reverse_portrait",
+                                                 "reverse_landscape"])]),
+    ActionSpec("brightness", [integer("level", 0, 255)]),
+    ActionSpec("volume", [integer("level", 0, 100),
+                          choice("stream", ["music", "ring", "alarm", "notification"], default="music")]),
+    _toggle("wifi"),
+    _toggle("bluetooth"),
+    _toggle("airplane_mode"),
+    _toggle("location"),
+    ActionSpec("notification_panel", [flag("expand")]),
+    ActionSpec("quick_settings"),
+    ActionSpec("recent_apps"),
+    ActionSpec("split_screen", [text("app1", "package1"), text("app2", "package2")]),
+    ActionSpec("picture_in_picture"),
+    ActionSpec("accessibility", [choice("service", ["talkback", "magnification"]), ENABLED]),
+    ActionSpec("developer_options", [choice("option", ["usb_debugging", "show_touches", "pointer_location"]),
+                                     ENABLED]),
+    ActionSpec("system_ui", [choice("component", ["status_bar", "navigation_bar"]), flag("visible")]),
+    ActionSpec("input_method", [text("ime", "keyboard_package")]),
+    ActionSpec("language", [choice("locale", ["en_US", "es_ES", "fr_FR", "de_DE", "ja_JP", "ko_KR", "zh_CN"])]),
+    ActionSpec("timezone", [choice("zone", ["America/New_York", "Europe/London", "Asia/Tokyo"])]),
+    _toggle("auto_rotate"),
+    ActionSpec("sleep_timeout", [integer("seconds", 15, 1800)]),
+    ActionSpec("font_size", [number("scale", 0.5, 2.0)]),
+    ActionSpec("display_size", [number("scale", 0.5, 2.0)]),
+    _toggle("dark_mode"),
+    _toggle("do_not_disturb"),
+    _toggle("battery_saver"),
+    _toggle("data_saver"),
+    _toggle("hotspot"),
+    _toggle("nfc"),
+    ActionSpec("cast_screen", [text("device", "device_name", required=False)]),
+    ActionSpec("backup", [choice("type", ["full", "app_data"], required=False)]),
+    ActionSpec("factory_reset", [flag("confirm", required=False)]),
+    ActionSpec("reboot", [choice("mode", ["normal", "recovery", "bootloader"], required=False)]),
+    ActionSpec("shutdown"),
+    ActionSpec("wake_up"),
+    ActionSpec("lock_screen"),
+    ActionSpec("unlock_screen", [choice("method", ["swipe", "pin", "pattern", "fingerprint"]),
+                                 text("credential", required_if=("method", ["pin", "pattern"]))]),
+    ActionSpec("emergency_call"),
+    _toggle("flashlight"),
+    ActionSpec("camera_flash", [choice("mode", ["on", "off", "auto", "torch"])]),
+    ActionSpec("vibrate", [Param("pattern", "list", required=False, items=Param("", "int")),
+                           integer("amplitude", 1, 255, default=128)]),
+    ActionSpec("play_sound", [text("file", "/path/to/sound.mp3"), number("volume", 0.0, 1.0, default=1.0)]),
+    ActionSpec("tts", [text("text"), choice("language", ["en", "es", "fr", "de", "ja", "ko", "zh"], default="en")]),
+    ActionSpec("ocr", [Param("region", "object", required=False, fields=[
+        integer("x"), integer("y"), integer("width"), integer("height")])]),
+    ActionSpec("find_element", [LOCATOR, VALUE]),
+    ActionSpec("wait_for_element", [LOCATOR, VALUE, integer("timeout", 1, 60, default=10)]),
+    ActionSpec("assert_element", [LOCATOR, VALUE, flag("exists")]),
+    ActionSpec("get_element_bounds", [LOCATOR, VALUE]),
+    ActionSpec("get_screen_info"),
+    ActionSpec("get_device_info"),
+    ActionSpec("get_battery_info"),
+    ActionSpec("get_network_info"),
+    ActionSpec("get_storage_info"),
+    ActionSpec("get_running_apps"),
+    ActionSpec("get_installed_apps"),
+    ActionSpec("get_system_settings", [choice("namespace", ["system", "secure", "global"], required=False)]),
+    ActionSpec("set_system_setting", [choice("namespace", ["system", "secure", "global"], required=False),
+                                      text("key", required=False), text("value", required=False)]),
+    ActionSpec("shell_command", [text("command")]),
+    ActionSpec("file_operation", [choice("operation", ["copy", "move", "delete", "create", "read"]),
+                                  text("source", "/path"),
+                                  text("destination", "/path", required_if=("operation", ["copy", "move"]))]),
+    ActionSpec("permission", [PACKAGE, text("permission", "android.permission.CAMERA"), flag("grant")]),
+    ActionSpec("intent", [text("intent_action", "android.intent.action.VIEW", required=False),
+                          text("data", "content://", required=False),
+                          Param("extras", "object", required=False)]),
+    ActionSpec("broadcast", [text("intent_action", "com.example.CUSTOM_ACTION", required=False),
+                             Param("extras", "object", required=False)]),
+    ActionSpec("service", [choice("operation", ["start", "stop"], required=False),
+                           text("component", "com.example/.MyService", required=False)]),
+    ActionSpec("activity", [choice("operation", ["start", "finish"], required=False),
+                            text("component", "com.example/.MainActivity", required=False)]),
+    ActionSpec("monkey_test", [PACKAGE, integer("events", 1, 10000, default=100), integer("seed", default=1)]),
+    ActionSpec("stress_test", [choice("type", ["cpu", "memory", "storage", "network"]),
+                               integer("duration", 1, 300, default=60)]),
+    ActionSpec("performance_test", [PACKAGE, integer("duration", 1, 300, default=60)]),
+    ActionSpec("memory_dump", [text("package", "com.example.app", required=False),
+                               text("output", "/path/to/dump", required=False)]),
+    ActionSpec("cpu_profile", [text("package", "com.example.app", required=False),
+                               integer("duration", required=False)]),
+    ActionSpec("network_monitor", [text("package", "com.example.app", required=False),
+                                   integer("duration", required=False)]),
+    ActionSpec("log_capture", [choice("level", ["verbose", "debug", "info", "warn", "error"], required=False),
+                               text("tag", required=False), integer("duration", required=False)]),
+    ActionSpec("crash_report", [text("package", "com.example.app", required=False)]),
+    ActionSpec("anr_report", [text("package", "com.example.app", required=False)]),
+    ActionSpec("security_scan", [text("package", "com.example.app", required=False)]),
+    ActionSpec("accessibility_scan"),
+    ActionSpec("ui_hierarchy", [choice("format", ["xml", "json"], default="xml")]),
+    ActionSpec("element_screenshot", [LOCATOR, VALUE]),
+    ActionSpec("compare_screenshots", [text("image1", "/path1"), text("image2", "/path2"),
+                                       number("threshold", 0.0, 1.0, default=0.9)]),
+    ActionSpec("visual_test", [text("baseline", "/path/to/baseline.png"),
+                               number("threshold", 0.0, 1.0, default=0.9)]),
+    ActionSpec("gesture_record", [text("name", "gesture_name"), integer("duration", 1, 60, default=10)]),
+    ActionSpec("gesture_play", [text("name", "gesture_name")]),
+    ActionSpec("macro_record", [text("name", "macro_name")]),
+    ActionSpec("macro_play", [text("name", "macro_name")]),
+    ActionSpec("conditional", [Param("condition", "object", fields=[LOCATOR, VALUE, flag("exists")]),
+                               Param("then", "object"), Param("else", "object", required=False)]),
+    ActionSpec("loop", [integer("count", 1, 100), Param("actions", "list", items=Param("", "object"))]),
+    ActionSpec("wait", [number("seconds", 0.1, 60.0)], handler="_wait", args=("seconds",)),
+    ActionSpec("random_action", [Param("actions", "list", default=["tap", "swipe", "scroll"],
+                                       items=choice("", ["tap", "swipe", "scroll"])),
+                                 integer("count", 1, 50, default=5)]),
+]
+
+# Built once at import
+ACTIONS: Dict[str, ActionSpec] = {spec.name: spec for spec in ACTION_SPECS}
+
+SCREEN_CHANGING_ACTIONS = {spec.name for spec in ACTION_SPECS if spec.changes_screen}
+
+
+def validate_command(command: Dict) -> Dict:
+    """
+    Validate and normalize a parsed command in place using the registry.
+
+    Returns the command, or {"error": ...}. Unknown actions are passed
+    through unchanged for the executor to report.
+    """
+    if "action" not in command:
+        return {"error": "No action specified"}
+
+    spec = ACTIONS.get(command["action"])
+    if spec is None:
+        return command
+
+    for check in spec.checks:
+        try:
+            error = check(command)
+        except (TypeError, ValueError) as e:
+            return {"error": f"Invalid {spec.name} command: {e}"}
+        if error:
+            return {"error": error}
+    return command
+
+
+def prompt_action_list(specs: Optional[List[ActionSpec]] = None) -> str:
+    """Render the "Available actions" section of the prompt."""
+    return "\n".join(spec.prompt_line() for spec in (specs or ACTION_SPECS))
+
+
+def build_action_schema(specs: Optional[List[ActionSpec]] = None) -> Dict:
+    """
+    Build a JSON Schema accepting exactly one of the given actions.
+
+    Each branch pins "action" with const, so the schema is a discriminated
+    union a constrained decoder can follow token by token.
+    """
+    return {"anyOf": [spec.json_schema() for spec in (specs or ACTION_SPECS)]}
+
+
+def build_plan_schema(specs: Optional[List[ActionSpec]] = None) -> Dict:
+    """Build a JSON Schema for a plan: {"actions": [one or more actions, in order]}."""
+    return {
+        "type": "object",
+        "properties": {"actions": {"type": "array", "items": build_action_schema(specs), "minItems": 1}},
+        "required": ["actions"],
+        "additionalProperties": False,
+    }
@@ -0,0 +1,550 @@
+import asyncio
+import shlex
+import subprocess
+import threading
+import queue
+import socket
+import struct
+import uuid
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+
+class AdbError(Exception):
+    """Raised when the adb binary or server rejects a request."""
+    pass
+
+
+# Seconds a persistent shell command may take before the session is
+# considered hung, killed and respawned on the next command
+DEFAULT_SHELL_TIMEOUT = 30.0
+
+
+# Exit status reported when `shell:` output ends without the exit status
+# marker, the same code adb itself uses for a lost connection
+SHELL_INCOMPLETE_RETURNCODE = 255
+
+
+def quote_args(args: List) -> str:
+    """Join arguments into a device shell command line, each one quoted."""
+    return ' '.join(shlex.quote(str(arg)) for arg in args)
+
+
+def parse_device_list(lines: List[str]) -> List[Dict]:
+    """Parse tab-separated serial/state lines as printed by `adb devices`."""
+    devices = []
+    for line in lines:
+        if line.strip() and '\t' in line:
+            device_id, status = line.split('\t')[:2]
+            devices.append({"id": device_id, "status": status.strip()})
+    return devices
+
+
+class SubprocessTransport:
+    """One-shot transport: forks a fresh `adb -s <serial> ...` per command."""
+
+    def __init__(self, adb_path: str = "adb"):
+        self.adb_path = adb_path
+
+    def devices(self) -> List[Dict]:
+        """List attached devices as {"id", "status"} dicts."""
+        result = subprocess.run([self.adb_path, 'devices'], capture_output=True, text=True)
+        if result.returncode != 0:
+            raise AdbError("ADB not found. Please install Android SDK Platform Tools.")
+        return parse_device_list(result.stdout.strip().split('\n')[1:])  # Skip header
+
+    def shell(self, serial: str, args: List[str], timeout: Optional[float] = None) -> subprocess.CompletedProcess:
+        """Run a shell command on the device and return the completed process."""
+        # adb joins its arguments and hands them to the device shell, so quote them
+        return subprocess.run(
+            [self.adb_path, '-s', serial, 'shell', quote_args(args)],
+            capture_output=True, text=True, timeout=timeout
+        )
+
+    def exec_out(self, serial: str, args: List[str], timeout: Optional[float] = None) -> bytes:
+        """Run a command with a raw binary stdout (`adb exec-out`)."""
+        result = subprocess.run(
+            [self.adb_path, '-s', serial, 'exec-out', quote_args(args)],
+            capture_output=True, timeout=timeout
+        )
+        if result.returncode != 0:
+            raise AdbError(f"exec-out failed: {result.stderr.decode('utf-8', 'replace').strip()}")
+        return result.stdout
+
+    def pull(self, serial: str, remote_path: str) -> bytes:
+        """Read a file from the device."""
+        return self.exec_out(serial, ['cat', remote_path])
+
+    def track_devices(self) -> Iterator[List[Dict]]:
+        """Yield the full device list each time it changes (`adb track-devices`)."""
+        process = subprocess.Popen([self.adb_path, 'track-devices'], stdout=subprocess.PIPE)
+        try:
+            while True:
+                # Same framing as the host protocol: 4 hex digits of length, then payload
+                header = process.stdout.read(4)
+                if len(header) < 4:
+                    raise AdbError("adb track-devices stream ended")
+                payload = process.stdout.read(int(header, 16))
+                yield parse_device_list(payload.decode('utf-8', 'replace').split('\n'))
+        finally:
+            process.kill()
+            process.wait()
+
+    def close(self):
+        """Nothing to release for one-shot commands."""
+        pass
+
+
+class ShellSession:
+    """A long-lived `adb shell` process speaking a sentinel-delimited protocol.
+
+    Each command is written as a single line followed by a `printf` of a
+    per-session sentinel and the exit status, so responses can be framed
+    without a PTY. The session respawns itself if the process dies.
+    """
+
+    def __init__(self, serial: str, adb_path: str = "adb",
+                 timeout: float = DEFAULT_SHELL_TIMEOUT):
+        self.serial = serial
+        self.adb_path = adb_path
+        self.timeout = timeout
+        self.sentinel = f"__GAB_{uuid.uuid4().hex}__"
+        self.process = None
+        self._lines = None
+        self._lock = threading.Lock()
+
+    def _spawn(self):
+        """Start the shell process and its stdout reader thread."""
+        self.process = subprocess.Popen(
+            [self.adb_path, '-s', self.serial, 'shell'],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            text=True, bufsize=1
+        )
+        self._lines = queue.Queue()
+        reader = threading.Thread(
+            target=self._read_loop, args=(self.process.stdout, self._lines)
+        )
+        reader.daemon = True
+        reader.start()
+
+    @staticmethod
+    def _read_loop(stream, lines: queue.Queue):
+        """Forward stdout lines to the queue; None marks end of stream."""
+        try:
+            for line in stream:
+                lines.put(line)
+        except (OSError, ValueError):
+            pass
+        finally:
+            # Closed here: closing it from another thread blocks on the read
+            stream.close()
+        lines.put(None)
+
+    def is_alive(self) -> bool:
+        """Return True if the shell process is running."""
+        return self.process is not None and self.process.poll() is None
+
+    def _exchange(self, command_line: str, timeout: Optional[float]) -> subprocess.CompletedProcess:
+        """Send one command and collect output up to the sentinel line."""
+        self.process.stdin.write(
+            f"{{ {command_line}; }} </dev/null 2>&1; printf '\\n%s %d\\n' {self.sentinel} \"$?\"\n"
+        )
+        self.process.stdin.flush()
+
+        output = []
+        while True:
+            line = self._lines.get(timeout=timeout)
+            if line is None:
+                raise EOFError("adb shell session closed")
+            if line.startswith(self.sentinel):
+                returncode = int(line.split()[-1])
+                break
+            output.append(line)
+
+        # Drop the newline emitted ahead of the sentinel
+        stdout = ''.join(output)
+        if stdout.endswith('\n'):
+            stdout = stdout[:-1]
+
+        return subprocess.CompletedProcess(
+            command_line, returncode,
+            stdout=stdout if returncode == 0 else '',
+            stderr='' if returncode == 0 else stdout
+        )
+
+    def run(self, args: List[str], timeout: Optional[float] = None) -> subprocess.CompletedProcess:
+        """Run a command in the session, respawning once if the shell has died."""
+        # Each argument is quoted so text such as "don't" cannot leave the
+        # session's shell waiting for a closing quote
+        command_line = quote_args(args)
+        timeout = self.timeout if timeout is None else timeout
+
+        with self._lock:
+            for attempt in range(2):
+                if not self.is_alive():
+                    self._spawn()
+                try:
+                    return self._exchange(command_line, timeout)
+                except queue.Empty:
+                    # A hung command leaves the stream out of sync; the next
+                    # command respawns the session
+                    self._kill()
+                    raise subprocess.TimeoutExpired(command_line, timeout)
+                except EOFError:
+                    # The command may already have run, so don't replay it
+                    self._kill()
+                    raise
+                except OSError:
+                    # Stale shell found while writing; respawn and retry once
+                    self._kill()
+                    if attempt == 1:
+                        raise
+
+    def _kill(self):
+        """Terminate the shell process if it is still running."""
+        if self.process is None:
+            return
+        try:
+            self.process.kill()
+            self.process.wait(timeout=5)
+        except Exception:
+            pass
+        # stdout is closed by the reader thread once the stream ends
+        try:
+            self.process.stdin.close()
+        except Exception:
+            pass
+        self.process = None
+
+    def close(self):
+        """Close the session."""
+        with self._lock:
+            self._kill()
+
+
+class ShellSessionTransport(SubprocessTransport):
+    """Persistent transport: routes shell commands through one session per device.
+
+    Binary transfers (`exec_out`, `pull`) and device listing still use the
+    one-shot adb binary.
+    """
+
+    def __init__(self, adb_path: str = "adb"):
+        super().__init__(adb_path)
+        self.sessions: Dict[str, ShellSession] = {}
+        self._lock = threading.Lock()
+
+    def _session(self, serial: str) -> ShellSession:
+        """Get or create the shell session for a device."""
+        with self._lock:
+            session = self.sessions.get(serial)
+            if session is None:
+                session = ShellSession(serial, self.adb_path)
+                self.sessions[serial] = session
+            return session
+
+    def shell(self, serial: str, args: List[str], timeout: Optional[float] = None) -> subprocess.CompletedProcess:
+        """Run a shell command on the device and return the completed process."""
+        return self._session(serial).run(args, timeout=timeout)
+
+    def close(self):
+        """Close all device sessions."""
+        with self._lock:
+            sessions = list(self.sessions.values())
+            self.sessions.clear()
+        for session in sessions:
+            session.close()
+
+
+class AdbSocketTransport:
+    """Native transport speaking the adb host protocol to the adb server.
+
+    Every request opens a local TCP connection to the server instead of
+    forking the adb binary. Sync connections are kept open per device and
+    reused across file pulls.
+    """
+
+    RC_MARKER = "__GAB_RC__"
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 5037, timeout: float = 10.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.sync_sockets: Dict[str, socket.socket] = {}
+        self._sync_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def _connect(self, timeout: Optional[float] = None) -> socket.socket:
+        """Open a connection to the adb server."""
+        sock = socket.create_connection((self.host, self.port), timeout=timeout or self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    @staticmethod
+    def _recv_exact(sock: socket.socket, size: int) -> bytes:
+        """Read exactly size bytes or raise if the server hangs up."""
+        data = bytearray()
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            if not chunk:
+                raise AdbError("adb server closed the connection")
+            data += chunk
+        return bytes(data)
+
+    @staticmethod
+    def _recv_all(sock: socket.socket) -> bytes:
+        """Read until the server closes the stream."""
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                return b''.join(chunks)
+            chunks.append(chunk)
+
+    def _recv_length_prefixed(self, sock: socket.socket) -> bytes:
+        """Read a 4-hex-digit length followed by that many bytes."""
+        length = int(self._recv_exact(sock, 4), 16)
+        return self._recv_exact(sock, length)
+
+    def _request(self, sock: socket.socket, service: str):
+        """Send a service request and wait for OKAY."""
+        payload = service.encode('utf-8')
+        sock.sendall(b'%04x' % len(payload) + payload)
+        status = self._recv_exact(sock, 4)
+        if status == b'FAIL':
+            raise AdbError(self._recv_length_prefixed(sock).decode('utf-8', 'replace'))
+        if status != b'OKAY':
+            raise AdbError(f"Unexpected adb response: {status!r}")
+
+    def _open(self, serial: str, service: str, timeout: Optional[float] = None) -> socket.socket:
+        """Open a device service stream (`shell:`, `exec:`, `sync:`)."""
+        sock = self._connect(timeout)
+        try:
+            self._request(sock, f"host:transport:{serial}")
+            self._request(sock, service)
+        except Exception:
+            sock.close()
+            raise
+        return sock
+
+    def query(self, service: str) -> str:
+        """Run a host service that replies with a length-prefixed payload."""
+        with self._connect() as sock:
+            self._request(sock, service)
+            return self._recv_length_prefixed(sock).decode('utf-8', 'replace')
+
+    def devices(self) -> List[Dict]:
+        """List attached devices as {"id", "status"} dicts."""
+        return parse_device_list(self.query("host:devices").split('\n'))
+
+    def track_devices(self) -> Iterator[List[Dict]]:
+        """Yield the full device list each time it changes (`host:track-devices`)."""
+        sock = self._connect()
+        try:
+            self._request(sock, "host:track-devices")
+            # Updates arrive whenever devices change, so block indefinitely
+            sock.settimeout(None)
+            while True:
+                payload = self._recv_length_prefixed(sock)
+                yield parse_device_list(payload.decode('utf-8', 'replace').split('\n'))
+        finally:
+            sock.close()
+
+    def shell(self, serial: str, args: List[str], timeout: Optional[float] = None) -> subprocess.CompletedProcess:
+        """Run a shell command on the device and return the completed process."""
+        command_line = quote_args(args)
+        # The legacy shell: service does not report exit codes, so echo one
+        service = f"shell:{command_line}; printf '\\n%s %d\\n' {self.RC_MARKER} \"$?\""
+
+        try:
+            with self._open(serial, service, timeout) as sock:
+                output = self._recv_all(sock).decode('utf-8', 'replace')
+        except socket.timeout:
+            raise subprocess.TimeoutExpired(command_line, timeout)
+
+        return self._shell_result(command_line, output)
+
+    @classmethod
+    def _shell_result(cls, command_line: str, output: str) -> subprocess.CompletedProcess:
+        """Split the exit status marker off `shell:` output.
+
+        Output that ends without the marker means the stream was cut short
+        (device gone, adbd restarted), so it is reported as a failure.
+        """
+        marker = output.rfind(f"\n{cls.RC_MARKER} ")
+        if marker == -1:
+            returncode = SHELL_INCOMPLETE_RETURNCODE
+            output += "\nadb: shell output ended before the exit status was reported"
+        else:
+            returncode = int(output[marker:].split()[1])
+            output = output[:marker]
+
+        return subprocess.CompletedProcess(
+            command_line, returncode,
+            stdout=output if returncode == 0 else '',
+            stderr='' if returncode == 0 else output
+        )
+
+    def exec_out(self, serial: str, args: List[str], timeout: Optional[float] = None) -> bytes:
+        """Run a command with a raw binary stdout (`exec:` service)."""
+        command_line = quote_args(args)
+        try:
+            with self._open(serial, f"exec:{command_line}", timeout) as sock:
+                return self._recv_all(sock)
+        except socket.timeout:
+            raise subprocess.TimeoutExpired(command_line, timeout)
+
+    def pull(self, serial: str, remote_path: str) -> bytes:
+        """Read a file from the device over a reused sync connection."""
+        with self._lock:
+            lock = self._sync_locks.setdefault(serial, threading.Lock())
+
+        with lock:
+            for attempt in range(2):
+                sock = self.sync_sockets.get(serial)
+                if sock is None:
+                    sock = self._open(serial, "sync:")
+                    self.sync_sockets[serial] = sock
+                try:
+                    return self._sync_recv(sock, remote_path)
+                except (AdbError, OSError) as e:
+                    # The stream may be mid-transfer, so never reuse it
+                    self.sync_sockets.pop(serial, None)
+                    sock.close()
+                    # A stale cached connection is retried once; adb errors are not
+                    if isinstance(e, AdbError) or attempt == 1:
+                        raise
+
+    def _sync_recv(self, sock: socket.socket, remote_path: str) -> bytes:
+        """Issue a sync RECV and collect the DATA chunks until DONE."""
+        path = remote_path.encode('utf-8')
+        sock.sendall(b'RECV' + struct.pack('<I', len(path)) + path)
+
+        chunks = []
+        while True:
+            header = self._recv_exact(sock, 8)
+            tag, length = header[:4], struct.unpack('<I', header[4:])[0]
+            if tag == b'DATA':
+                chunks.append(self._recv_exact(sock, length))
+            elif tag == b'DONE':
+                return b''.join(chunks)
+            elif tag == b'FAIL':
+                raise AdbError(self._recv_exact(sock, length).decode('utf-8', 'replace'))
+            else:
+                raise OSError(f"Unexpected sync response: {tag!r}")
+
+    def close(self):
+        """Close cached sync connections."""
+        with self._lock:
+            sockets = list(self.sync_sockets.values())
+            self.sync_sockets.clear()
+        for sock in sockets:
+            try:
+                sock.sendall(b'QUIT' + struct.pack('<I', 0))
+            except OSError:
+                pass
+            sock.close()
+
+
+class AsyncAdbSocketTransport:
+    """asyncio variant of AdbSocketTransport for the ASGI server.
+
+    Each request is a short-lived connection to the adb server on the event
+    loop, so any number of requests can be in flight without a thread or a
+    process each.
+    """
+
+    RC_MARKER = AdbSocketTransport.RC_MARKER
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 5037, timeout: float = 10.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+    @staticmethod
+    async def _read_exact(reader: asyncio.StreamReader, size: int) -> bytes:
+        """Read exactly size bytes or raise if the server hangs up."""
+        try:
+            return await reader.readexactly(size)
+        except asyncio.IncompleteReadError:
+            raise AdbError("adb server closed the connection")
+
+    async def _read_length_prefixed(self, reader: asyncio.StreamReader) -> bytes:
+        """Read a 4-hex-digit length followed by that many bytes."""
+        length = int(await self._read_exact(reader, 4), 16)
+        return await self._read_exact(reader, length)
+
+    async def _request(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, service: str):
+        """Send a service request and wait for OKAY."""
+        payload = service.encode('utf-8')
+        writer.write(b'%04x' % len(payload) + payload)
+        await writer.drain()
+        status = await self._read_exact(reader, 4)
+        if status == b'FAIL':
+            raise AdbError((await self._read_length_prefixed(reader)).decode('utf-8', 'replace'))
+        if status != b'OKAY':
+            raise AdbError(f"Unexpected adb response: {status!r}")
+
+    async def _open(self, serial: Optional[str], service: str) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        """Connect to the server and open a host service, or a device service if serial is given."""
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.timeout)
+        try:
+            if serial is not None:
+                await self._request(reader, writer, f"host:transport:{serial}")
+            await self._request(reader, writer, service)
+        except BaseException:
+            writer.close()
+            raise
+        return reader, writer
+
+    async def _run(self, serial: str, service: str, timeout: Optional[float]) -> bytes:
+        """Open a device service and read its output until the stream closes."""
+        async def run() -> bytes:
+            reader, writer = await self._open(serial, service)
+            try:
+                return await reader.read()
+            finally:
+                writer.close()
+
+        return await asyncio.wait_for(run(), timeout or self.timeout)
+
+    async def devices(self) -> List[Dict]:
+        """List attached devices as {"id", "status"} dicts."""
+        reader, writer = await self._open(None, "host:devices")
+        try:
+            payload = await self._read_length_prefixed(reader)
+        finally:
+            writer.close()
+        return parse_device_list(payload.decode('utf-8', 'replace').split('\n'))
+
+    async def track_devices(self) -> AsyncIterator[List[Dict]]:
+        """Yield the full device list each time it changes (`host:track-devices`)."""
+        reader, writer = await self._open(None, "host:track-devices")
+        try:
+            while True:
+                payload = await self._read_length_prefixed(reader)
+                yield parse_device_list(payload.decode('utf-8', 'replace').split('\n'))
+        finally:
+            writer.close()
+
+    async def shell(self, serial: str, args: List[str], timeout: Optional[float] = None) -> subprocess.CompletedProcess:
+        """Run a shell command on the device and return the completed process."""
+        command_line = quote_args(args)
+        service = f"shell:{command_line}; printf '\\n%s %d\\n' {self.RC_MARKER} \"$?\""
+        try:
+            output = (await self._run(serial, service, timeout)).decode('utf-8', 'replace')
+        except asyncio.TimeoutError:
+            raise subprocess.TimeoutExpired(command_line, timeout or self.timeout)
+
+        return AdbSocketTransport._shell_result(command_line, output)
+
+    async def exec_out(self, serial: str, args: List[str], timeout: Optional[float] = None) -> bytes:
+        """Run a command with a raw binary stdout (`exec:` service)."""
+        command_line = quote_args(args)
+        try:
+            return await self._run(serial, f"exec:{command_line}", timeout)
+        except asyncio.TimeoutError:
+            raise subprocess.TimeoutExpired(command_line, timeout or self.timeout)
+
+    async def close(self):
+        """Nothing is kept open between requests."""
+        pass
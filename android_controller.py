@@ -1,56 +1,260 @@
-import subprocess
+import asyncio
 import time
 import base64
+import html
 import io
+import re
+import threading
 from PIL import Image
 # import cv2
 import numpy as np
-from typing import Dict, List, Optional, Tuple
+from typing import Callable, Dict, List, Mapping, Optional, Tuple
+from adb_transport import AdbError, AsyncAdbSocketTransport, ShellSessionTransport
+from action_registry import ACTION_SPECS, SCREEN_CHANGING_ACTIONS
+from imaging import decode_raw_screencap, encode_frame
+
+# Consecutive undecodable raw captures before switching to PNG for good; a
+# single short read (e.g. during rotation) only falls back for that frame
+RAW_CAPTURE_FAILURE_LIMIT = 3
+
+# "mCurrentFocus=Window{1a2b u0 com.android.settings/.Settings}" -> package, activity
+FOCUSED_WINDOW_PATTERN = re.compile(r"mCurrentFocus=Window\{\S+ \S+ ([\w.]+)/([\w.$]+)\}")
+
+# text="..." and content-desc="..." attributes of a uiautomator dump
+UI_TEXT_PATTERN = re.compile(r'(?:text|content-desc)="([^"]*)"')
+
+# Actions that change what is on screen and so invalidate cached frames
+INPUT_ACTIONS = SCREEN_CHANGING_ACTIONS
+
+def escape_input_text(text: str) -> str:
+    """Encode text for `input text`; the transport quotes it for the shell."""
+    return text.replace(' ', '%s')
+
+def scroll_gesture(direction: str, screen_size: Tuple[int, int]) -> Optional[Tuple[int, int, int, int]]:
+    """Swipe (start_x, start_y, end_x, end_y) that scrolls the content, or None for a bad direction."""
+    width, height = screen_size
+    center_x = width // 2
+    center_y = height // 2
+    
+    # Define scroll distances (about 1/3 of screen)
+    half = min(width, height) // 3 // 2
+    
+    # The finger moves against the scroll direction
+    return {
+        "down": (center_x, center_y + half, center_x, center_y - half),
+        "up": (center_x, center_y - half, center_x, center_y + half),
+        "left": (center_x + half, center_y, center_x - half, center_y),
+        "right": (center_x - half, center_y, center_x + half, center_y),
+    }.get(direction)
+
+# Binary screenshot formats: query value -> (Pillow format, content type)
+IMAGE_FORMATS = {
+    "png": ("PNG", "image/png"),
+    "jpeg": ("JPEG", "image/jpeg"),
+    "jpg": ("JPEG", "image/jpeg"),
+    "webp": ("WEBP", "image/webp"),
+}
+
+def _int_arg(args: Mapping[str, str], name: str, default: Optional[int]) -> Optional[int]:
+    """An integer query parameter; missing or malformed values give the default."""
+    try:
+        return int(args[name])
+    except (KeyError, ValueError):
+        return default
+
+def parse_image_options(args: Mapping[str, str]) -> dict:
+    """Parse format/width/quality/crop query parameters for binary screenshots."""
+    image_format = args.get('format', 'jpeg').lower()
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError(f"Unsupported format '{image_format}'. Use one of: png, jpeg, webp")
+    
+    max_width = _int_arg(args, 'width', None)
+    if max_width is not None and max_width <= 0:
+        raise ValueError("width must be a positive integer")
+    
+    quality = _int_arg(args, 'quality', 80)
+    if not 1 <= quality <= 100:
+        raise ValueError("quality must be between 1 and 100")
+    
+    crop = None
+    if args.get('crop'):
+        try:
+            crop = tuple(int(value) for value in args['crop'].split(','))
+        except ValueError:
+            crop = ()
+        if len(crop) != 4 or crop[2] <= 0 or crop[3] <= 0:
+            raise ValueError("crop must be x,y,width,height with positive width and height")
+    
+    return {"format": image_format, "max_width": max_width, "quality": quality, "crop": crop}
+
+class _CaptureFlight:
+    """An in-flight capture that concurrent callers can wait on."""
+    
+    def __init__(self, generation: int):
+        self.generation = generation
+        self.done = threading.Event()
+        self.frame = None
+        self.error = None
+
+class FrameCache:
+    """
+    Per-device frame cache with a freshness window and single-flight captures.
+    
+    Callers arriving while a capture is running wait for it instead of
+    starting their own. invalidate() bumps a generation counter so captures
+    that started before an input action never repopulate the cache.
+    """
+    
+    def __init__(self, ttl: float = 0.5):
+        self.ttl = ttl
+        self.frames: Dict[str, Tuple[float, np.ndarray]] = {}
+        self.generations: Dict[str, int] = {}
+        self.flights: Dict[str, _CaptureFlight] = {}
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "invalidations": 0}
+        self._lock = threading.Lock()
+    
+    def get(self, device_id: str, capture: Callable[[], np.ndarray],
+            max_age: Optional[float] = None) -> np.ndarray:
+        """Return a frame no older than max_age (default ttl), capturing if needed."""
+        max_age = self.ttl if max_age is None else max_age
+        
+        with self._lock:
+            generation = self.generations.get(device_id, 0)
+            cached = self.frames.get(device_id)
+            if cached and time.monotonic() - cached[0] <= max_age:
+                self.stats["hits"] += 1
+                return cached[1]
+            
+            flight = self.flights.get(device_id)
+            if flight is not None and flight.generation == generation:
+                self.stats["coalesced"] += 1
+                leader = False
+            else:
+                flight = _CaptureFlight(generation)
+                self.flights[device_id] = flight
+                self.stats["misses"] += 1
+                leader = True
+        
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.frame
+        
+        # Stamp with the start time: the frame is at least this old
+        started = time.monotonic()
+        try:
+            flight.frame = capture()
+            return flight.frame
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                if self.flights.get(device_id) is flight:
+                    del self.flights[device_id]
+                if flight.error is None and self.generations.get(device_id, 0) == flight.generation:
+                    self.frames[device_id] = (started, flight.frame)
+            flight.done.set()
+    
+    def invalidate(self, device_id: str):
+        """Drop the cached frame and orphan any capture already in flight."""
+        with self._lock:
+            self.frames.pop(device_id, None)
+            self.generations[device_id] = self.generations.get(device_id, 0) + 1
+            self.stats["invalidations"] += 1
+    
+    def get_stats(self) -> Dict:
+        """Get hit/miss/coalesce/invalidation counters."""
+        with self._lock:
+            return dict(self.stats, ttl=self.ttl)
 
 class AndroidController:
-    def __init__(self):
-        """Initialize the Android controller."""
-        self.device_id = None
+    def __init__(self, transport=None, capture_mode: str = "raw", frame_cache_ttl: float = 0.5,
+                 registry=None, device_id: Optional[str] = None,
+                 frame_cache: Optional[FrameCache] = None):
+        """
+        Initialize the Android controller.
+        
+        Args:
+            transport: Transport used for device I/O. Defaults to a persistent
+                per-device shell session; pass SubprocessTransport() to fork
+                one adb process per command, or AdbSocketTransport() to talk
+                to the adb server directly.
+            capture_mode: "raw" streams the framebuffer over exec-out and encodes
+                on the host; "png" has the device write a PNG to /sdcard.
+            frame_cache_ttl: Seconds a captured frame may be reused by later
+                screenshot requests. Input actions invalidate it immediately.
+            registry: Optional DeviceRegistry; when given, connection checks read
+                its live device list instead of running `adb devices`.
+            device_id: Pin the controller to this serial instead of using the
+                first authorized device.
+            frame_cache: Share a FrameCache with other controllers so input on
+                one invalidates frames served by another (frame_cache_ttl is
+                ignored when given).
+        """
+        self.device_id = device_id
+        self.pinned_device = device_id
         self.screen_size = None
+        self.transport = transport or ShellSessionTransport()
+        self.capture_mode = capture_mode
+        self.raw_capture_failures = 0
+        self.frame_cache = frame_cache or FrameCache(frame_cache_ttl)
+        self.registry = registry
+        if registry is not None:
+            registry.add_listener(self._on_device_change)
+        
+    def _on_device_change(self, serial: str, old_state: Optional[str], new_state: Optional[str]):
+        """Forget the current device when it is detached or loses authorization."""
+        if serial == self.device_id and new_state != "device":
+            self.device_id = None
+            self.screen_size = None
+            self.frame_cache.invalidate(serial)
+    
+    def _list_devices(self) -> List[Dict]:
+        """List devices from the registry when it is live, else ask adb."""
+        if self.registry is not None:
+            self.registry.start()
+            # Give a fresh stream a moment to sync, but don't stall on a broken one
+            timeout = 0 if self.registry.last_error else 2.0
+            if self.registry.wait_synced(timeout=timeout):
+                return self.registry.get_devices()
+        return self.transport.devices()
         
     def check_adb_connection(self) -> Dict:
         """Check if ADB is available and devices are connected."""
         try:
-            result = subprocess.run(['adb', 'devices'], capture_output=True, text=True)
-            if result.returncode != 0:
-                return {"error": "ADB not found. Please install Android SDK Platform Tools."}
-            
-            lines = result.stdout.strip().split('\n')[1:]  # Skip header
-            devices = []
-            
-            for line in lines:
-                if line.strip() and '\t' in line:
-                    device_id, status = line.split('\t')
-                    devices.append({"id": device_id, "status": status})
+            devices = self._list_devices()
             
             if not devices:
                 return {"error": "No devices connected. Please connect an Android device with USB debugging enabled."}
             
-            # Use the first available device
+            # Use the pinned device, or else the first available one
             for device in devices:
-                if device["status"] == "device":
-                    self.device_id = device["id"]
-                    self._get_screen_size()
+                if device["status"] == "device" and self.pinned_device in (None, device["id"]):
+                    # Screen size only needs fetching when the device changes
+                    if device["id"] != self.device_id or self.screen_size is None:
+                        self.device_id = device["id"]
+                        self._get_screen_size()
                     return {"success": True, "device_id": self.device_id, "devices": devices}
             
+            if self.pinned_device:
+                return {"error": f"Device {self.pinned_device} is not connected or not authorized."}
             return {"error": "No authorized devices found. Please check USB debugging authorization."}
             
         except FileNotFoundError:
             return {"error": "ADB not found. Please install Android SDK Platform Tools."}
+        except ConnectionRefusedError:
+            return {"error": "ADB server not running. Start it with 'adb start-server'."}
+        except AdbError as e:
+            return {"error": str(e)}
         except Exception as e:
             return {"error": f"Error checking ADB connection: {str(e)}"}
     
     def _get_screen_size(self):
         """Get the screen size of the connected device."""
         try:
-            result = subprocess.run([
-                'adb', '-s', self.device_id, 'shell', 'wm', 'size'
-            ], capture_output=True, text=True)
+            result = self.transport.shell(self.device_id, ['wm', 'size'])
             
             if result.returncode == 0:
                 # Parse output like "Physical size: 1080x1920"
@@ -74,48 +278,109 @@ class AndroidController:
         action = command.get("action")
         
         try:
-            if action == "screenshot":
-                return self._take_screenshot()
-            elif action == "tap":
-                return self._tap(command["x"], command["y"])
-            elif action == "swipe":
-                return self._swipe(command["start_x"], command["start_y"], 
-                                 command["end_x"], command["end_y"])
-            elif action == "type":
-                return self._type_text(command["text"])
-            elif action == "key":
-                return self._press_key(command["keycode"])
-            elif action == "app":
-                return self._open_app(command["package"])
-            elif action == "scroll":
-                return self._scroll(command["direction"])
-            else:
+            dispatch = ACTION_DISPATCH.get(action)
+            if dispatch is None:
                 return {"error": f"Unknown action: {action}"}
+            
+            handler, args = dispatch
+            return handler(self, *[command[arg] for arg in args])
                 
         except Exception as e:
             return {"error": f"Error executing command: {str(e)}"}
+        finally:
+            if action in INPUT_ACTIONS:
+                self.frame_cache.invalidate(self.device_id)
+    
+    def execute_plan(self, commands: List[Dict]) -> Dict:
+        """
+        Execute parsed commands in order, stopping at the first failure.
+        
+        Returns the overall outcome and one entry per step; steps after a
+        failure are reported as skipped.
+        """
+        steps = []
+        failed = False
+        for index, command in enumerate(commands, 1):
+            if failed:
+                steps.append({"step": index, "command": command, "skipped": True})
+                continue
+            result = self.execute_command(dict(command))
+            steps.append({"step": index, "command": command, "result": result})
+            failed = "error" in result
+        
+        completed = sum(1 for step in steps if "result" in step and "error" not in step["result"])
+        return {
+            "success": not failed,
+            "message": f"Executed {completed}/{len(commands)} steps",
+            "steps": steps
+        }
+    
+    def _capture_raw(self) -> Optional[np.ndarray]:
+        """Capture the raw framebuffer in one exec-out roundtrip, or None if unsupported."""
+        try:
+            data = self.transport.exec_out(self.device_id, ['screencap'])
+            frame = decode_raw_screencap(data)
+        except ValueError as e:
+            # Unknown pixel format or short read; use the device encoder
+            self.raw_capture_failures += 1
+            if self.raw_capture_failures >= RAW_CAPTURE_FAILURE_LIMIT:
+                print(f"Raw capture unavailable, switching to PNG: {e}")
+                self.capture_mode = "png"
+            else:
+                print(f"Raw capture failed, using PNG for this frame: {e}")
+            return None
+        self.raw_capture_failures = 0
+        return frame
+    
+    def _grab_frame(self) -> np.ndarray:
+        """Capture a fresh frame from the device, bypassing the cache."""
+        if self.capture_mode == "raw":
+            frame = self._capture_raw()
+            if frame is not None:
+                return frame
+        
+        png_data = self._capture_png_on_device()
+        if png_data is None:
+            raise AdbError("Failed to capture screenshot")
+        return np.asarray(Image.open(io.BytesIO(png_data)).convert('RGBA'))
+    
+    def capture_frame(self, max_age: Optional[float] = None) -> np.ndarray:
+        """
+        Capture the screen as a (height, width, 4) RGBA array.
+        
+        Args:
+            max_age: Reuse a cached frame up to this many seconds old (defaults
+                to the cache TTL; 0 forces a capture, still coalesced with one
+                already in flight)
+        """
+        return self.frame_cache.get(self.device_id, self._grab_frame, max_age)
+    
+    def _capture_png_on_device(self) -> Optional[bytes]:
+        """Have the device encode a PNG to /sdcard, pull it and clean up."""
+        # Take screenshot and save to device
+        result = self.transport.shell(self.device_id, ['screencap', '/sdcard/screenshot.png'])
+        if result.returncode != 0:
+            return None
+        
+        # Pull screenshot to local machine
+        png_data = self.transport.pull(self.device_id, '/sdcard/screenshot.png')
+        
+        # Clean up device storage
+        self.transport.shell(self.device_id, ['rm', '/sdcard/screenshot.png'])
+        return png_data
+    
+    def capture_png(self) -> bytes:
+        """Capture a PNG screenshot, reusing a fresh cached frame when possible."""
+        return encode_frame(self.capture_frame())
     
     def _take_screenshot(self) -> Dict:
         """Take a screenshot of the device."""
         try:
-            # Take screenshot and save to device
-            subprocess.run([
-                'adb', '-s', self.device_id, 'shell', 'screencap', '/sdcard/screenshot.png'
-            ], check=True)
-            
-            # Pull screenshot to local machine
-            result = subprocess.run([
-                'adb', '-s', self.device_id, 'exec-out', 'cat', '/sdcard/screenshot.png'
-            ], capture_output=True)
+            png_data = self.capture_png()
             
-            if result.returncode == 0:
+            if png_data:
                 # Convert to base64 for web display
-                screenshot_b64 = base64.b64encode(result.stdout).decode('utf-8')
-                
-                # Clean up device storage
-                subprocess.run([
-                    'adb', '-s', self.device_id, 'shell', 'rm', '/sdcard/screenshot.png'
-                ], capture_output=True)
+                screenshot_b64 = base64.b64encode(png_data).decode('utf-8')
                 
                 return {
                     "success": True,
@@ -131,9 +396,7 @@ class AndroidController:
     def _tap(self, x: int, y: int) -> Dict:
         """Tap at the specified coordinates."""
         try:
-            result = subprocess.run([
-                'adb', '-s', self.device_id, 'shell', 'input', 'tap', str(x), str(y)
-            ], capture_output=True, text=True)
+            result = self.transport.shell(self.device_id, ['input', 'tap', str(x), str(y)])
             
             if result.returncode == 0:
                 return {"success": True, "message": f"Tapped at ({x}, {y})"}
@@ -146,10 +409,10 @@ class AndroidController:
     def _swipe(self, start_x: int, start_y: int, end_x: int, end_y: int, duration: int = 300) -> Dict:
         """Swipe from start coordinates to end coordinates."""
         try:
-            result = subprocess.run([
-                'adb', '-s', self.device_id, 'shell', 'input', 'swipe',
+            result = self.transport.shell(self.device_id, [
+                'input', 'swipe',
                 str(start_x), str(start_y), str(end_x), str(end_y), str(duration)
-            ], capture_output=True, text=True)
+            ])
             
             if result.returncode == 0:
                 return {"success": True, "message": f"Swiped from ({start_x}, {start_y}) to ({end_x}, {end_y})"}
@@ -163,11 +426,7 @@ class AndroidController:
         """Type text on the device."""
         try:
             # Escape special characters for shell
-            escaped_text = text.replace(' ', '%s').replace('&', '\\&').replace('"', '\\"')
-            
-            result = subprocess.run([
-                'adb', '-s', self.device_id, 'shell', 'input', 'text', escaped_text
-            ], capture_output=True, text=True)
+            result = self.transport.shell(self.device_id, ['input', 'text', escape_input_text(text)])
             
             if result.returncode == 0:
                 return {"success": True, "message": f"Typed: {text}"}
@@ -180,9 +439,7 @@ class AndroidController:
     def _press_key(self, keycode: str) -> Dict:
         """Press a key on the device."""
         try:
-            result = subprocess.run([
-                'adb', '-s', self.device_id, 'shell', 'input', 'keyevent', f'KEYCODE_{keycode}'
-            ], capture_output=True, text=True)
+            result = self.transport.shell(self.device_id, ['input', 'keyevent', f'KEYCODE_{keycode}'])
             
             if result.returncode == 0:
                 return {"success": True, "message": f"Pressed {keycode} key"}
@@ -196,18 +453,15 @@ class AndroidController:
         """Open an app by package name."""
         try:
             # First try to start the main activity
-            result = subprocess.run([
-                'adb', '-s', self.device_id, 'shell', 'monkey', '-p', package_name, '1'
-            ], capture_output=True, text=True)
+            result = self.transport.shell(self.device_id, ['monkey', '-p', package_name, '1'])
             
             if result.returncode == 0:
                 return {"success": True, "message": f"Opened app: {package_name}"}
             else:
                 # Fallback: try to launch with am start
-                result2 = subprocess.run([
-                    'adb', '-s', self.device_id, 'shell', 'am', 'start', 
-                    '-n', f'{package_name}/.MainActivity'
-                ], capture_output=True, text=True)
+                result2 = self.transport.shell(self.device_id, [
+                    'am', 'start', '-n', f'{package_name}/.MainActivity'
+                ])
                 
                 if result2.returncode == 0:
                     return {"success": True, "message": f"Opened app: {package_name}"}
@@ -222,40 +476,20 @@ class AndroidController:
         if not self.screen_size:
             self.screen_size = (1080, 1920)  # Default fallback
         
-        width, height = self.screen_size
-        center_x = width // 2
-        center_y = height // 2
-        
-        # Define scroll distances (about 1/3 of screen)
-        scroll_distance = min(width, height) // 3
-        
         try:
-            if direction == "down":
-                # Swipe up to scroll down
-                start_y = center_y + scroll_distance // 2
-                end_y = center_y - scroll_distance // 2
-                return self._swipe(center_x, start_y, center_x, end_y)
-            elif direction == "up":
-                # Swipe down to scroll up
-                start_y = center_y - scroll_distance // 2
-                end_y = center_y + scroll_distance // 2
-                return self._swipe(center_x, start_y, center_x, end_y)
-            elif direction == "left":
-                # Swipe right to scroll left
-                start_x = center_x + scroll_distance // 2
-                end_x = center_x - scroll_distance // 2
-                return self._swipe(start_x, center_y, end_x, center_y)
-            elif direction == "right":
-                # Swipe left to scroll right
-                start_x = center_x - scroll_distance // 2
-                end_x = center_x + scroll_distance // 2
-                return self._swipe(start_x, center_y, end_x, center_y)
-            else:
+            gesture = scroll_gesture(direction, self.screen_size)
+            if gesture is None:
                 return {"error": f"Invalid scroll direction: {direction}"}
+            return self._swipe(*gesture)
                 
         except Exception as e:
             return {"error": f"Scroll failed: {str(e)}"}
     
+    def _wait(self, seconds: float) -> Dict:
+        """Pause, e.g. to let an app open between the steps of a plan."""
+        time.sleep(seconds)
+        return {"success": True, "message": f"Waited {seconds} seconds"}
+    
     def get_device_info(self) -> Dict:
         """Get information about the connected device."""
         if not self.device_id:
@@ -263,19 +497,13 @@ class AndroidController:
         
         try:
             # Get device model
-            model_result = subprocess.run([
-                'adb', '-s', self.device_id, 'shell', 'getprop', 'ro.product.model'
-            ], capture_output=True, text=True)
+            model_result = self.transport.shell(self.device_id, ['getprop', 'ro.product.model'])
             
             # Get Android version
-            version_result = subprocess.run([
-                'adb', '-s', self.device_id, 'shell', 'getprop', 'ro.build.version.release'
-            ], capture_output=True, text=True)
+            version_result = self.transport.shell(self.device_id, ['getprop', 'ro.build.version.release'])
             
             # Get API level
-            api_result = subprocess.run([
-                'adb', '-s', self.device_id, 'shell', 'getprop', 'ro.build.version.sdk'
-            ], capture_output=True, text=True)
+            api_result = self.transport.shell(self.device_id, ['getprop', 'ro.build.version.sdk'])
             
             return {
                 "device_id": self.device_id,
@@ -291,9 +519,7 @@ class AndroidController:
     def list_installed_apps(self) -> Dict:
         """Get a list of installed apps on the device."""
         try:
-            result = subprocess.run([
-                'adb', '-s', self.device_id, 'shell', 'pm', 'list', 'packages'
-            ], capture_output=True, text=True)
+            result = self.transport.shell(self.device_id, ['pm', 'list', 'packages'])
             
             if result.returncode == 0:
                 packages = []
@@ -307,4 +533,302 @@ class AndroidController:
                 return {"error": "Could not list packages"}
                 
         except Exception as e:
-            return {"error": f"Package listing failed: {str(e)}"} 
\ No newline at end of file
+            return {"error": f"Package listing failed: {str(e)}"} 
+    
+    def get_foreground_app(self) -> Dict:
+        """Get the package and activity of the focused window."""
+        try:
+            # Arguments are quoted by the transport, so filter here rather than with a pipe
+            result = self.transport.shell(self.device_id, ['dumpsys', 'window'])
+            match = FOCUSED_WINDOW_PATTERN.search(result.stdout)
+            if match is None:
+                return {"error": "Could not determine the foreground app"}
+            return {"success": True, "package": match.group(1), "activity": match.group(2)}
+        except Exception as e:
+            return {"error": f"Foreground app lookup failed: {str(e)}"}
+    
+    def get_screen_text(self) -> Dict:
+        """Get the text and content descriptions of the views on screen (uiautomator dump)."""
+        try:
+            dump = self.transport.exec_out(self.device_id, ['uiautomator', 'dump', '/dev/tty'])
+            texts = [html.unescape(value) for value in UI_TEXT_PATTERN.findall(dump.decode('utf-8', 'replace'))
+                     if value]
+            return {"success": True, "texts": texts}
+        except Exception as e:
+            return {"error": f"UI dump failed: {str(e)}"}
+    
+    def close(self, release_transport: bool = True):
+        """
+        Detach from the registry and release persistent ADB sessions.
+        
+        Args:
+            release_transport: Set False when the transport is shared with
+                other controllers that are still in use.
+        """
+        if self.registry is not None:
+            self.registry.remove_listener(self._on_device_change)
+        if release_transport:
+            self.transport.close()
+
+
+class AsyncAndroidController:
+    """
+    asyncio counterpart of AndroidController for the ASGI server.
+    
+    Device I/O goes through AsyncAdbSocketTransport on the event loop and
+    CPU-bound work (PNG decoding and encoding) runs in the default executor.
+    Commands for the device run one at a time, like the per-device worker
+    queue; concurrent frame requests share a single capture.
+    """
+    
+    def __init__(self, transport: Optional[AsyncAdbSocketTransport] = None,
+                 device_id: Optional[str] = None, frame_cache_ttl: float = 0.5):
+        """
+        Args:
+            transport: Async adb transport (defaults to the local adb server)
+            device_id: Pin the controller to this serial
+            frame_cache_ttl: Seconds a captured frame may be reused
+        """
+        self.device_id = device_id
+        self.pinned_device = device_id
+        self.screen_size = None
+        self.transport = transport or AsyncAdbSocketTransport()
+        self.frame_cache_ttl = frame_cache_ttl
+        self.capture_mode = "raw"
+        self.raw_capture_failures = 0
+        self._frame: Optional[Tuple[float, np.ndarray]] = None
+        self._capture: Optional[asyncio.Task] = None
+        self._generation = 0
+        self._command_lock = asyncio.Lock()
+    
+    async def check_adb_connection(self) -> Dict:
+        """Check if ADB is available and devices are connected."""
+        try:
+            devices = await self.transport.devices()
+            
+            if not devices:
+                return {"error": "No devices connected. Please connect an Android device with USB debugging enabled."}
+            
+            for device in devices:
+                if device["status"] == "device" and self.pinned_device in (None, device["id"]):
+                    if device["id"] != self.device_id or self.screen_size is None:
+                        self.device_id = device["id"]
+                        self.invalidate()
+                        await self._get_screen_size()
+                    return {"success": True, "device_id": self.device_id, "devices": devices}
+            
+            if self.pinned_device:
+                return {"error": f"Device {self.pinned_device} is not connected or not authorized."}
+            return {"error": "No authorized devices found. Please check USB debugging authorization."}
+            
+        except (ConnectionRefusedError, OSError):
+            return {"error": "ADB server not running. Start it with 'adb start-server'."}
+        except AdbError as e:
+            return {"error": str(e)}
+        except Exception as e:
+            return {"error": f"Error checking ADB connection: {str(e)}"}
+    
+    async def _get_screen_size(self):
+        """Get the screen size of the connected device."""
+        try:
+            result = await self.transport.shell(self.device_id, ['wm', 'size'])
+            size_line = result.stdout.strip()
+            if result.returncode == 0 and 'x' in size_line:
+                width, height = map(int, size_line.split(':')[-1].strip().split('x'))
+                self.screen_size = (width, height)
+        except Exception as e:
+            print(f"Could not get screen size: {e}")
+            self.screen_size = (1080, 1920)  # Default fallback
+    
+    def invalidate(self):
+        """Drop the cached frame; a capture already in flight is not reused."""
+        self._frame = None
+        self._capture = None
+        self._generation += 1
+    
+    async def capture_frame(self, max_age: Optional[float] = None) -> np.ndarray:
+        """Capture the screen as a (height, width, 4) RGBA array, sharing concurrent captures."""
+        max_age = self.frame_cache_ttl if max_age is None else max_age
+        if self._frame is not None and time.monotonic() - self._frame[0] <= max_age:
+            return self._frame[1]
+        
+        if self._capture is None:
+            self._capture = asyncio.ensure_future(self._grab_frame(self._generation))
+        capture = self._capture
+        try:
+            # Shielded so one cancelled viewer does not cancel the shared capture
+            return await asyncio.shield(capture)
+        finally:
+            if self._capture is capture and capture.done():
+                self._capture = None
+    
+    async def _grab_frame(self, generation: int) -> np.ndarray:
+        """Capture a fresh frame and cache it unless input happened meanwhile."""
+        if not self.device_id:
+            connection_result = await self.check_adb_connection()
+            if "error" in connection_result:
+                raise AdbError(connection_result["error"])
+        
+        frame = None
+        if self.capture_mode == "raw":
+            try:
+                frame = decode_raw_screencap(await self.transport.exec_out(self.device_id, ['screencap']))
+                self.raw_capture_failures = 0
+            except ValueError as e:
+                self.raw_capture_failures += 1
+                if self.raw_capture_failures >= RAW_CAPTURE_FAILURE_LIMIT:
+                    print(f"Raw capture unavailable, switching to PNG: {e}")
+                    self.capture_mode = "png"
+                else:
+                    print(f"Raw capture failed, using PNG for this frame: {e}")
+        if frame is None:
+            png_data = await self.transport.exec_out(self.device_id, ['screencap', '-p'])
+            frame = await asyncio.get_running_loop().run_in_executor(
+                None, lambda: np.asarray(Image.open(io.BytesIO(png_data)).convert('RGBA')))
+        
+        if generation == self._generation:
+            self._frame = (time.monotonic(), frame)
+        return frame
+    
+    async def capture_png(self) -> bytes:
+        """Capture a PNG screenshot, reusing a fresh cached frame when possible."""
+        frame = await self.capture_frame()
+        return await asyncio.get_running_loop().run_in_executor(None, encode_frame, frame)
+    
+    async def execute_command(self, command: Dict) -> Dict:
+        """Execute a parsed command on the Android device."""
+        async with self._command_lock:
+            return await self._execute(command)
+    
+    async def execute_plan(self, commands: List[Dict]) -> Dict:
+        """Execute parsed commands in order, stopping at the first failure (see AndroidController)."""
+        steps = []
+        failed = False
+        # Held for the whole plan so other commands cannot interleave
+        async with self._command_lock:
+            for index, command in enumerate(commands, 1):
+                if failed:
+                    steps.append({"step": index, "command": command, "skipped": True})
+                    continue
+                result = await self._execute(dict(command))
+                steps.append({"step": index, "command": command, "result": result})
+                failed = "error" in result
+        
+        completed = sum(1 for step in steps if "result" in step and "error" not in step["result"])
+        return {
+            "success": not failed,
+            "message": f"Executed {completed}/{len(commands)} steps",
+            "steps": steps
+        }
+    
+    async def get_device_info(self) -> Dict:
+        """Get information about the connected device."""
+        if not self.device_id:
+            return {"error": "No device connected"}
+        
+        try:
+            # Each shell is its own adb connection, so the properties are read concurrently
+            model_result, version_result, api_result = await asyncio.gather(*(
+                self.transport.shell(self.device_id, ['getprop', prop])
+                for prop in ('ro.product.model', 'ro.build.version.release',
+                             'ro.build.version.sdk')))
+            
+            return {
+                "device_id": self.device_id,
+                "model": model_result.stdout.strip() if model_result.returncode == 0 else "Unknown",
+                "android_version": (version_result.stdout.strip()
+                                    if version_result.returncode == 0 else "Unknown"),
+                "api_level": api_result.stdout.strip() if api_result.returncode == 0 else "Unknown",
+                "screen_size": self.screen_size
+            }
+            
+        except Exception as e:
+            return {"error": f"Could not get device info: {str(e)}"}
+    
+    async def _execute(self, command: Dict) -> Dict:
+        """Dispatch one command; the caller holds the command lock."""
+        if not self.device_id:
+            connection_result = await self.check_adb_connection()
+            if "error" in connection_result:
+                return connection_result
+        
+        action = command.get("action")
+        try:
+            dispatch = ASYNC_ACTION_DISPATCH.get(action)
+            if dispatch is None:
+                return {"error": f"Unknown action: {action}"}
+            
+            handler, args = dispatch
+            return await handler(self, *[command[arg] for arg in args])
+        
+        except Exception as e:
+            return {"error": f"Error executing command: {str(e)}"}
+        finally:
+            if action in INPUT_ACTIONS:
+                self.invalidate()
+    
+    async def _input(self, args: List[str], message: str, failure: str) -> Dict:
+        """Run an `input` shell command and report the outcome."""
+        try:
+            result = await self.transport.shell(self.device_id, ['input'] + args)
+            if result.returncode == 0:
+                return {"success": True, "message": message}
+            return {"error": f"{failure} failed: {result.stderr}"}
+        except Exception as e:
+            return {"error": f"{failure} failed: {str(e)}"}
+    
+    async def _tap(self, x: int, y: int) -> Dict:
+        return await self._input(['tap', str(x), str(y)], f"Tapped at ({x}, {y})", "Tap")
+    
+    async def _swipe(self, start_x: int, start_y: int, end_x: int, end_y: int, duration: int = 300) -> Dict:
+        return await self._input(
+            ['swipe', str(start_x), str(start_y), str(end_x), str(end_y), str(duration)],
+            f"Swiped from ({start_x}, {start_y}) to ({end_x}, {end_y})", "Swipe")
+    
+    async def _type_text(self, text: str) -> Dict:
+        return await self._input(['text', escape_input_text(text)], f"Typed: {text}", "Type")
+    
+    async def _press_key(self, keycode: str) -> Dict:
+        return await self._input(['keyevent', f'KEYCODE_{keycode}'], f"Pressed {keycode} key", "Key press")
+    
+    async def _scroll(self, direction: str) -> Dict:
+        gesture = scroll_gesture(direction, self.screen_size or (1080, 1920))
+        if gesture is None:
+            return {"error": f"Invalid scroll direction: {direction}"}
+        return await self._swipe(*gesture)
+    
+    async def _open_app(self, package_name: str) -> Dict:
+        try:
+            result = await self.transport.shell(self.device_id, ['monkey', '-p', package_name, '1'])
+            if result.returncode != 0:
+                result = await self.transport.shell(self.device_id, [
+                    'am', 'start', '-n', f'{package_name}/.MainActivity'
+                ])
+            if result.returncode == 0:
+                return {"success": True, "message": f"Opened app: {package_name}"}
+            return {"error": f"Could not open app {package_name}. App may not be installed."}
+        except Exception as e:
+            return {"error": f"App launch failed: {str(e)}"}
+    
+    async def _take_screenshot(self) -> Dict:
+        try:
+            png_data = await self.capture_png()
+            return {
+                "success": True,
+                "screenshot": base64.b64encode(png_data).decode('utf-8'),
+                "message": "Screenshot captured successfully"
+            }
+        except Exception as e:
+            return {"error": f"Screenshot failed: {str(e)}"}
+    
+    async def _wait(self, seconds: float) -> Dict:
+        await asyncio.sleep(seconds)
+        return {"success": True, "message": f"Waited {seconds} seconds"}
+
+
+# action -> (unbound handler, command keys passed to it), built from the registry
+ACTION_DISPATCH = {spec.name: (getattr(AndroidController, spec.handler), spec.args)
+                   for spec in ACTION_SPECS if spec.handler}
+
+ASYNC_ACTION_DISPATCH = {spec.name: (getattr(AsyncAndroidController, spec.handler), spec.args)
+                         for spec in ACTION_SPECS if spec.handler}
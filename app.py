@@ -1,10 +1,20 @@
-from flask import Flask, request, jsonify, render_template, send_file
+from flask import Flask, request, jsonify, render_template, send_file, Response
 from flask_cors import CORS
+import hashlib
 import threading
 import time
 import os
-from gemma_controller import GemmaController
-from android_controller import AndroidController
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+import numpy as np
+from gemma_controller import GemmaController, QUICK_COMMANDS
+from android_controller import AndroidController, IMAGE_FORMATS, parse_image_options
+from imaging import encode_frame
+from adb_transport import ShellSessionTransport
+from device_registry import DeviceRegistry
+from device_pool import DevicePool, PRIORITY_BACKGROUND, QueueFullError, DeadlineExceededError
+from screen_stream import StreamHub
+from status_monitor import StatusMonitor
 
 app = Flask(__name__)
 CORS(app)
@@ -12,15 +22,76 @@ CORS(app)
 # Global instances
 # Replace with your local Gemma model path
 # gemma = GemmaController("/path/to/your/local/gemma/model")
-gemma = GemmaController()  # Will use default model
-android = AndroidController()
+# Set GEMMA_PARSE_CACHE to a SQLite path to persist parsed commands across
+# restarts and share them between worker processes. Set GEMMA_SMALL_MODEL
+# (e.g. gemma2:2b) to try a faster model first and escalate only when needed.
+# Set GEMMA_VISION=1 to show the model the current screen when it parses a command
+gemma = GemmaController(cache_path=os.environ.get('GEMMA_PARSE_CACHE'),
+                        small_model_name=os.environ.get('GEMMA_SMALL_MODEL'),
+                        vision=os.environ.get('GEMMA_VISION') == '1')  # Will use default model
+# One long-lived track-devices stream replaces per-request `adb devices`
+adb_transport = ShellSessionTransport()
+device_registry = DeviceRegistry(adb_transport)
+android = AndroidController(transport=adb_transport, registry=device_registry)
+# Per-device workers for /api/command; they share the primary controller's
+# frame cache so input on any worker invalidates screenshots served here
+device_pool = DevicePool(adb_transport, registry=device_registry, frame_cache=android.frame_cache)
+stream_hub = StreamHub()
+# Screenshots, device info and stream frames wait behind user commands on the
+# device queue and are dropped if still queued after this many seconds
+BACKGROUND_DEADLINE = 10.0
+# /api/command parses on these threads while the request thread checks the
+# device. With GEMMA_PRECAPTURE=1 (vision mode only) the target's screen is
+# captured as soon as the device is known instead of when the model needs it
+parse_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='parse')
+PRECAPTURE_SCREEN = os.environ.get('GEMMA_PRECAPTURE') == '1'
 model_loaded = False
 loading_model = False
 
+def run_background(call, serial=None):
+    """Run call(controller) on a device's worker at background priority.
+    
+    Uses the primary device unless a serial is given.
+    
+    Raises:
+        QueueFullError: If the device's background queue share is full
+        DeadlineExceededError: If the call waited longer than BACKGROUND_DEADLINE
+    """
+    serial = serial or android.device_id
+    if not device_pool.select(None, default=serial):
+        raise KeyError(f"Device {serial} is not connected")
+    future = device_pool.submit_call(serial, call, device_pool.controller(serial),
+                                     priority=PRIORITY_BACKGROUND,
+                                     deadline=time.monotonic() + BACKGROUND_DEADLINE)
+    return future.result()
+
+def capture_target_screen(serial: str, user_command: str, deadline=None):
+    """Return a callable giving the device's current frame for vision parsing.
+    
+    With PRECAPTURE_SCREEN in vision mode the capture is queued right away,
+    overlapping the parse, unless the command resolves without the model;
+    otherwise it is only queued if the parser asks.
+    """
+    def submit():
+        return device_pool.submit_call(serial, lambda controller: controller.capture_frame(),
+                                       device_pool.controller(serial), deadline=deadline)
+    
+    if (PRECAPTURE_SCREEN and gemma.screen_encoder is not None
+            and not gemma.matches_locally(user_command)):
+        return submit().result
+    return lambda: submit().result()
+
+def queue_error_response(e: Exception):
+    """Map device queue errors to 429 (back-pressure) or 504 (deadline)."""
+    if isinstance(e, QueueFullError):
+        return jsonify({"error": str(e)}), 429, {"Retry-After": "1"}
+    return jsonify({"error": str(e)}), 504
+
 def load_model_async():
     """Load the Gemma model asynchronously."""
     global model_loaded, loading_model
     loading_model = True
+    status_monitor.refresh()
     try:
         success = gemma.load_model()
         model_loaded = success
@@ -30,22 +101,18 @@ def load_model_async():
         model_loaded = False
     finally:
         loading_model = False
+        status_monitor.refresh()
 
-@app.route('/')
-def index():
-    """Serve the main web interface."""
-    return render_template('index.html')
-
-@app.route('/api/status')
-def get_status():
-    """Get the current status of the system."""
+def collect_status() -> dict:
+    """Build the system status (runs adb and Ollama calls; used by the monitor)."""
     # Check Android connection
     android_status = android.check_adb_connection()
     
-    # Get model info
+    # Get model info; reload the model if Ollama evicted or lost it
     model_info = gemma.get_model_info()
+    gemma.ensure_warm()
     
-    return jsonify({
+    return {
         "model": {
             "loaded": model_loaded,
             "loading": loading_model,
@@ -53,29 +120,98 @@ def get_status():
         },
         "android": android_status,
         "ready": model_loaded and android_status.get("success", False)
-    })
+    }
+
+# Status is refreshed in the background and served from a snapshot; the
+# instance id keeps ETags from colliding across server restarts
+status_monitor = StatusMonitor(collect_status, interval=5.0)
+status_instance = uuid.uuid4().hex[:8]
+device_registry.add_listener(lambda serial, old_state, new_state: status_monitor.refresh())
+
+@app.route('/')
+def index():
+    """Serve the main web interface."""
+    return render_template('index.html')
+
+@app.route('/api/status')
+def get_status():
+    """Get the current status of the system from the background snapshot."""
+    status_monitor.start()
+    version, body = status_monitor.snapshot()
+    etag = f"{status_instance}-{version}"
+    
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype='application/json')
+    
+    response.set_etag(etag)
+    response.headers['X-Status-Version'] = str(version)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 @app.route('/api/command', methods=['POST'])
 def execute_command():
-    """Execute a natural language command."""
+    """Execute a natural language command.
+    
+    The optional "device" field selects a serial, "all" (broadcast) or "any"
+    (least busy device); without it the primary device is used. The optional
+    "timeout" field (seconds) drops the command if it is still queued by then.
+    """
     try:
         data = request.get_json()
         user_command = data.get('command', '').strip()
+        selector = data.get('device')
+        timeout = data.get('timeout')
+        plan_mode = bool(data.get('plan'))
         
         if not user_command:
             return jsonify({"error": "No command provided"}), 400
         
+        if timeout is not None and (not isinstance(timeout, (int, float)) or timeout <= 0):
+            return jsonify({"error": "timeout must be a positive number of seconds"}), 400
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        
         if not model_loaded:
             return jsonify({"error": "Gemma model not loaded"}), 503
         
-        # Check Android connection
-        android_status = android.check_adb_connection()
-        if "error" in android_status:
-            return jsonify({"error": f"Android connection failed: {android_status['error']}"}), 503
+        # Parse command with Gemma while the device is checked; plan mode
+        # turns a multi-step input into an ordered list of actions with one
+        # model call. In vision mode the target's screen is captured (only if
+        # the model is needed) so coordinates match what is shown; the parse
+        # waits for the device check only at that point
+        print(f"Parsing {'plan' if plan_mode else 'command'}: {user_command}")
+        screen_capture = Future()
+        if plan_mode:
+            parse_future = parse_executor.submit(gemma.parse_plan, user_command)
+        else:
+            capture_screen = (lambda: screen_capture.result()()) if selector != "all" else None
+            parse_future = parse_executor.submit(gemma.parse_command, user_command,
+                                                 capture_screen=capture_screen)
+        
+        device_ready = False
+        try:
+            # Check Android connection
+            if selector is None:
+                android_status = android.check_adb_connection()
+                if "error" in android_status:
+                    return jsonify({"error": f"Android connection failed: {android_status['error']}"}), 503
+            
+            targets = device_pool.select(selector, default=android.device_id)
+            if not targets:
+                return jsonify({"error": f"No connected device matches '{selector}'"}), 503
+            
+            if not plan_mode and selector != "all":
+                screen_capture.set_result(capture_target_screen(targets[0], user_command, deadline))
+            device_ready = True
+        finally:
+            if not screen_capture.done():
+                screen_capture.set_exception(RuntimeError("No target device for screen capture"))
+            if not device_ready:
+                # Drop the parse if it has not started; a running one is discarded
+                parse_future.cancel()
         
-        # Parse command with Gemma
-        print(f"Parsing command: {user_command}")
-        parsed_command = gemma.parse_command(user_command)
+        parsed_command = parse_future.result()
         
         if "error" in parsed_command:
             return jsonify({
@@ -85,16 +221,60 @@ def execute_command():
         
         print(f"Parsed command: {parsed_command}")
         
-        # Execute command on Android device
-        result = android.execute_command(parsed_command)
+        # Execute on each target device's worker; devices run in parallel.
+        # A plan runs as one queued job so other commands cannot interleave
+        if selector == "all":
+            if plan_mode:
+                futures = device_pool.broadcast_call(
+                    lambda controller: controller.execute_plan(parsed_command["actions"]),
+                    deadline=deadline)
+            else:
+                futures = device_pool.broadcast(parsed_command, deadline=deadline)
+            targets = sorted(futures)
+        elif plan_mode:
+            futures = {targets[0]: device_pool.submit_call(
+                targets[0], device_pool.controller(targets[0]).execute_plan,
+                parsed_command["actions"], deadline=deadline)}
+        else:
+            futures = {targets[0]: device_pool.submit(targets[0], dict(parsed_command),
+                                                      deadline=deadline)}
+        
+        results = {}
+        for serial, future in futures.items():
+            try:
+                results[serial] = future.result()
+            except DeadlineExceededError as e:
+                if selector != "all":
+                    return jsonify({"error": str(e), "original_command": user_command}), 504
+                results[serial] = {"success": False, "error": str(e)}
+            except QueueFullError as e:
+                # Only broadcasts fail per device; a busy device skips the command
+                results[serial] = {"success": False, "error": str(e)}
+        
+        if selector == "all":
+            succeeded = sum(1 for result in results.values() if result.get("success"))
+            return jsonify({
+                "success": True,
+                "original_command": user_command,
+                "parsed_command": parsed_command,
+                "devices": targets,
+                "results": results,
+                "result": {
+                    "success": succeeded == len(targets),
+                    "message": f"Executed on {succeeded}/{len(targets)} devices"
+                }
+            })
         
         return jsonify({
             "success": True,
             "original_command": user_command,
             "parsed_command": parsed_command,
-            "result": result
+            "device": targets[0],
+            "result": results[targets[0]]
         })
         
+    except QueueFullError as e:
+        return queue_error_response(e)
     except Exception as e:
         return jsonify({"error": f"Command execution failed: {str(e)}"}), 500
 
@@ -107,19 +287,123 @@ def take_screenshot():
         if "error" in android_status:
             return jsonify({"error": f"Android connection failed: {android_status['error']}"}), 503
         
-        result = android.execute_command({"action": "screenshot"})
+        result = run_background(lambda controller: controller.execute_command({"action": "screenshot"}))
         return jsonify(result)
         
+    except (QueueFullError, DeadlineExceededError) as e:
+        return queue_error_response(e)
     except Exception as e:
         return jsonify({"error": f"Screenshot failed: {str(e)}"}), 500
 
+@app.route('/api/screenshot/image')
+def get_screenshot_image():
+    """Return the device screen as a binary PNG/JPEG/WebP image.
+    
+    Query parameters: format (png|jpeg|webp), width (max width in pixels),
+    quality (1-100, lossy formats only) and crop (x,y,width,height).
+    """
+    try:
+        options = parse_image_options(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    try:
+        # Check Android connection
+        android_status = android.check_adb_connection()
+        if "error" in android_status:
+            return jsonify({"error": f"Android connection failed: {android_status['error']}"}), 503
+        
+        frame = run_background(lambda controller: controller.capture_frame())
+        
+        # Tag the frame and the requested rendition so unchanged screens
+        # can be answered with 304 before paying for encoding
+        digest = hashlib.blake2b(np.ascontiguousarray(frame), digest_size=16)
+        digest.update(repr(sorted(options.items())).encode('utf-8'))
+        etag = digest.hexdigest()
+        
+        if etag in request.if_none_match:
+            response = Response(status=304)
+            response.set_etag(etag)
+            return response
+        
+        pillow_format, content_type = IMAGE_FORMATS[options["format"]]
+        save_options = {} if pillow_format == "PNG" else {"quality": options["quality"]}
+        image_data = encode_frame(frame, pillow_format, max_width=options["max_width"],
+                                  crop=options["crop"], **save_options)
+        
+        response = Response(image_data, mimetype=content_type)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+        
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except (QueueFullError, DeadlineExceededError) as e:
+        return queue_error_response(e)
+    except Exception as e:
+        return jsonify({"error": f"Screenshot failed: {str(e)}"}), 500
+
+@app.route('/api/stream')
+def stream_screen():
+    """Stream the device screen as MJPEG (multipart/x-mixed-replace).
+    
+    All viewers of a device share one capture loop; slow viewers skip frames.
+    """
+    android_status = android.check_adb_connection()
+    if "error" in android_status:
+        return jsonify({"error": f"Android connection failed: {android_status['error']}"}), 503
+    
+    # Stream captures queue behind user commands on the device's worker
+    serial = android.device_id
+    broadcaster = stream_hub.broadcaster(
+        serial, lambda: run_background(lambda controller: controller.capture_frame(max_age=0), serial))
+    
+    def generate():
+        # Ends if the device produces no frame at all for a while
+        for frame in broadcaster.frames():
+            yield (b'--frame\r\nContent-Type: image/jpeg\r\n'
+                   b'Content-Length: ' + str(len(frame)).encode() + b'\r\n\r\n' +
+                   frame + b'\r\n')
+    
+    response = Response(generate(), mimetype='multipart/x-mixed-replace; boundary=frame')
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/api/stream/stats')
+def get_stream_stats():
+    """Get viewer counts and frame rates for active device streams."""
+    return jsonify(stream_hub.get_stats())
+
+@app.route('/api/parser/stats')
+def get_parser_stats():
+    """Get how many commands bypassed the model via the rule-based fast path."""
+    return jsonify(gemma.get_parse_stats())
+
+@app.route('/api/devices')
+def list_devices():
+    """List the devices in the worker pool with their queue statistics."""
+    try:
+        device_pool.refresh()
+        return jsonify({
+            "primary": android.device_id,
+            "devices": device_pool.get_stats()
+        })
+    except Exception as e:
+        return jsonify({"error": f"Could not list devices: {str(e)}"}), 500
+
 @app.route('/api/device_info')
 def get_device_info():
     """Get information about the connected Android device."""
     try:
-        device_info = android.get_device_info()
+        android_status = android.check_adb_connection()
+        if "error" in android_status:
+            return jsonify(android_status)
+        
+        device_info = run_background(lambda controller: controller.get_device_info())
         return jsonify(device_info)
         
+    except (QueueFullError, DeadlineExceededError) as e:
+        return queue_error_response(e)
     except Exception as e:
         return jsonify({"error": f"Could not get device info: {str(e)}"}), 500
 
@@ -127,9 +411,15 @@ def get_device_info():
 def list_apps():
     """Get a list of installed apps on the device."""
     try:
-        apps = android.list_installed_apps()
+        android_status = android.check_adb_connection()
+        if "error" in android_status:
+            return jsonify(android_status)
+        
+        apps = run_background(lambda controller: controller.list_installed_apps())
         return jsonify(apps)
         
+    except (QueueFullError, DeadlineExceededError) as e:
+        return queue_error_response(e)
     except Exception as e:
         return jsonify({"error": f"Could not list apps: {str(e)}"}), 500
 
@@ -154,19 +444,7 @@ def load_model():
 @app.route('/api/quick_commands')
 def get_quick_commands():
     """Get a list of quick commands for the UI."""
-    commands = [
-        {"name": "Take Screenshot", "command": "take a screenshot"},
-        {"name": "Go Home", "command": "go to home screen"},
-        {"name": "Go Back", "command": "go back"},
-        {"name": "Scroll Down", "command": "scroll down"},
-        {"name": "Scroll Up", "command": "scroll up"},
-        {"name": "Open Camera", "command": "open camera app"},
-        {"name": "Open Settings", "command": "open settings"},
-        {"name": "Tap Center", "command": "tap in the center"},
-        {"name": "Volume Up", "command": "press volume up"},
-        {"name": "Volume Down", "command": "press volume down"}
-    ]
-    return jsonify(commands)
+    return jsonify(QUICK_COMMANDS)
 
 if __name__ == '__main__':
     # Create templates and static directories
@@ -0,0 +1,432 @@
+"""
+ASGI entry point: every endpoint the web UI uses, on one event loop.
+
+Run it with `python start_asgi.py` (or `uvicorn asgi:app --port 5002`).
+Idle connections (status polls, MJPEG viewers, commands waiting on Ollama)
+cost a coroutine each instead of a thread, so one process holds many more
+of them than the threaded Flask server in app.py. The device pool endpoints
+(/api/devices, /api/apps and the "device" field of /api/command) are only
+served by app.py.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import uuid
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl
+import numpy as np
+from gemma_controller import AsyncGemmaController, QUICK_COMMANDS
+from android_controller import (AsyncAndroidController, IMAGE_FORMATS,
+                                parse_image_options)
+from imaging import encode_frame
+from adb_transport import AsyncAdbSocketTransport
+from screen_stream import AsyncFrameBroadcaster
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATE_PATH = os.path.join(BASE_DIR, "templates", "index.html")
+STATIC_DIR = os.path.join(BASE_DIR, "static")
+
+# Static files by extension: content type
+STATIC_TYPES = {".css": "text/css", ".js": "application/javascript"}
+
+# The template's only server-side expressions are static file URLs
+STATIC_URL_PATTERN = re.compile(rb"\{\{\s*url_for\('static',\s*filename='([^']+)'\)\s*\}\}")
+
+# Frame waits in a row without any frame before a stream is ended
+STREAM_MAX_EMPTY_WAITS = 3
+
+# Seconds between background status refreshes
+STATUS_INTERVAL = 5.0
+
+# Same environment as app.py; ANDROID_ADB_SERVER_PORT is the adb server's own
+gemma = AsyncGemmaController(cache_path=os.environ.get('GEMMA_PARSE_CACHE'),
+                             small_model_name=os.environ.get('GEMMA_SMALL_MODEL'),
+                             vision=os.environ.get('GEMMA_VISION') == '1')
+adb_transport = AsyncAdbSocketTransport(port=int(os.environ.get('ANDROID_ADB_SERVER_PORT', 5037)))
+android = AsyncAndroidController(transport=adb_transport)
+broadcasters: Dict[str, AsyncFrameBroadcaster] = {}
+model_loaded = False
+loading_model = False
+
+status_instance = uuid.uuid4().hex[:8]
+status_version = 0
+status_body: Optional[bytes] = None
+status_wake: Optional[asyncio.Event] = None
+
+
+async def collect_status() -> dict:
+    """Build the system status; adb and Ollama are queried concurrently."""
+    android_status, model_info = await asyncio.gather(android.check_adb_connection(),
+                                                      gemma.get_model_info())
+    await gemma.ensure_warm()
+    return {
+        "model": {
+            "loaded": model_loaded,
+            "loading": loading_model,
+            "info": model_info
+        },
+        "android": android_status,
+        "ready": model_loaded and android_status.get("success", False)
+    }
+
+
+async def update_status():
+    """Collect status now and bump the version if it changed."""
+    global status_version, status_body
+    try:
+        status = await collect_status()
+    except Exception as e:
+        status = {"error": f"Status check failed: {str(e)}"}
+    body = json.dumps(status, sort_keys=True).encode('utf-8')
+    if body != status_body:
+        status_body = body
+        status_version += 1
+
+
+async def status_loop():
+    """Refresh the status snapshot every STATUS_INTERVAL seconds or when woken."""
+    while True:
+        await update_status()
+        try:
+            await asyncio.wait_for(status_wake.wait(), STATUS_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        status_wake.clear()
+
+
+async def load_model():
+    """Load the Gemma model in the background."""
+    global model_loaded, loading_model
+    loading_model = True
+    status_wake.set()
+    try:
+        model_loaded = await gemma.load_model()
+        print(f"Model loading {'successful' if model_loaded else 'failed'}")
+    except Exception as e:
+        print(f"Error loading model: {e}")
+        model_loaded = False
+    finally:
+        loading_model = False
+        status_wake.set()
+
+
+async def read_body(receive) -> bytes:
+    """Read the complete request body."""
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+async def send_response(send, status: int, body: bytes, content_type: str = 'application/json',
+                        headers: Optional[List[Tuple[bytes, bytes]]] = None):
+    """Send a complete response."""
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', content_type.encode()), (b'content-length', str(len(body)).encode()),
+                    (b'access-control-allow-origin', b'*')] + (headers or []),
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def send_json(send, data: dict, status: int = 200):
+    """Send a JSON response."""
+    await send_response(send, status, json.dumps(data).encode('utf-8'))
+
+
+async def send_not_modified(send, headers: List[Tuple[bytes, bytes]]):
+    """Send a 304 response."""
+    await send({'type': 'http.response.start', 'status': 304, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+def etag_matches(scope, etag: bytes) -> bool:
+    """Whether the request's If-None-Match lists the ETag."""
+    if_none_match = dict(scope['headers']).get(b'if-none-match', b'')
+    return etag in [tag.strip() for tag in if_none_match.split(b',')]
+
+
+def query_params(scope) -> Dict[str, str]:
+    """The query parameters, keeping the first value of each like Flask's request.args."""
+    params: Dict[str, str] = {}
+    for name, value in parse_qsl(scope.get('query_string', b'').decode('latin-1')):
+        params.setdefault(name, value)
+    return params
+
+
+async def index(scope, receive, send):
+    """Serve the main web interface."""
+    with open(TEMPLATE_PATH, 'rb') as template:
+        page = STATIC_URL_PATTERN.sub(rb"/static/\1", template.read())
+    await send_response(send, 200, page, 'text/html; charset=utf-8')
+
+
+async def static_file(scope, receive, send):
+    """Serve a file from static/."""
+    name = scope['path'][len('/static/'):]
+    content_type = STATIC_TYPES.get(os.path.splitext(name)[1])
+    path = os.path.join(STATIC_DIR, name)
+    if content_type is None or os.path.dirname(os.path.abspath(path)) != STATIC_DIR or not os.path.isfile(path):
+        return await send_json(send, {"error": "Not found"}, 404)
+    with open(path, 'rb') as static:
+        await send_response(send, 200, static.read(), content_type)
+
+
+async def get_status(scope, receive, send):
+    """Serve the background status snapshot with an ETag."""
+    if status_body is None:
+        await update_status()
+    etag = f'"{status_instance}-{status_version}"'.encode()
+    headers = [(b'etag', etag), (b'x-status-version', str(status_version).encode()),
+               (b'cache-control', b'no-cache')]
+    if etag_matches(scope, etag):
+        return await send_not_modified(send, headers)
+    await send_response(send, 200, status_body, headers=headers)
+
+
+async def execute_command(scope, receive, send):
+    """Parse a natural language command (or plan) and execute it on the connected device."""
+    try:
+        data = json.loads(await read_body(receive) or b'{}')
+        user_command = data.get('command', '').strip()
+        plan_mode = bool(data.get('plan'))
+
+        if not user_command:
+            return await send_json(send, {"error": "No command provided"}, 400)
+        if not model_loaded:
+            return await send_json(send, {"error": "Gemma model not loaded"}, 503)
+
+        # Parse while the device is checked; the parse is cancelled if the device is not ready
+        print(f"Parsing {'plan' if plan_mode else 'command'}: {user_command}")
+        if plan_mode:
+            parse_task = asyncio.ensure_future(gemma.parse_plan(user_command))
+        else:
+            parse_task = asyncio.ensure_future(gemma.parse_command(user_command,
+                                                                   capture_screen=android.capture_frame))
+
+        try:
+            android_status = await android.check_adb_connection()
+        except BaseException:
+            parse_task.cancel()
+            raise
+        if "error" in android_status:
+            parse_task.cancel()
+            return await send_json(send, {"error": f"Android connection failed: {android_status['error']}"}, 503)
+
+        parsed_command = await parse_task
+
+        if "error" in parsed_command:
+            return await send_json(send, {
+                "error": f"Command parsing failed: {parsed_command['error']}",
+                "original_command": user_command
+            }, 400)
+
+        print(f"Parsed command: {parsed_command}")
+
+        if plan_mode:
+            result = await android.execute_plan(parsed_command["actions"])
+        else:
+            result = await android.execute_command(dict(parsed_command))
+
+        await send_json(send, {
+            "success": True,
+            "original_command": user_command,
+            "parsed_command": parsed_command,
+            "device": android.device_id,
+            "result": result
+        })
+    except Exception as e:
+        await send_json(send, {"error": f"Command execution failed: {str(e)}"}, 500)
+
+
+async def take_screenshot(scope, receive, send):
+    """Take a screenshot of the Android device."""
+    try:
+        android_status = await android.check_adb_connection()
+        if "error" in android_status:
+            return await send_json(
+                send, {"error": f"Android connection failed: {android_status['error']}"}, 503)
+
+        await send_json(send, await android.execute_command({"action": "screenshot"}))
+    except Exception as e:
+        await send_json(send, {"error": f"Screenshot failed: {str(e)}"}, 500)
+
+
+async def get_screenshot_image(scope, receive, send):
+    """Return the device screen as a binary PNG/JPEG/WebP image (see app.py for parameters)."""
+    try:
+        options = parse_image_options(query_params(scope))
+    except ValueError as e:
+        return await send_json(send, {"error": str(e)}, 400)
+
+    try:
+        android_status = await android.check_adb_connection()
+        if "error" in android_status:
+            return await send_json(
+                send, {"error": f"Android connection failed: {android_status['error']}"}, 503)
+
+        frame = await android.capture_frame()
+
+        # Unchanged screens are answered with 304 before paying for encoding
+        digest = hashlib.blake2b(np.ascontiguousarray(frame), digest_size=16)
+        digest.update(repr(sorted(options.items())).encode('utf-8'))
+        etag = f'"{digest.hexdigest()}"'.encode()
+        headers = [(b'etag', etag), (b'cache-control', b'no-cache')]
+        if etag_matches(scope, etag):
+            return await send_not_modified(send, headers)
+
+        pillow_format, content_type = IMAGE_FORMATS[options["format"]]
+        save_options = {} if pillow_format == "PNG" else {"quality": options["quality"]}
+        # Resizing and encoding are CPU-bound
+        image_data = await asyncio.get_running_loop().run_in_executor(
+            None, lambda: encode_frame(frame, pillow_format, max_width=options["max_width"],
+                                       crop=options["crop"], **save_options))
+        await send_response(send, 200, image_data, content_type, headers)
+
+    except ValueError as e:
+        await send_json(send, {"error": str(e)}, 400)
+    except Exception as e:
+        await send_json(send, {"error": f"Screenshot failed: {str(e)}"}, 500)
+
+
+async def stream_screen(scope, receive, send):
+    """Stream the device screen as MJPEG; all viewers of a device share one capture loop."""
+    android_status = await android.check_adb_connection()
+    if "error" in android_status:
+        return await send_json(send, {"error": f"Android connection failed: {android_status['error']}"}, 503)
+
+    serial = android.device_id
+    broadcaster = broadcasters.get(serial)
+    if broadcaster is None:
+        broadcaster = broadcasters[serial] = AsyncFrameBroadcaster(lambda: android.capture_frame(max_age=0))
+
+    async def wait_disconnect():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    disconnected = asyncio.ensure_future(wait_disconnect())
+    broadcaster.subscribe()
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [(b'content-type', b'multipart/x-mixed-replace; boundary=frame'),
+                        (b'cache-control', b'no-cache')],
+        })
+        sequence = 0
+        empty_waits = 0
+        # Like FrameBroadcaster.frames, end if the device produces no frame at all
+        while not disconnected.done() and empty_waits < STREAM_MAX_EMPTY_WAITS:
+            sequence, frame = await broadcaster.wait_frame(sequence)
+            if frame is None:
+                empty_waits += 1
+                continue
+            empty_waits = 0
+            await send({
+                'type': 'http.response.body',
+                'body': (b'--frame\r\nContent-Type: image/jpeg\r\n'
+                         b'Content-Length: ' + str(len(frame)).encode() + b'\r\n\r\n' + frame + b'\r\n'),
+                'more_body': True,
+            })
+        if not disconnected.done():
+            await send({'type': 'http.response.body', 'body': b''})
+    except OSError:
+        # The client went away mid-write
+        pass
+    finally:
+        broadcaster.unsubscribe()
+        disconnected.cancel()
+
+
+async def get_stream_stats(scope, receive, send):
+    """Get viewer counts and frame rates for active device streams."""
+    await send_json(send, {serial: broadcaster.get_stats() for serial, broadcaster in broadcasters.items()})
+
+
+async def get_parser_stats(scope, receive, send):
+    """Get how commands were resolved (fast path, cache, index, model)."""
+    await send_json(send, gemma.get_parse_stats())
+
+
+async def get_device_info(scope, receive, send):
+    """Get information about the connected Android device."""
+    try:
+        android_status = await android.check_adb_connection()
+        if "error" in android_status:
+            return await send_json(send, android_status)
+
+        await send_json(send, await android.get_device_info())
+    except Exception as e:
+        await send_json(send, {"error": f"Could not get device info: {str(e)}"}, 500)
+
+
+async def trigger_model_load(scope, receive, send):
+    """Manually trigger model loading."""
+    if model_loaded:
+        return await send_json(send, {"message": "Model already loaded"})
+    if loading_model:
+        return await send_json(send, {"message": "Model is currently loading"})
+
+    asyncio.ensure_future(load_model())
+    await send_json(send, {"message": "Model loading started"})
+
+
+async def get_quick_commands(scope, receive, send):
+    """Get a list of quick commands for the UI."""
+    await send_json(send, QUICK_COMMANDS)
+
+
+ROUTES = {
+    ('GET', '/'): index,
+    ('GET', '/api/status'): get_status,
+    ('POST', '/api/command'): execute_command,
+    ('GET', '/api/stream'): stream_screen,
+    ('GET', '/api/stream/stats'): get_stream_stats,
+    ('GET', '/api/parser/stats'): get_parser_stats,
+    ('GET', '/api/screenshot'): take_screenshot,
+    ('GET', '/api/screenshot/image'): get_screenshot_image,
+    ('GET', '/api/device_info'): get_device_info,
+    ('POST', '/api/load_model'): trigger_model_load,
+    ('GET', '/api/quick_commands'): get_quick_commands,
+}
+
+
+async def lifespan(receive, send):
+    """Start the status refresher and model loading with the server."""
+    global status_wake
+    background = []
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            status_wake = asyncio.Event()
+            background = [asyncio.ensure_future(status_loop()), asyncio.ensure_future(load_model())]
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            for task in background:
+                task.cancel()
+            await adb_transport.close()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    """ASGI application."""
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+
+    handler = ROUTES.get((scope['method'], scope['path']))
+    if handler is None and scope['method'] == 'GET' and scope['path'].startswith('/static/'):
+        handler = static_file
+    if handler is None:
+        known_path = any(path == scope['path'] for _, path in ROUTES)
+        return await send_json(send, {"error": "Method not allowed" if known_path else "Not found"},
+                               405 if known_path else 404)
+    await handler(scope, receive, send)
@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for Gemma3 Android Controller
+Measures controller overhead against a fake `adb` stand-in, no device needed
+"""
+
+import argparse
+import os
+import random
+import shutil
+import socketserver
+import stat
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from android_controller import AndroidController
+from adb_transport import SubprocessTransport, ShellSessionTransport, AdbSocketTransport
+from intent_matcher import IntentMatcher
+from intent_index import build_index, default_corpus, expand_markers
+from prompt_builder import PromptBuilder, estimate_tokens, render_prompt, EXAMPLES
+from action_registry import ACTION_SPECS
+
+FAKE_SERIAL = "emulator-5554"
+
+FAKE_ADB = """#!{python}
+import os
+import sys
+
+args = sys.argv[1:]
+if args[:1] == ['-s']:
+    args = args[2:]
+
+if args[:1] == ['devices']:
+    print("List of devices attached")
+    print("{serial}\\tdevice")
+    sys.exit(0)
+
+if args[:1] == ['shell']:
+    command = ' '.join(args[1:])
+    if command:
+        os.execvp('sh', ['sh', '-c', command])
+    os.execvp('sh', ['sh'])
+
+if args[:1] == ['exec-out']:
+    os.execvp('sh', ['sh', '-c', ' '.join(args[1:])])
+
+sys.exit(1)
+"""
+
+# Mix of everyday commands and ones only the model can handle
+SAMPLE_COMMANDS = [
+    "take a screenshot", "go back", "go to home screen", "scroll down", "scroll up",
+    "open camera app", "open settings", "tap in the center", "press volume up",
+    "turn on wifi", "type hello world", "tap at 300, 700", "set brightness to 50%",
+    "open the play store", "wait 2 seconds",
+    "tap the login button", "open my latest email", "reply to the last message saying ok",
+    "find the search bar and search for cats", "what is on the screen",
+]
+
+FAKE_INPUT = """#!/bin/sh
+exit 0
+"""
+
+FAKE_WM = """#!/bin/sh
+echo "Physical size: 1080x1920"
+"""
+
+FAKE_GETPROP = """#!/bin/sh
+echo "fake-$1"
+"""
+
+
+def print_separator(title):
+    """Print a formatted separator."""
+    print("\n" + "=" * 60)
+    print(f" {title}")
+    print("=" * 60)
+
+
+def make_fake_adb(directory: str) -> str:
+    """Write a fake adb that runs shell commands locally against stub device tools."""
+    scripts = {
+        'adb': FAKE_ADB.format(python=sys.executable, serial=FAKE_SERIAL),
+        'input': FAKE_INPUT,
+        'wm': FAKE_WM,
+        'getprop': FAKE_GETPROP,
+    }
+
+    for name, content in scripts.items():
+        path = os.path.join(directory, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+
+    # Device-side tools are resolved through PATH
+    os.environ['PATH'] = directory + os.pathsep + os.environ.get('PATH', '')
+    return os.path.join(directory, 'adb')
+
+
+class FakeAdbServerHandler(socketserver.BaseRequestHandler):
+    """Minimal adb server: host:devices, host:transport, shell:, exec: and sync: RECV."""
+
+    def recv_exact(self, size: int) -> bytes:
+        data = b''
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("client closed")
+            data += chunk
+        return data
+
+    def read_service(self) -> str:
+        return self.recv_exact(int(self.recv_exact(4), 16)).decode('utf-8')
+
+    def reply(self, payload: bytes = None):
+        self.request.sendall(b'OKAY')
+        if payload is not None:
+            self.request.sendall(b'%04x' % len(payload) + payload)
+
+    def handle(self):
+        try:
+            service = self.read_service()
+            if service == 'host:devices':
+                self.reply(f"{FAKE_SERIAL}\tdevice\n".encode('utf-8'))
+                return
+            if service != f'host:transport:{FAKE_SERIAL}':
+                message = b'device not found'
+                self.request.sendall(b'FAIL' + b'%04x' % len(message) + message)
+                return
+            self.reply()
+
+            service = self.read_service()
+            self.reply()
+            if service.startswith('shell:'):
+                result = subprocess.run(['sh', '-c', service[6:]], stdout=subprocess.PIPE,
+                                        stderr=subprocess.STDOUT)
+                self.request.sendall(result.stdout)
+            elif service.startswith('exec:'):
+                result = subprocess.run(['sh', '-c', service[5:]], capture_output=True)
+                self.request.sendall(result.stdout)
+            elif service == 'sync:':
+                self.handle_sync()
+        except ConnectionError:
+            pass
+
+    def handle_sync(self):
+        while True:
+            tag, length = self.recv_exact(4), struct.unpack('<I', self.recv_exact(4))[0]
+            path = self.recv_exact(length).decode('utf-8') if length else ''
+            if tag == b'QUIT':
+                return
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            except OSError as e:
+                message = str(e).encode('utf-8')
+                self.request.sendall(b'FAIL' + struct.pack('<I', len(message)) + message)
+                continue
+            for offset in range(0, len(data), 65536):
+                chunk = data[offset:offset + 65536]
+                self.request.sendall(b'DATA' + struct.pack('<I', len(chunk)) + chunk)
+            self.request.sendall(b'DONE' + struct.pack('<I', 0))
+
+
+class FakeAdbServer(socketserver.ThreadingTCPServer):
+    # socketserver's default backlog of 5 drops bursts of concurrent clients
+    request_queue_size = 128
+
+
+def start_fake_adb_server() -> socketserver.ThreadingTCPServer:
+    """Start a fake adb server on an ephemeral local port."""
+    server = FakeAdbServer(('127.0.0.1', 0), FakeAdbServerHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def report(name: str, timings):
+    """Print latency statistics in milliseconds."""
+    timings = sorted(timings)
+    mean = sum(timings) / len(timings)
+    p50 = timings[len(timings) // 2]
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(f"  {name:<12} mean {mean * 1000:7.2f} ms   p50 {p50 * 1000:7.2f} ms   p95 {p95 * 1000:7.2f} ms")
+    return mean
+
+
+def bench_tap(iterations: int):
+    """Compare tap latency for the one-shot and persistent shell transports."""
+    print_separator(f"Tap latency ({iterations} taps, fake adb)")
+
+    with tempfile.TemporaryDirectory() as directory:
+        adb_path = make_fake_adb(directory)
+        means = {}
+
+        for name, transport in [
+            ("subprocess", SubprocessTransport(adb_path)),
+            ("session", ShellSessionTransport(adb_path)),
+        ]:
+            android = AndroidController(transport=transport)
+            android.device_id = FAKE_SERIAL
+            # Warm up so the session spawn is not counted
+            android.execute_command({"action": "tap", "x": 1, "y": 1})
+
+            timings = []
+            for i in range(iterations):
+                start = time.perf_counter()
+                result = android.execute_command({"action": "tap", "x": i % 1080, "y": i % 1920})
+                timings.append(time.perf_counter() - start)
+                if "error" in result:
+                    print(f"❌ {name}: {result['error']}")
+                    break
+
+            means[name] = report(name, timings)
+            android.close()
+
+        print(f"\n⚡ Speedup: {means['subprocess'] / means['session']:.1f}x")
+
+
+def bench_device_queries(iterations: int):
+    """Compare connection checks and device info via the adb binary and the socket client."""
+    print_separator(f"Device queries ({iterations} iterations, fake adb)")
+
+    with tempfile.TemporaryDirectory() as directory:
+        adb_path = make_fake_adb(directory)
+        server = start_fake_adb_server()
+        means = {}
+
+        for name, transport in [
+            ("subprocess", SubprocessTransport(adb_path)),
+            ("socket", AdbSocketTransport(port=server.server_address[1])),
+        ]:
+            android = AndroidController(transport=transport)
+
+            timings = []
+            for _ in range(iterations):
+                start = time.perf_counter()
+                status = android.check_adb_connection()
+                info = android.get_device_info()
+                timings.append(time.perf_counter() - start)
+                if "error" in status or "error" in info:
+                    print(f"❌ {name}: {status.get('error') or info.get('error')}")
+                    break
+
+            means[name] = report(name, timings)
+            android.close()
+
+        server.shutdown()
+        server.server_close()
+        print(f"\n⚡ Speedup: {means['subprocess'] / means['socket']:.1f}x")
+
+
+def bench_intent_matcher(iterations: int):
+    """Measure the rule-based fast path and how many sample commands it resolves."""
+    print_separator(f"Intent fast path ({iterations} rounds of {len(SAMPLE_COMMANDS)} commands)")
+
+    start = time.perf_counter()
+    matcher = IntentMatcher()
+    print(f"  compile      {(time.perf_counter() - start) * 1000:7.2f} ms")
+
+    timings = []
+    for _ in range(iterations):
+        for command in SAMPLE_COMMANDS:
+            start = time.perf_counter()
+            matcher.match(command)
+            timings.append(time.perf_counter() - start)
+    report("match", timings)
+
+    matched = sum(1 for command in SAMPLE_COMMANDS if matcher.match(command) is not None)
+    print(f"\n⚡ Bypassed the model for {matched}/{len(SAMPLE_COMMANDS)} sample commands")
+
+
+def bench_prompt_pruning(iterations: int):
+    """Compare estimated prompt tokens for pruned and full prompts on the sample commands."""
+    print_separator(f"Prompt pruning ({len(SAMPLE_COMMANDS)} commands)")
+
+    builder = PromptBuilder()
+    full_tokens = estimate_tokens(render_prompt(ACTION_SPECS, EXAMPLES))
+    pruned_tokens = []
+    timings = []
+    for command in SAMPLE_COMMANDS:
+        for _ in range(iterations):
+            start = time.perf_counter()
+            pruned = builder.build(command)
+            timings.append(time.perf_counter() - start)
+        pruned_tokens.append(estimate_tokens(pruned[0]) if pruned else full_tokens)
+
+    report("build", timings)
+    mean_tokens = sum(pruned_tokens) / len(pruned_tokens)
+    print(f"  full prompt  ~{full_tokens} tokens, pruned mean ~{mean_tokens:.0f} tokens")
+    print(f"\n⚡ Prompt reduced {full_tokens / mean_tokens:.1f}x")
+
+
+def synthetic_corpus(size: int):
+    """Grow the intent corpus to size examples by inserting random corpus words."""
+    rng = random.Random(0)
+    base = [(variant, command) for text, command in default_corpus() for variant in expand_markers(text)]
+    words = sorted({word for text, _ in base for word in text.lower().split()})
+    entries = []
+    while len(entries) < size:
+        text, command = rng.choice(base)
+        tokens = text.split()
+        tokens.insert(rng.randrange(len(tokens) + 1), rng.choice(words))
+        entries.append((" ".join(tokens), command))
+    return entries
+
+
+def bench_intent_index(iterations: int):
+    """Measure intent index build time and query latency at 10k and 100k examples."""
+    for size in (10_000, 100_000):
+        print_separator(f"Intent index ({size:,} examples, {iterations} rounds of {len(SAMPLE_COMMANDS)} commands)")
+        entries = synthetic_corpus(size)
+        directory = tempfile.mkdtemp()
+        try:
+            start = time.perf_counter()
+            index = build_index(entries, directory)
+            print(f"  build        {(time.perf_counter() - start) * 1000:7.0f} ms")
+
+            timings = []
+            for _ in range(iterations):
+                for command in SAMPLE_COMMANDS:
+                    start = time.perf_counter()
+                    index.match(command)
+                    timings.append(time.perf_counter() - start)
+            report("query", timings)
+        finally:
+            shutil.rmtree(directory)
+
+
+def main():
+    """Main benchmark function."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--iterations', type=int, default=200, help='operations per benchmark')
+    parser.add_argument('benchmarks', nargs='*', default=['tap', 'device', 'intent', 'prompt', 'index'],
+                        help='benchmarks to run: tap, device, intent, prompt, index')
+    args = parser.parse_args()
+
+    if 'tap' in args.benchmarks:
+        bench_tap(args.iterations)
+    if 'device' in args.benchmarks:
+        bench_device_queries(args.iterations)
+    if 'intent' in args.benchmarks:
+        bench_intent_matcher(args.iterations)
+    if 'prompt' in args.benchmarks:
+        bench_prompt_pruning(args.iterations)
+    if 'index' in args.benchmarks:
+        bench_intent_index(args.iterations)
+
+
+if __name__ == "__main__":
+    main()
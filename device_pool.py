@@ -0,0 +1,289 @@
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional
+from android_controller import AndroidController
+
+# Lower runs first: user gestures go ahead of status/screenshot/telemetry work
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+
+class QueueFullError(Exception):
+    """Raised when a device queue is at capacity (maps to HTTP 429)."""
+    pass
+
+
+class DeadlineExceededError(Exception):
+    """Raised for work dropped because its deadline passed while queued."""
+    pass
+
+
+class DeviceWorker:
+    """
+    Owns one device's controller and serializes all of its device I/O.
+    
+    Work runs on a dedicated thread in priority order (FIFO within a
+    priority). The queue is bounded, with background work limited to half of
+    it so it can never crowd out interactive commands, and work whose
+    deadline has passed is dropped instead of executed.
+    """
+
+    def __init__(self, controller: AndroidController, max_queue: int = 32):
+        self.controller = controller
+        self.serial = controller.device_id
+        self.max_queue = max_queue
+        self.queue = queue.PriorityQueue()
+        self.pending = 0
+        self.pending_background = 0
+        self.stats = {"completed": 0, "rejected": 0, "expired": 0}
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name=f"device-{self.serial}")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, command: Dict, priority: int = PRIORITY_INTERACTIVE,
+               deadline: Optional[float] = None) -> Future:
+        """Queue a command; the future resolves to the controller's result dict."""
+        return self.submit_call(self.controller.execute_command, command,
+                                priority=priority, deadline=deadline)
+
+    def submit_call(self, function: Callable, *args, priority: int = PRIORITY_INTERACTIVE,
+                    deadline: Optional[float] = None, **kwargs) -> Future:
+        """
+        Queue any device I/O call to run on this worker.
+        
+        Args:
+            priority: PRIORITY_INTERACTIVE or PRIORITY_BACKGROUND (lower runs first)
+            deadline: time.monotonic() value after which the call is dropped
+        
+        Raises:
+            QueueFullError: If the queue (or its background share) is full
+        """
+        background = priority > PRIORITY_INTERACTIVE
+        with self._lock:
+            if self.pending >= self.max_queue or (
+                    background and self.pending_background >= self.max_queue // 2):
+                self.stats["rejected"] += 1
+                raise QueueFullError(f"Device {self.serial} queue is full ({self.pending} pending)")
+            self.pending += 1
+            if background:
+                self.pending_background += 1
+        
+        future = Future()
+        self.queue.put((priority, next(self._sequence), (function, args, kwargs, deadline, future)))
+        return future
+
+    def _run(self):
+        """Execute queued work in priority order until stopped."""
+        # Resolve the screen size up front so scroll gestures are scaled correctly
+        self.controller.check_adb_connection()
+
+        while True:
+            priority, _, item = self.queue.get()
+            if item is None:
+                return
+
+            function, args, kwargs, deadline, future = item
+            try:
+                # Work cancelled while queued is skipped; its future is already resolved
+                if not future.set_running_or_notify_cancel():
+                    continue
+                if deadline is not None and time.monotonic() > deadline:
+                    with self._lock:
+                        self.stats["expired"] += 1
+                    future.set_exception(DeadlineExceededError(
+                        f"Deadline passed while queued for device {self.serial}"))
+                else:
+                    future.set_result(function(*args, **kwargs))
+                    with self._lock:
+                        self.stats["completed"] += 1
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    self.pending -= 1
+                    if priority > PRIORITY_INTERACTIVE:
+                        self.pending_background -= 1
+
+    def stop(self):
+        """Stop after the work already queued has run."""
+        self.queue.put((float('inf'), next(self._sequence), None))
+
+    def get_stats(self) -> Dict:
+        """Get queue depth and completed/rejected/expired counts."""
+        with self._lock:
+            return dict(self.stats, pending=self.pending, pending_background=self.pending_background)
+
+
+class DevicePool:
+    """One controller, worker thread and command queue per connected device.
+
+    Devices are added and removed as the registry reports them (or on
+    refresh() without a registry). Commands can target one serial, be
+    broadcast to every device, or go to the least busy device.
+    """
+
+    def __init__(self, transport, registry=None, frame_cache=None, max_queue: int = 32,
+                 **controller_options):
+        """
+        Args:
+            transport: Shared adb transport for all device controllers
+            registry: Optional DeviceRegistry used to follow hotplug events
+            frame_cache: Optional FrameCache shared with other controllers
+            max_queue: Per-device bound on queued work
+            **controller_options: Extra AndroidController options (e.g. capture_mode)
+        """
+        self.transport = transport
+        self.registry = registry
+        self.frame_cache = frame_cache
+        self.max_queue = max_queue
+        self.controller_options = controller_options
+        self.workers: Dict[str, DeviceWorker] = {}
+        self._lock = threading.Lock()
+
+        if registry is not None:
+            registry.add_listener(self._on_device_change)
+
+    def _on_device_change(self, serial: str, old_state: Optional[str], new_state: Optional[str]):
+        """Start a worker for newly authorized devices and stop it when they go away."""
+        if new_state == "device":
+            self._add(serial)
+        elif old_state == "device":
+            self._remove(serial)
+
+    def _add(self, serial: str) -> DeviceWorker:
+        """Create the worker for a serial if it does not exist yet."""
+        with self._lock:
+            worker = self.workers.get(serial)
+            if worker is None:
+                controller = AndroidController(
+                    transport=self.transport, registry=self.registry, device_id=serial,
+                    frame_cache=self.frame_cache, **self.controller_options
+                )
+                worker = DeviceWorker(controller, max_queue=self.max_queue)
+                self.workers[serial] = worker
+            return worker
+
+    def _remove(self, serial: str):
+        """Stop and forget the worker for a serial."""
+        with self._lock:
+            worker = self.workers.pop(serial, None)
+        if worker is not None:
+            worker.stop()
+            worker.controller.close(release_transport=False)
+
+    def refresh(self) -> List[str]:
+        """Sync workers with the current device list and return the ready serials."""
+        if self.registry is not None:
+            self.registry.start()
+            self.registry.wait_synced(timeout=0 if self.registry.last_error else 2.0)
+
+        if self.registry is not None and self.registry.is_synced():
+            devices = self.registry.get_devices()
+        else:
+            devices = self.transport.devices()
+
+        ready = {device["id"] for device in devices if device["status"] == "device"}
+        for serial in ready:
+            self._add(serial)
+        for serial in set(self.serials()) - ready:
+            self._remove(serial)
+        return sorted(ready)
+
+    def serials(self) -> List[str]:
+        """Get the serials that currently have a worker."""
+        with self._lock:
+            return sorted(self.workers)
+
+    def controller(self, serial: str) -> AndroidController:
+        """Get the controller for a serial."""
+        return self._worker(serial).controller
+
+    def _worker(self, serial: str) -> DeviceWorker:
+        """Get the worker for a serial."""
+        with self._lock:
+            worker = self.workers.get(serial)
+        if worker is None:
+            raise KeyError(f"Device {serial} is not connected")
+        return worker
+
+    def submit(self, serial: str, command: Dict, priority: int = PRIORITY_INTERACTIVE,
+               deadline: Optional[float] = None) -> Future:
+        """Queue a command for one device."""
+        return self._worker(serial).submit(command, priority=priority, deadline=deadline)
+
+    def submit_call(self, serial: str, function: Callable, *args, priority: int = PRIORITY_INTERACTIVE,
+                    deadline: Optional[float] = None, **kwargs) -> Future:
+        """Queue a device I/O call on one device's worker."""
+        return self._worker(serial).submit_call(function, *args, priority=priority,
+                                                deadline=deadline, **kwargs)
+
+    def broadcast(self, command: Dict, priority: int = PRIORITY_INTERACTIVE,
+                  deadline: Optional[float] = None) -> Dict[str, Future]:
+        """Queue a copy of the command on every device."""
+        return self.broadcast_call(lambda controller: controller.execute_command(dict(command)),
+                                   priority=priority, deadline=deadline)
+
+    def broadcast_call(self, function: Callable, *args, priority: int = PRIORITY_INTERACTIVE,
+                       deadline: Optional[float] = None, **kwargs) -> Dict[str, Future]:
+        """
+        Queue function(controller, *args, **kwargs) on every device's worker.
+
+        A device whose queue is full gets a future that has already failed
+        with QueueFullError, so one busy device does not stop the others.
+        """
+        with self._lock:
+            workers = list(self.workers.values())
+        futures = {}
+        for worker in workers:
+            try:
+                futures[worker.serial] = worker.submit_call(function, worker.controller, *args,
+                                                            priority=priority, deadline=deadline,
+                                                            **kwargs)
+            except QueueFullError as e:
+                futures[worker.serial] = Future()
+                futures[worker.serial].set_exception(e)
+        return futures
+
+    def least_busy(self) -> Optional[str]:
+        """Get the serial with the fewest pending commands, or None without devices."""
+        with self._lock:
+            if not self.workers:
+                return None
+            return min(self.workers.values(), key=lambda worker: worker.pending).serial
+
+    def select(self, selector: Optional[str], default: Optional[str] = None) -> List[str]:
+        """
+        Resolve a device selector to serials.
+
+        Args:
+            selector: A serial, "all" for every device, "any" for the least busy
+                one, or None for the default device
+            default: Serial used when selector is None
+        """
+        if selector == "all":
+            return self.serials()
+        if selector == "any":
+            serial = self.least_busy()
+            return [serial] if serial else []
+        serial = selector or default
+        if serial and serial not in self.serials():
+            # Devices can be reported before a worker has been created
+            self.refresh()
+        return [serial] if serial in self.serials() else []
+
+    def get_stats(self) -> Dict:
+        """Get per-device queue statistics."""
+        with self._lock:
+            return {serial: worker.get_stats() for serial, worker in self.workers.items()}
+
+    def close(self):
+        """Stop every worker."""
+        if self.registry is not None:
+            self.registry.remove_listener(self._on_device_change)
+        for serial in self.serials():
+            self._remove(serial)
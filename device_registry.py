@@ -0,0 +1,118 @@
+import threading
+from typing import Callable, Dict, List, Optional
+
+
+class DeviceRegistry:
+    """Event-driven view of attached devices backed by a `track-devices` stream.
+
+    The adb server pushes the full device list whenever a device is attached,
+    detached or changes state (e.g. unauthorized -> device), so lookups are
+    in-memory and no process is forked per check. Listeners are called as
+    callback(serial, old_state, new_state), with None meaning absent.
+    """
+
+    def __init__(self, transport, reconnect_delay: float = 2.0, max_reconnect_delay: float = 30.0):
+        """
+        Args:
+            transport: Any adb transport providing track_devices()
+            reconnect_delay: Initial seconds to wait before re-opening a dropped stream
+            max_reconnect_delay: Cap for the doubling reconnect delay
+        """
+        self.transport = transport
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.devices: Dict[str, str] = {}
+        self.connected = False
+        self.last_error: Optional[str] = None
+        self._listeners: List[Callable[[str, Optional[str], Optional[str]], None]] = []
+        self._synced = threading.Event()
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def add_listener(self, callback: Callable[[str, Optional[str], Optional[str]], None]):
+        """Register a callback for device state transitions."""
+        with self._lock:
+            self._listeners.append(callback)
+
+    def remove_listener(self, callback: Callable[[str, Optional[str], Optional[str]], None]):
+        """Unregister a previously added callback."""
+        with self._lock:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+
+    def start(self):
+        """Start tracking devices in the background (idempotent)."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        """Stop tracking after the next update from the stream."""
+        self._stopped.set()
+
+    def wait_synced(self, timeout: Optional[float] = None) -> bool:
+        """Wait until the live stream has delivered its current device list."""
+        return self._synced.wait(timeout)
+
+    def is_synced(self) -> bool:
+        """Return True while the registry mirrors a live stream."""
+        return self._synced.is_set()
+
+    def _run(self):
+        """Hold the track-devices stream open, reconnecting when it drops."""
+        delay = self.reconnect_delay
+        while not self._stopped.is_set():
+            try:
+                for device_list in self.transport.track_devices():
+                    self.connected = True
+                    self.last_error = None
+                    delay = self.reconnect_delay
+                    self._apply(device_list)
+                    self._synced.set()
+                    if self._stopped.is_set():
+                        return
+            except Exception as e:
+                if str(e) != self.last_error:
+                    print(f"Device tracking interrupted: {e}")
+                self.last_error = str(e)
+
+            # Without a live stream the cached list may be stale
+            self.connected = False
+            self._synced.clear()
+            self._stopped.wait(delay)
+            delay = min(self.max_reconnect_delay, delay * 2)
+
+    def _apply(self, device_list: List[Dict]):
+        """Replace the device map and notify listeners of every transition."""
+        current = {device["id"]: device["status"] for device in device_list}
+
+        with self._lock:
+            previous = self.devices
+            self.devices = current
+            listeners = list(self._listeners)
+
+        for serial in set(previous) | set(current):
+            old_state, new_state = previous.get(serial), current.get(serial)
+            if old_state == new_state:
+                continue
+            print(f"Device {serial}: {old_state or 'absent'} -> {new_state or 'absent'}")
+            for callback in listeners:
+                try:
+                    callback(serial, old_state, new_state)
+                except Exception as e:
+                    print(f"Device listener failed: {e}")
+
+    def get_devices(self) -> List[Dict]:
+        """Get attached devices as {"id", "status"} dicts."""
+        with self._lock:
+            return [{"id": serial, "status": status} for serial, status in self.devices.items()]
+
+    def get_state(self, serial: str) -> Optional[str]:
+        """Get a device's state ("device", "unauthorized", ...) or None if absent."""
+        with self._lock:
+            return self.devices.get(serial)
@@ -1,23 +1,151 @@
+import asyncio
 import ollama
+import hashlib
 import json
-import re
-from typing import Dict, List, Optional
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+import numpy as np
+from intent_matcher import IntentMatcher
+from intent_index import DEFAULT_INDEX_DIR, IntentIndex
+from parse_cache import ParseCache, normalize_command
+from json_scanner import JsonObjectScanner, extract_json_objects
+from action_registry import ACTION_SPECS, build_action_schema, build_plan_schema, validate_command
+from prompt_builder import EXAMPLES, PromptBuilder, estimate_tokens, render_prompt
+from screen_encoder import EncodedScreen, ScreenEncoder, rescale_coordinates
+
+SYSTEM_PROMPT = render_prompt(ACTION_SPECS, EXAMPLES)
+
+# Cached parse results are only reused for the prompt that produced them
+PROMPT_VERSION = hashlib.sha256(SYSTEM_PROMPT.encode('utf-8')).hexdigest()[:12]
+
+# Discriminated union over the registry's actions, passed as Ollama's
+# `format` so decoding is constrained to a valid command
+ACTION_SCHEMA = build_action_schema()
+
+# {"actions": [...]} for multi-step plans from a single call
+PLAN_SCHEMA = build_plan_schema()
+
+FULL_PROMPT_TOKENS = estimate_tokens(SYSTEM_PROMPT)
+
+# Shared by warm-up and real requests: a change to runner options (e.g.
+# num_ctx) makes Ollama reload the model and drop its prompt cache
+GENERATION_OPTIONS = {
+    'temperature': 0.1,
+    'top_p': 0.9,
+    # Nested commands (loop, conditional) need room; streaming stops at the
+    # closing brace so short commands never use the full budget
+    'num_predict': 256
+}
+
+# Plans need room for several actions; num_predict is a per-request
+# sampling option, so raising it does not reload the model
+PLAN_OPTIONS = dict(GENERATION_OPTIONS, num_predict=1024)
+
+WARMUP_COMMAND = "take a screenshot"
+
+# Offered as one-tap buttons by the web UI of both servers
+QUICK_COMMANDS = [
+    {"name": "Take Screenshot", "command": "take a screenshot"},
+    {"name": "Go Home", "command": "go to home screen"},
+    {"name": "Go Back", "command": "go back"},
+    {"name": "Scroll Down", "command": "scroll down"},
+    {"name": "Scroll Up", "command": "scroll up"},
+    {"name": "Open Camera", "command": "open camera app"},
+    {"name": "Open Settings", "command": "open settings"},
+    {"name": "Tap Center", "command": "tap in the center"},
+    {"name": "Volume Up", "command": "press volume up"},
+    {"name": "Volume Down", "command": "press volume down"}
+]
+
+# Default number of commands parse_commands sends to Ollama at once
+BATCH_PARALLELISM = 4
+
+# A small-model answer is only trusted if its action is among this many
+# actions ranked relevant to the input; otherwise the large model decides
+ROUTING_TOP_K = 5
 
 class GemmaController:
-    def __init__(self, model_name: str = "gemma3:latest"):
+    def __init__(self, model_name: str = "gemma3:latest", fast_path: bool = True,
+                 cache_size: int = 256, cache_path: Optional[str] = None, stream: bool = True,
+                 structured_output: bool = True, prompt_top_k: int = 0,
+                 keep_alive: Union[str, float] = -1,
+                 intent_index_dir: Optional[str] = DEFAULT_INDEX_DIR,
+                 small_model_name: Optional[str] = None, vision: bool = False,
+                 screen_encoder: Optional[ScreenEncoder] = None):
         """
         Initialize the Gemma controller with Ollama.
         
         Args:
             model_name: The Ollama model identifier (e.g., "gemma3:latest", "gemma2:2b")
+            fast_path: Resolve common commands with the rule-based matcher before Ollama
+            cache_size: Entries kept in the in-memory parse cache (0 disables caching)
+            cache_path: Optional SQLite file for a persistent, shareable parse cache
+            stream: Stream the model output and stop as soon as a JSON object is complete
+            structured_output: Constrain the output to ACTION_SCHEMA (needs ollama>=0.4.0)
+            prompt_top_k: Send only the k most relevant actions. 0 (the default) always
+                sends the byte-identical full prompt, whose evaluation Ollama caches
+                after warm-up; pruning only pays off where that cache is not kept
+            keep_alive: How long Ollama keeps the model loaded between requests
+                (-1 pins it in memory)
+            intent_index_dir: Directory of a prebuilt intent index (see intent_index.py)
+                used to resolve paraphrases of known commands; skipped if not built
+            small_model_name: Optional faster model (e.g. "gemma2:2b") tried first;
+                model_name is only asked when its answer fails validation or is ambiguous
+            vision: Attach the current screen to model requests so coordinates come
+                from what is actually shown (model_name must accept images, e.g. gemma3:4b+)
+            screen_encoder: Image preprocessing for vision requests (defaults to ScreenEncoder())
         """
         self.model_name = model_name
+        self.small_model_name = small_model_name
+        self.small_model_loaded = False
         self.client = ollama.Client()
         self.model_loaded = False
-        print(f"Using Ollama model: {self.model_name}")
+        self.keep_alive = keep_alive
+        self.warmup_seconds: Optional[float] = None
+        self._warming = threading.Lock()
+        self.intent_matcher = IntentMatcher() if fast_path else None
+        self.intent_index = self._load_intent_index(intent_index_dir)
+        self.screen_encoder = (screen_encoder or ScreenEncoder()) if vision else None
+        self.stream = stream
+        self.structured_output = structured_output
+        self.prompt_builder = PromptBuilder(top_k=prompt_top_k) if prompt_top_k > 0 else None
+        self._schemas: Dict[Tuple[str, ...], Dict] = {}
+        self.parse_cache = ParseCache(cache_size, cache_path) if cache_size > 0 else None
+        # Ranks actions by relevance to judge whether a small-model answer is plausible
+        self.router = PromptBuilder(top_k=ROUTING_TOP_K) if small_model_name else None
+        self.parse_stats = {"fast_path": 0, "cache": 0, "index": 0, "model": 0, "pruned_prompts": 0,
+                            "prompt_fallbacks": 0, "prompt_tokens": 0, "escalations": 0, "plans": 0,
+                            "vision": 0}
+        # Per model: requests sent to it and total seconds spent
+        self.tier_stats = {name: {"requests": 0, "seconds": 0.0}
+                           for name in (small_model_name, model_name) if name}
+        self._stats_lock = threading.Lock()
+        if small_model_name:
+            print(f"Using Ollama models: {small_model_name} -> {self.model_name}")
+        else:
+            print(f"Using Ollama model: {self.model_name}")
+    
+    def _load_intent_index(self, path: Optional[str]) -> Optional[IntentIndex]:
+        """Load the intent index if one has been built at path."""
+        if not path or not os.path.exists(os.path.join(path, "meta.json")):
+            return None
+        try:
+            index = IntentIndex(path)
+        except Exception as e:
+            print(f"Error loading intent index: {e}")
+            return None
+        print(f"Loaded intent index: {len(index)} examples")
+        return index
         
     def load_model(self):
-        """Check if the Ollama model is available."""
+        """Check that the Ollama model is available and warm it up.
+        
+        The model only counts as loaded once warm-up has succeeded.
+        """
         try:
             print(f"Checking Ollama model: {self.model_name}...")
             
@@ -25,545 +153,613 @@ class GemmaController:
             models = self.client.list()
             available_models = [model.model for model in models.models]
             
-            if self.model_name in available_models:
-                print(f"✅ Model {self.model_name} is available!")
-                self.model_loaded = True
-                return True
-            else:
-                print(f"❌ Model {self.model_name} not found.")
-                print(f"Available models: {available_models}")
-                return False
+            if self.check_available(available_models):
+                return self.mark_loaded(self.warm_up())
+            return False
                 
         except Exception as e:
             print(f"Error checking Ollama model: {e}")
             return False
     
-    def parse_command(self, user_input: str, screenshot_available: bool = False) -> Dict:
+    def mark_loaded(self, loaded: bool) -> bool:
+        """Record whether load_model succeeded and return it."""
+        self.model_loaded = loaded
+        return loaded
+    
+    def check_available(self, available_models: List[str]) -> bool:
+        """Report whether the main model is available and note whether the small one is."""
+        if self.model_name not in available_models:
+            print(f"❌ Model {self.model_name} not found.")
+            print(f"Available models: {available_models}")
+            return False
+        
+        print(f"✅ Model {self.model_name} is available!")
+        if self.small_model_name:
+            self.small_model_loaded = self.small_model_name in available_models
+            if not self.small_model_loaded:
+                print(f"⚠️ Small model {self.small_model_name} not found; "
+                      f"using {self.model_name} only")
+        return True
+    
+    def warm_up(self) -> bool:
+        """
+        Load the model into memory and prime Ollama's prompt cache.
+        
+        Sends the exact system prompt and options real requests use, so the
+        first command only evaluates its own short user message. With tiered
+        routing both models are warmed; if the small one fails it is dropped.
+        """
+        with self._warming:
+            start = time.time()
+            for model_name in self.tiers():
+                try:
+                    self.client.chat(**self.warm_up_request(model_name))
+                except Exception as e:
+                    if not self.warm_up_failed(model_name, e):
+                        return False
+            return self.finish_warm_up(start)
+    
+    def warm_up_request(self, model_name: str) -> Dict:
+        """Chat arguments that load a model and prime its prompt cache."""
+        print(f"Warming up {model_name}...")
+        return {
+            'model': model_name,
+            'messages': self._messages(SYSTEM_PROMPT, WARMUP_COMMAND),
+            'options': dict(GENERATION_OPTIONS, num_predict=1),
+            'keep_alive': self.keep_alive
+        }
+    
+    def warm_up_failed(self, model_name: str, error: Exception) -> bool:
+        """Drop a small model that failed to warm up; returns whether to go on."""
+        print(f"Error warming up model {model_name}: {error}")
+        if model_name == self.model_name:
+            return False
+        self.small_model_loaded = False
+        return True
+    
+    def finish_warm_up(self, start: float) -> bool:
+        """Record how long a successful warm-up took."""
+        self.warmup_seconds = time.time() - start
+        print(f"🔥 Model warmed up in {self.warmup_seconds:.1f}s")
+        return True
+    
+    def tiers(self) -> List[str]:
+        """Models to ask, fastest first."""
+        if self.small_model_name and self.small_model_loaded:
+            return [self.small_model_name, self.model_name]
+        return [self.model_name]
+    
+    def is_resident(self) -> Optional[bool]:
+        """Check whether Ollama currently has every model in memory (None if unknown)."""
+        try:
+            running = {model.model for model in self.client.ps().models}
+            return all(model_name in running for model_name in self.tiers())
+        except Exception:
+            return None
+    
+    def ensure_warm(self):
+        """Re-warm in the background if the model was unloaded (e.g. Ollama restarted)."""
+        if not self.model_loaded or self._warming.locked() or self.is_resident() is not False:
+            return
+        thread = threading.Thread(target=self.warm_up)
+        thread.daemon = True
+        thread.start()
+    
+    def _messages(self, system_prompt: str, user_input: str, plan: bool = False,
+                  screen: Optional[EncodedScreen] = None) -> List[Dict]:
+        """Build the chat messages; the system message must stay byte-identical for cache hits."""
+        if plan:
+            # Only the user message changes, so plans reuse the cached system prompt
+            content = (f'Convert these commands into an ordered plan: "{user_input}"\n'
+                       'Respond with {"actions": [...]}, one action per step, in the order given.')
+        else:
+            content = f'Convert this command: "{user_input}"'
+        user_message = {
+            'role': 'user', 
+            'content': content
+        }
+        if screen is not None:
+            user_message['content'] += (f'\nThe attached image is the current screen, {screen.width}x{screen.height} '
+                                        'pixels. Give coordinates in pixels of this image.')
+            user_message['images'] = [screen.image]
+        return [
+            {
+                'role': 'system',
+                'content': system_prompt
+            },
+            user_message
+        ]
+    
+    def parse_command(self, user_input: str, screenshot_available: bool = False,
+                      capture_screen: Optional[Callable[[], np.ndarray]] = None) -> Dict:
         """
         Parse user input and convert it to Android control commands using Ollama.
         
         Args:
             user_input: Natural language command from user
             screenshot_available: Whether a screenshot is available for context
+            capture_screen: Returns the current RGBA frame; in vision mode it is
+                called only if the command needs the model
             
         Returns:
             Dictionary containing parsed command information
         """
+        # Answers that depend on what is on screen cannot be reused
+        use_screen = self.screen_encoder is not None and capture_screen is not None
+        
+        resolved = self.resolve_locally(user_input, use_cache=not use_screen)
+        if resolved is not None:
+            return resolved[0]
+        return self._resolve_with_model(user_input, capture_screen if use_screen else None)
+    
+    def parse_commands(self, inputs: List[str], parallelism: int = BATCH_PARALLELISM) -> List[Dict]:
+        """
+        Parse many commands, querying the model for several at once.
+        
+        Inputs are deduplicated (after cache normalization), fast-path, cache
+        and index hits are answered immediately, and the rest are sent to
+        Ollama from up to `parallelism` threads. Ollama only runs them
+        concurrently up to its OLLAMA_NUM_PARALLEL setting.
+        
+        Returns:
+            One {"input", "result", "source", "seconds"} dict per input, in
+            input order. source is fast_path, cache, index, model or duplicate.
+        """
+        results, first, pending = self.begin_batch(inputs)
+        
+        if pending:
+            with ThreadPoolExecutor(max_workers=min(parallelism, len(pending))) as executor:
+                futures = {index: executor.submit(self._timed_model_parse, inputs[index]) for index in pending}
+                for index, future in futures.items():
+                    command, seconds = future.result()
+                    results[index] = {"input": inputs[index], "result": command, "source": "model",
+                                      "seconds": seconds}
+        
+        return self.finish_batch(inputs, results, first)
+    
+    def begin_batch(self, inputs: List[str]) -> Tuple[List[Optional[Dict]], Dict[str, int], List[int]]:
+        """
+        Answer what a batch can answer locally.
+        
+        Returns the results so far, the index of each input's first
+        occurrence by normalized key, and the indices that need the model.
+        """
+        results: List[Optional[Dict]] = [None] * len(inputs)
+        first: Dict[str, int] = {}
+        pending = []
+        for index, user_input in enumerate(inputs):
+            key = normalize_command(user_input)
+            if key in first:
+                continue
+            first[key] = index
+            
+            start = time.perf_counter()
+            resolved = self.resolve_locally(user_input)
+            if resolved is None:
+                pending.append(index)
+                continue
+            command, source = resolved
+            results[index] = {"input": user_input, "result": command, "source": source,
+                              "seconds": time.perf_counter() - start}
+        return results, first, pending
+    
+    def finish_batch(self, inputs: List[str], results: List[Optional[Dict]],
+                      first: Dict[str, int]) -> List[Dict]:
+        """Copy each first occurrence's result to its duplicates."""
+        for index, user_input in enumerate(inputs):
+            if results[index] is None:
+                original = results[first[normalize_command(user_input)]]
+                results[index] = {"input": user_input, "result": dict(original["result"]),
+                                  "source": "duplicate", "seconds": 0.0}
+        return results
+    
+    def _timed_model_parse(self, user_input: str) -> Tuple[Dict, float]:
+        """Parse with the model and return (command, seconds taken)."""
+        start = time.perf_counter()
+        command = self._resolve_with_model(user_input)
+        return command, time.perf_counter() - start
+    
+    def _cache_key(self, user_input: str) -> str:
+        """Parse cache key for an input under the current models and prompt."""
+        prompt_version = f"{PROMPT_VERSION}-k{self.prompt_builder.top_k if self.prompt_builder else 0}"
+        return ParseCache.make_key(user_input, "->".join(self.tiers()), prompt_version)
+    
+    def matches_locally(self, user_input: str) -> bool:
+        """
+        Whether the fast path or the intent index resolves the input.
+
+        Unlike parse_command this touches no counters or cache entries, so
+        callers can use it to decide whether to prepare for a model call
+        (e.g. capture the screen early in vision mode).
+        """
+        if self.intent_matcher is not None and self.intent_matcher.match(user_input) is not None:
+            return True
+        if self.intent_index is not None:
+            command = self.intent_index.match(user_input)
+            return command is not None and "error" not in validate_command(dict(command))
+        return False
+    
+    def resolve_locally(self, user_input: str, use_cache: bool = True) -> Optional[Tuple[Dict, str]]:
+        """Resolve a command without the model: returns (command, source) or None."""
+        # Unambiguous common commands skip the model round trip entirely
+        if self.intent_matcher is not None:
+            command = self.intent_matcher.match(user_input)
+            if command is not None:
+                self.count("fast_path")
+                return self._validate_command(command), "fast_path"
+        
+        # Repeated commands are answered from the cache without the model
+        if self.parse_cache is not None and use_cache:
+            command = self.parse_cache.get(self._cache_key(user_input))
+            if command is not None:
+                self.count("cache")
+                return command, "cache"
+        
+        # Paraphrases of known commands are resolved by nearest neighbour
+        if self.intent_index is not None:
+            command = self.intent_index.match(user_input)
+            if command is not None:
+                command = self._validate_command(command)
+                if "error" not in command:
+                    self.count("index")
+                    return command, "index"
+        return None
+    
+    def _resolve_with_model(self, user_input: str,
+                            capture_screen: Optional[Callable[[], np.ndarray]] = None) -> Dict:
+        """Parse with the model (and the screen, if a capture is given), falling back to rules."""
         if not self.model_loaded:
             return {"error": "Model not loaded"}
         
-        # Create a structured prompt for command parsing
-        system_prompt = """You are an Android device controller. Convert natural language commands into structured JSON actions.
-
-Available actions:
-- tap: {"action": "tap", "x": int, "y": int}
-- long_press: {"action": "long_press", "x": int, "y": int, "duration": int}
-- double_tap: {"action": "double_tap", "x": int, "y": int}
-- swipe: {"action": "swipe", "start_x": int, "start_y": int, "end_x": int, "end_y": int, "duration": int}
-- pinch: {"action": "pinch", "x": int, "y": int, "scale": float}
-- zoom: {"action": "zoom", "x": int, "y": int, "scale": float}
-- type: {"action": "type", "text": "string"}
-- clear_text: {"action": "clear_text"}
-- paste: {"action": "paste"}
-- copy: {"action": "copy"}
-- cut: {"action": "cut"}
-- key: {"action": "key", "keycode": "BACK|HOME|MENU|POWER|VOLUME_UP|VOLUME_DOWN|ENTER|DELETE|TAB|SPACE|SEARCH|CAMERA|CALL|ENDCALL"}
-- app: {"action": "app", "package": "com.example.app"}
-- app_info: {"action": "app_info", "package": "com.example.app"}
-- force_stop: {"action": "force_stop", "package": "com.example.app"}
-- uninstall: {"action": "uninstall", "package": "com.example.app"}
-- install: {"action": "install", "apk_path": "/path/to/app.apk"}
-- screenshot: {"action": "screenshot"}
-- screen_record: {"action": "screen_record", "duration": int}
-- scroll: {"action": "scroll", "direction": "up|down|left|right", "distance": int}
-- fling: {"action": "fling", "direction": "up|down|left|right", "velocity": int}
-- drag: {"action": "drag", "start_x": int, "start_y": int, "end_x": int, "end_y": int, "duration": int}
-- rotate: {"action": "rotate", "orientation": "portrait|landscape|reverse_portrait|reverse_landscape"}
-- brightness: {"action": "brightness", "level": int}
-- volume: {"action": "volume", "level": int, "stream": "music|ring|alarm|notification"}
-- wifi: {"action": "wifi", "enabled": bool}
-- bluetooth: {"action": "bluetooth", "enabled": bool}
-- airplane_mode: {"action": "airplane_mode", "enabled": bool}
-- location: {"action": "location", "enabled": bool}
-- notification_panel: {"action": "notification_panel", "expand": bool}
-- quick_settings: {"action": "quick_settings"}
-- recent_apps: {"action": "recent_apps"}
-- split_screen: {"action": "split_screen", "app1": "package1", "app2": "package2"}
-- picture_in_picture: {"action": "picture_in_picture"}
-- accessibility: {"action": "accessibility", "service": "talkback|magnification", "enabled": bool}
-- developer_options: {"action": "developer_options", "option": "usb_debugging|show_touches|pointer_location", "enabled": bool}
-- system_ui: {"action": "system_ui", "component": "status_bar|navigation_bar", "visible": bool}
-- input_method: {"action": "input_method", "ime": "keyboard_package"}
-- language: {"action": "language", "locale": "en_US|es_ES|fr_FR|de_DE|ja_JP|ko_KR|zh_CN"}
-- timezone: {"action": "timezone", "zone": "America/New_York|Europe/London|Asia/Tokyo"}
-- auto_rotate: {"action": "auto_rotate", "enabled": bool}
-- sleep_timeout: {"action": "sleep_timeout", "seconds": int}
-- font_size: {"action": "font_size", "scale": float}
-- display_size: {"action": "display_size", "scale": float}
-- dark_mode: {"action": "dark_mode", "enabled": bool}
-- do_not_disturb: {"action": "do_not_disturb", "enabled": bool}
-- battery_saver: {"action": "battery_saver", "enabled": bool}
-- data_saver: {"action": "data_saver", "enabled": bool}
-- hotspot: {"action": "hotspot", "enabled": bool}
-- nfc: {"action": "nfc", "enabled": bool}
-- cast_screen: {"action": "cast_screen", "device": "device_name"}
-- backup: {"action": "backup", "type": "full|app_data"}
-- factory_reset: {"action": "factory_reset", "confirm": bool}
-- reboot: {"action": "reboot", "mode": "normal|recovery|bootloader"}
-- shutdown: {"action": "shutdown"}
-- wake_up: {"action": "wake_up"}
-- lock_screen: {"action": "lock_screen"}
-- unlock_screen: {"action": "unlock_screen", "method": "swipe|pin|pattern|fingerprint", "credential": "string"}
-- emergency_call: {"action": "emergency_call"}
-- flashlight: {"action": "flashlight", "enabled": bool}
-- camera_flash: {"action": "camera_flash", "mode": "on|off|auto|torch"}
-- vibrate: {"action": "vibrate", "pattern": [int], "amplitude": int}
-- play_sound: {"action": "play_sound", "file": "/path/to/sound.mp3", "volume": float}
-- tts: {"action": "tts", "text": "string", "language": "en|es|fr|de|ja|ko|zh"}
-- ocr: {"action": "ocr", "region": {"x": int, "y": int, "width": int, "height": int}}
-- find_element: {"action": "find_element", "method": "text|id|class|xpath", "value": "string"}
-- wait_for_element: {"action": "wait_for_element", "method": "text|id|class|xpath", "value": "string", "timeout": int}
-- assert_element: {"action": "assert_element", "method": "text|id|class|xpath", "value": "string", "exists": bool}
-- get_element_bounds: {"action": "get_element_bounds", "method": "text|id|class|xpath", "value": "string"}
-- get_screen_info: {"action": "get_screen_info"}
-- get_device_info: {"action": "get_device_info"}
-- get_battery_info: {"action": "get_battery_info"}
-- get_network_info: {"action": "get_network_info"}
-- get_storage_info: {"action": "get_storage_info"}
-- get_running_apps: {"action": "get_running_apps"}
-- get_installed_apps: {"action": "get_installed_apps"}
-- get_system_settings: {"action": "get_system_settings", "namespace": "system|secure|global"}
-- set_system_setting: {"action": "set_system_setting", "namespace": "system|secure|global", "key": "string", "value": "string"}
-- shell_command: {"action": "shell_command", "command": "string"}
-- file_operation: {"action": "file_operation", "operation": "copy|move|delete|create|read", "source": "/path", "destination": "/path"}
-- permission: {"action": "permission", "package": "com.example.app", "permission": "android.permission.CAMERA", "grant": bool}
-- intent: {"action": "intent", "action": "android.intent.action.VIEW", "data": "content://", "extras": {}}
-- broadcast: {"action": "broadcast", "action": "com.example.CUSTOM_ACTION", "extras": {}}
-- service: {"action": "service", "operation": "start|stop", "component": "com.example/.MyService"}
-- activity: {"action": "activity", "operation": "start|finish", "component": "com.example/.MainActivity"}
-- monkey_test: {"action": "monkey_test", "package": "com.example.app", "events": int, "seed": int}
-- stress_test: {"action": "stress_test", "type": "cpu|memory|storage|network", "duration": int}
-- performance_test: {"action": "performance_test", "package": "com.example.app", "duration": int}
-- memory_dump: {"action": "memory_dump", "package": "com.example.app", "output": "/path/to/dump"}
-- cpu_profile: {"action": "cpu_profile", "package": "com.example.app", "duration": int}
-- network_monitor: {"action": "network_monitor", "package": "com.example.app", "duration": int}
-- log_capture: {"action": "log_capture", "level": "verbose|debug|info|warn|error", "tag": "string", "duration": int}
-- crash_report: {"action": "crash_report", "package": "com.example.app"}
-- anr_report: {"action": "anr_report", "package": "com.example.app"}
-- security_scan: {"action": "security_scan", "package": "com.example.app"}
-- accessibility_scan: {"action": "accessibility_scan"}
-- ui_hierarchy: {"action": "ui_hierarchy", "format": "xml|json"}
-- element_screenshot: {"action": "element_screenshot", "method": "text|id|class|xpath", "value": "string"}
-- compare_screenshots: {"action": "compare_screenshots", "image1": "/path1", "image2": "/path2", "threshold": float}
-- visual_test: {"action": "visual_test", "baseline": "/path/to/baseline.png", "threshold": float}
-- gesture_record: {"action": "gesture_record", "name": "gesture_name", "duration": int}
-- gesture_play: {"action": "gesture_play", "name": "gesture_name"}
-- macro_record: {"action": "macro_record", "name": "macro_name"}
-- macro_play: {"action": "macro_play", "name": "macro_name"}
-- conditional: {"action": "conditional", "condition": {"method": "text|id|class|xpath", "value": "string", "exists": bool}, "then": {}, "else": {}}
-- loop: {"action": "loop", "count": int, "actions": [{}]}
-- wait: {"action": "wait", "seconds": int}
-- random_action: {"action": "random_action", "actions": ["tap|swipe|scroll"], "count": int}
-
-Examples:
-User: "Take a screenshot"
-Response: {"action": "screenshot"}
-
-User: "Record screen for 30 seconds"
-Response: {"action": "screen_record", "duration": 30}
-
-User: "Go back"
-Response: {"action": "key", "keycode": "BACK"}
-
-User: "Open camera"
-Response: {"action": "app", "package": "com.android.camera"}
-
-User: "Type hello world"
-Response: {"action": "type", "text": "hello world"}
-
-User: "Scroll down"
-Response: {"action": "scroll", "direction": "down"}
-
-User: "Long press in the center"
-Response: {"action": "long_press", "x": 540, "y": 960, "duration": 1000}
-
-User: "Turn on WiFi"
-Response: {"action": "wifi", "enabled": true}
-
-User: "Set brightness to 50%"
-Response: {"action": "brightness", "level": 128}
-
-User: "Rotate to landscape"
-Response: {"action": "rotate", "orientation": "landscape"}
-
-User: "Enable dark mode"
-Response: {"action": "dark_mode", "enabled": true}
-
-User: "Get device info"
-Response: {"action": "get_device_info"}
-
-User: "Find element with text Login"
-Response: {"action": "find_element", "method": "text", "value": "Login"}
-
-User: "Swipe from left to right"
-Response: {"action": "swipe", "start_x": 100, "start_y": 960, "end_x": 980, "end_y": 960, "duration": 300}
-
-User: "Pinch to zoom out"
-Response: {"action": "pinch", "x": 540, "y": 960, "scale": 0.5}
-
-User: "Open notification panel"
-Response: {"action": "notification_panel", "expand": true}
-
-User: "Turn on flashlight"
-Response: {"action": "flashlight", "enabled": true}
-
-User: "Reboot device"
-Response: {"action": "reboot", "mode": "normal"}
-
-User: "Wait 3 seconds"
-Response: {"action": "wait", "seconds": 3}
-
-IMPORTANT: Respond ONLY with valid JSON. No explanations or additional text.
-
-Convert this command: "{user_input}"
-"""
-
+        self.count("model")
+        
         try:
-            # Send request to Ollama
-            response = self.client.chat(
-                model=self.model_name,
-                messages=[
-                    {
-                        'role': 'system',
-                        'content': system_prompt
-                    },
-                    {
-                        'role': 'user', 
-                        'content': f'Convert this command: "{user_input}"'
-                    }
-                ],
-                options={
-                    'temperature': 0.1,
-                    'top_p': 0.9,
-                    'num_predict': 100
-                }
-            )
-            
-            # Extract the response
-            response_text = response['message']['content'].strip()
-            
-            # Try to extract JSON from the response
-            json_match = re.search(r'\{[^}]*\}', response_text)
-            if json_match:
-                try:
-                    command_json = json.loads(json_match.group())
-                    return self._validate_command(command_json)
-                except json.JSONDecodeError:
-                    pass
+            frame = self._capture(capture_screen) if capture_screen is not None else None
+            if frame is not None:
+                command = self._parse_with_screen(user_input, frame)
+            else:
+                command = self._parse_with_tiers(user_input)
             
-            # Fallback: parse common commands manually
-            return self._fallback_parse(user_input)
+            return self.finish_model_parse(user_input, command, cacheable=frame is None)
             
         except Exception as e:
             print(f"Error parsing command with Ollama: {e}")
-            return self._fallback_parse(user_input)
+            return self.fallback_parse(user_input)
     
-    def _validate_command(self, command: Dict) -> Dict:
-        """Validate and sanitize the parsed command."""
-        if "action" not in command:
-            return {"error": "No action specified"}
-        
-        action = command["action"]
-        
-        # Validate required parameters for each action
-        if action == "tap":
-            if "x" not in command or "y" not in command:
-                return {"error": "Tap action requires x and y coordinates"}
-            command["x"] = max(0, min(1080, int(command["x"])))
-            command["y"] = max(0, min(1920, int(command["y"])))
-            
-        elif action == "long_press":
-            if "x" not in command or "y" not in command:
-                return {"error": "Long press action requires x and y coordinates"}
-            command["x"] = max(0, min(1080, int(command["x"])))
-            command["y"] = max(0, min(1920, int(command["y"])))
-            command["duration"] = max(500, min(10000, int(command.get("duration", 1000))))
-            
-        elif action == "double_tap":
-            if "x" not in command or "y" not in command:
-                return {"error": "Double tap action requires x and y coordinates"}
-            command["x"] = max(0, min(1080, int(command["x"])))
-            command["y"] = max(0, min(1920, int(command["y"])))
-            
-        elif action == "swipe":
-            required = ["start_x", "start_y", "end_x", "end_y"]
-            if not all(param in command for param in required):
-                return {"error": "Swipe action requires start_x, start_y, end_x, end_y"}
-            for param in required:
-                command[param] = max(0, min(1080 if "x" in param else 1920, int(command[param])))
-            command["duration"] = max(100, min(5000, int(command.get("duration", 300))))
-            
-        elif action in ["pinch", "zoom"]:
-            if "x" not in command or "y" not in command or "scale" not in command:
-                return {"error": f"{action} action requires x, y coordinates and scale"}
-            command["x"] = max(0, min(1080, int(command["x"])))
-            command["y"] = max(0, min(1920, int(command["y"])))
-            command["scale"] = max(0.1, min(10.0, float(command["scale"])))
-            
-        elif action == "drag":
-            required = ["start_x", "start_y", "end_x", "end_y"]
-            if not all(param in command for param in required):
-                return {"error": "Drag action requires start_x, start_y, end_x, end_y"}
-            for param in required:
-                command[param] = max(0, min(1080 if "x" in param else 1920, int(command[param])))
-            command["duration"] = max(100, min(5000, int(command.get("duration", 1000))))
-                
-        elif action == "type":
-            if "text" not in command:
-                return {"error": "Type action requires text"}
-            command["text"] = str(command["text"])[:1000]
-            
-        elif action == "key":
-            valid_keys = ["BACK", "HOME", "MENU", "POWER", "VOLUME_UP", "VOLUME_DOWN", 
-                         "ENTER", "DELETE", "TAB", "SPACE", "SEARCH", "CAMERA", "CALL", "ENDCALL"]
-            if "keycode" not in command or command["keycode"] not in valid_keys:
-                return {"error": f"Key action requires valid keycode: {valid_keys}"}
-                
-        elif action in ["app", "app_info", "force_stop", "uninstall"]:
-            if "package" not in command:
-                return {"error": f"{action} action requires package name"}
-                
-        elif action == "install":
-            if "apk_path" not in command:
-                return {"error": "Install action requires apk_path"}
-                
-        elif action == "screen_record":
-            command["duration"] = max(1, min(300, int(command.get("duration", 30))))
-            
-        elif action == "scroll":
-            valid_directions = ["up", "down", "left", "right"]
-            if "direction" not in command or command["direction"] not in valid_directions:
-                return {"error": f"Scroll action requires valid direction: {valid_directions}"}
-            command["distance"] = max(100, min(2000, int(command.get("distance", 500))))
-            
-        elif action == "fling":
-            valid_directions = ["up", "down", "left", "right"]
-            if "direction" not in command or command["direction"] not in valid_directions:
-                return {"error": f"Fling action requires valid direction: {valid_directions}"}
-            command["velocity"] = max(100, min(5000, int(command.get("velocity", 1000))))
-            
-        elif action == "rotate":
-            valid_orientations = ["portrait", "landscape", "reverse_portrait", "reverse_landscape"]
-            if "orientation" not in command or command["orientation"] not in valid_orientations:
-                return {"error": f"Rotate action requires valid orientation: {valid_orientations}"}
-                
-        elif action == "brightness":
-            if "level" not in command:
-                return {"error": "Brightness action requires level (0-255)"}
-            command["level"] = max(0, min(255, int(command["level"])))
-            
-        elif action == "volume":
-            if "level" not in command:
-                return {"error": "Volume action requires level (0-100)"}
-            command["level"] = max(0, min(100, int(command["level"])))
-            valid_streams = ["music", "ring", "alarm", "notification"]
-            if "stream" in command and command["stream"] not in valid_streams:
-                return {"error": f"Volume stream must be one of: {valid_streams}"}
-            command["stream"] = command.get("stream", "music")
-            
-        elif action in ["wifi", "bluetooth", "airplane_mode", "location", "auto_rotate", 
-                       "dark_mode", "do_not_disturb", "battery_saver", "data_saver", 
-                       "hotspot", "nfc", "flashlight"]:
-            if "enabled" not in command:
-                return {"error": f"{action} action requires enabled (true/false)"}
-            command["enabled"] = bool(command["enabled"])
-            
-        elif action == "notification_panel":
-            if "expand" not in command:
-                return {"error": "Notification panel action requires expand (true/false)"}
-            command["expand"] = bool(command["expand"])
-            
-        elif action == "split_screen":
-            if "app1" not in command or "app2" not in command:
-                return {"error": "Split screen action requires app1 and app2 package names"}
-                
-        elif action == "accessibility":
-            valid_services = ["talkback", "magnification"]
-            if "service" not in command or command["service"] not in valid_services:
-                return {"error": f"Accessibility action requires valid service: {valid_services}"}
-            if "enabled" not in command:
-                return {"error": "Accessibility action requires enabled (true/false)"}
-            command["enabled"] = bool(command["enabled"])
-            
-        elif action == "developer_options":
-            valid_options = ["usb_debugging", "show_touches", "pointer_location"]
-            if "option" not in command or command["option"] not in valid_options:
-                return {"error": f"Developer options action requires valid option: {valid_options}"}
-            if "enabled" not in command:
-                return {"error": "Developer options action requires enabled (true/false)"}
-            command["enabled"] = bool(command["enabled"])
-            
-        elif action == "system_ui":
-            valid_components = ["status_bar", "navigation_bar"]
-            if "component" not in command or command["component"] not in valid_components:
-                return {"error": f"System UI action requires valid component: {valid_components}"}
-            if "visible" not in command:
-                return {"error": "System UI action requires visible (true/false)"}
-            command["visible"] = bool(command["visible"])
-            
-        elif action == "input_method":
-            if "ime" not in command:
-                return {"error": "Input method action requires ime package"}
-                
-        elif action == "language":
-            valid_locales = ["en_US", "es_ES", "fr_FR", "de_DE", "ja_JP", "ko_KR", "zh_CN"]
-            if "locale" not in command or command["locale"] not in valid_locales:
-                return {"error": f"Language action requires valid locale: {valid_locales}"}
-                
-        elif action == "timezone":
-            valid_zones = ["America/New_York", "Europe/London", "Asia/Tokyo"]
-            if "zone" not in command or command["zone"] not in valid_zones:
-                return {"error": f"Timezone action requires valid zone: {valid_zones}"}
-                
-        elif action == "sleep_timeout":
-            if "seconds" not in command:
-                return {"error": "Sleep timeout action requires seconds"}
-            command["seconds"] = max(15, min(1800, int(command["seconds"])))
-            
-        elif action in ["font_size", "display_size"]:
-            if "scale" not in command:
-                return {"error": f"{action} action requires scale (0.5-2.0)"}
-            command["scale"] = max(0.5, min(2.0, float(command["scale"])))
-            
-        elif action == "unlock_screen":
-            valid_methods = ["swipe", "pin", "pattern", "fingerprint"]
-            if "method" not in command or command["method"] not in valid_methods:
-                return {"error": f"Unlock screen action requires valid method: {valid_methods}"}
-            if command["method"] in ["pin", "pattern"] and "credential" not in command:
-                return {"error": f"Unlock method {command['method']} requires credential"}
-                
-        elif action == "camera_flash":
-            valid_modes = ["on", "off", "auto", "torch"]
-            if "mode" not in command or command["mode"] not in valid_modes:
-                return {"error": f"Camera flash action requires valid mode: {valid_modes}"}
-                
-        elif action == "vibrate":
-            if "pattern" in command and not isinstance(command["pattern"], list):
-                return {"error": "Vibrate pattern must be a list of integers"}
-            command["amplitude"] = max(1, min(255, int(command.get("amplitude", 128))))
-            
-        elif action == "play_sound":
-            if "file" not in command:
-                return {"error": "Play sound action requires file path"}
-            command["volume"] = max(0.0, min(1.0, float(command.get("volume", 1.0))))
-            
-        elif action == "tts":
-            if "text" not in command:
-                return {"error": "TTS action requires text"}
-            valid_languages = ["en", "es", "fr", "de", "ja", "ko", "zh"]
-            command["language"] = command.get("language", "en")
-            if command["language"] not in valid_languages:
-                return {"error": f"TTS language must be one of: {valid_languages}"}
-                
-        elif action in ["find_element", "wait_for_element", "assert_element", "get_element_bounds", "element_screenshot"]:
-            valid_methods = ["text", "id", "class", "xpath"]
-            if "method" not in command or command["method"] not in valid_methods:
-                return {"error": f"{action} requires valid method: {valid_methods}"}
-            if "value" not in command:
-                return {"error": f"{action} requires value"}
-            if action == "wait_for_element":
-                command["timeout"] = max(1, min(60, int(command.get("timeout", 10))))
-            if action == "assert_element" and "exists" not in command:
-                return {"error": "Assert element action requires exists (true/false)"}
-                
-        elif action == "ocr":
-            if "region" in command:
-                region = command["region"]
-                if not all(key in region for key in ["x", "y", "width", "height"]):
-                    return {"error": "OCR region requires x, y, width, height"}
-                    
-        elif action == "shell_command":
-            if "command" not in command:
-                return {"error": "Shell command action requires command"}
-                
-        elif action == "file_operation":
-            valid_operations = ["copy", "move", "delete", "create", "read"]
-            if "operation" not in command or command["operation"] not in valid_operations:
-                return {"error": f"File operation requires valid operation: {valid_operations}"}
-            if command["operation"] in ["copy", "move"] and "destination" not in command:
-                return {"error": f"File {command['operation']} requires destination"}
-            if "source" not in command:
-                return {"error": "File operation requires source path"}
-                
-        elif action == "permission":
-            if not all(key in command for key in ["package", "permission", "grant"]):
-                return {"error": "Permission action requires package, permission, and grant"}
-            command["grant"] = bool(command["grant"])
-            
-        elif action in ["monkey_test", "performance_test"]:
-            if "package" not in command:
-                return {"error": f"{action} requires package name"}
-            if action == "monkey_test":
-                command["events"] = max(1, min(10000, int(command.get("events", 100))))
-                command["seed"] = int(command.get("seed", 1))
-            else:
-                command["duration"] = max(1, min(300, int(command.get("duration", 60))))
-                
-        elif action == "stress_test":
-            valid_types = ["cpu", "memory", "storage", "network"]
-            if "type" not in command or command["type"] not in valid_types:
-                return {"error": f"Stress test requires valid type: {valid_types}"}
-            command["duration"] = max(1, min(300, int(command.get("duration", 60))))
-            
-        elif action == "ui_hierarchy":
-            valid_formats = ["xml", "json"]
-            command["format"] = command.get("format", "xml")
-            if command["format"] not in valid_formats:
-                return {"error": f"UI hierarchy format must be one of: {valid_formats}"}
-                
-        elif action == "compare_screenshots":
-            if not all(key in command for key in ["image1", "image2"]):
-                return {"error": "Compare screenshots requires image1 and image2 paths"}
-            command["threshold"] = max(0.0, min(1.0, float(command.get("threshold", 0.9))))
-            
-        elif action == "visual_test":
-            if "baseline" not in command:
-                return {"error": "Visual test requires baseline image path"}
-            command["threshold"] = max(0.0, min(1.0, float(command.get("threshold", 0.9))))
-            
-        elif action in ["gesture_record", "macro_record"]:
-            if "name" not in command:
-                return {"error": f"{action} requires name"}
-            if action == "gesture_record":
-                command["duration"] = max(1, min(60, int(command.get("duration", 10))))
-                
-        elif action in ["gesture_play", "macro_play"]:
-            if "name" not in command:
-                return {"error": f"{action} requires name"}
-                
-        elif action == "conditional":
-            if "condition" not in command or "then" not in command:
-                return {"error": "Conditional action requires condition and then"}
-                
-        elif action == "loop":
-            if "count" not in command or "actions" not in command:
-                return {"error": "Loop action requires count and actions"}
-            command["count"] = max(1, min(100, int(command["count"])))
+    def finish_model_parse(self, user_input: str, command: Optional[Dict], cacheable: bool) -> Dict:
+        """Cache a model answer, or fall back to the rules if there was none."""
+        if command is None:
+            # Fallback: parse common commands manually
+            return self.fallback_parse(user_input)
+        
+        # Only model results are cached; fallback guesses are not
+        if self.parse_cache is not None and cacheable and "error" not in command:
+            self.parse_cache.put(self._cache_key(user_input), command)
+        return command
+    
+    def _parse_with_tiers(self, user_input: str) -> Optional[Dict]:
+        """Ask the fastest model first and escalate while its answer is invalid or implausible."""
+        command = None
+        for model_name in self.tiers():
+            try:
+                command, error = self._parse_with_model(model_name, user_input), None
+            except Exception as e:
+                command, error = None, e
+            if not self.escalate(model_name, user_input, command, error):
+                break
+        return command
+    
+    def escalate(self, model_name: str, user_input: str, command: Optional[Dict],
+                 error: Optional[Exception] = None) -> bool:
+        """
+        Decide whether to ask the next tier after model_name answered.
+        
+        The last tier's answer (or error) is final; an earlier tier that
+        failed or gave an implausible answer is escalated.
+        """
+        if model_name == self.tiers()[-1]:
+            if error is not None:
+                raise error
+            return False
+        if error is not None:
+            print(f"Error parsing command with {model_name}: {error}")
+        elif self._is_confident(user_input, command):
+            return False
+        self.count("escalations")
+        return True
+    
+    def _capture(self, capture_screen: Callable[[], np.ndarray]) -> Optional[np.ndarray]:
+        """Capture the screen for a vision request, or None to parse from text alone."""
+        try:
+            return capture_screen()
+        except Exception as e:
+            print(f"Screen capture for parsing failed, using text only: {e}")
+            return None
+    
+    def _parse_with_screen(self, user_input: str, frame: np.ndarray) -> Optional[Dict]:
+        """
+        Ask the main model with the current screen attached.
+        
+        The model answers in the downscaled image's pixels; coordinates are
+        mapped back to the frame's (the device's) resolution.
+        """
+        self.count("vision")
+        screen = self.screen_encoder.encode(frame)
+        with self.timed(self.model_name):
+            command = self._query_model(self.model_name, user_input, SYSTEM_PROMPT,
+                                        ACTION_SCHEMA if self.structured_output else None, screen=screen)
+        
+        if command is not None and "error" not in command:
+            height, width = frame.shape[:2]
+            rescale_coordinates(command, (screen.width, screen.height), (width, height))
+        return command
+    
+    def parse_plan(self, user_input: str) -> Dict:
+        """
+        Parse a multi-step input into an ordered list of commands.
+        
+        Inputs whose every clause is a known command are resolved locally;
+        anything else takes a single model call that returns the whole plan.
+        
+        Returns:
+            {"actions": [validated commands]} or {"error": ...}
+        """
+        plan = self.resolve_plan_locally(user_input)
+        if plan is not None:
+            return plan
+        
+        if not self.model_loaded:
+            return {"error": "Model not loaded"}
+        
+        self.count("model")
+        
+        try:
+            with self.timed(self.model_name):
+                plan = self._query_model(self.model_name, user_input, SYSTEM_PROMPT,
+                                         PLAN_SCHEMA if self.structured_output else None, plan=True)
+        except Exception as e:
+            print(f"Error parsing plan with Ollama: {e}")
+            return {"error": f"Could not parse plan: {e}"}
+        
+        return self.finish_model_plan(user_input, plan)
+    
+    def _plan_cache_key(self, user_input: str) -> str:
+        """Parse cache key for a plan; plans always come from the main model."""
+        return ParseCache.make_key(user_input, self.model_name, f"{PROMPT_VERSION}-plan")
+    
+    def resolve_plan_locally(self, user_input: str) -> Optional[Dict]:
+        """Count a plan request and answer it from local matches or the cache, if possible."""
+        self.count("plans")
+        
+        commands = self._match_plan_locally(user_input)
+        if commands is not None:
+            return {"actions": commands}
+        
+        if self.parse_cache is not None:
+            plan = self.parse_cache.get(self._plan_cache_key(user_input))
+            if plan is not None:
+                self.count("cache")
+                return plan
+        return None
+    
+    def finish_model_plan(self, user_input: str, plan: Optional[Dict]) -> Dict:
+        """Cache a model plan, or report that the reply held none."""
+        if plan is None:
+            return {"error": f"Could not parse plan: {user_input}"}
+        if self.parse_cache is not None and "error" not in plan:
+            self.parse_cache.put(self._plan_cache_key(user_input), plan)
+        return plan
+    
+    def _match_plan_locally(self, user_input: str) -> Optional[List[Dict]]:
+        """Resolve every clause with the fast path or the intent index, or return None."""
+        if self.intent_matcher is None:
+            return None
+        indexed = []
+
+        def match_index(clause: str) -> Optional[Dict]:
+            indexed.append(clause)
+            return self.intent_index.match(clause)
+
+        commands = self.intent_matcher.match_plan(
+            user_input, fallback=match_index if self.intent_index is not None else None)
+        if commands is None:
+            return None
+        commands = [self._validate_command(command) for command in commands]
+        if any("error" in command for command in commands):
+            return None
+        self.count("index" if indexed else "fast_path")
+        return commands
+    
+    def _parse_with_model(self, model_name: str, user_input: str) -> Optional[Dict]:
+        """Query one model, trying a pruned prompt first if enabled, and time it."""
+        with self.timed(model_name):
+            command = None
             
-        elif action == "wait":
-            if "seconds" not in command:
-                return {"error": "Wait action requires seconds"}
-            command["seconds"] = max(0.1, min(60.0, float(command["seconds"])))
+            # Try a prompt with only the relevant actions first; fall back to
+            # the full catalogue if that does not yield a valid command
+            pruned = self.pruned_prompt(user_input)
+            if pruned is not None:
+                command = self._query_model(model_name, user_input, *pruned)
+                if command is None or "error" in command:
+                    self.count("prompt_fallbacks")
+                    command = None
             
-        elif action == "random_action":
-            valid_actions = ["tap", "swipe", "scroll"]
-            if "actions" not in command:
-                command["actions"] = valid_actions
-            command["count"] = max(1, min(50, int(command.get("count", 5))))
+            if command is None:
+                command = self._query_model(model_name, user_input, SYSTEM_PROMPT,
+                                            ACTION_SCHEMA if self.structured_output else None)
+            return command
+    
+    def pruned_prompt(self, user_input: str) -> Optional[Tuple[str, Optional[Dict]]]:
+        """The (system prompt, schema) covering only the relevant actions, if pruning is on."""
+        pruned = self.prompt_builder.build(user_input) if self.prompt_builder is not None else None
+        if pruned is None:
+            return None
+        prompt, specs = pruned
+        self.count("pruned_prompts")
+        return prompt, self._schema_for(specs)
+    
+    @contextmanager
+    def timed(self, model_name: str):
+        """Record a request to a model and the time it took."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._stats_lock:
+                tier = self.tier_stats[model_name]
+                tier["requests"] += 1
+                tier["seconds"] += time.perf_counter() - start
+    
+    def _is_confident(self, user_input: str, command: Optional[Dict]) -> bool:
+        """
+        Decide whether a small-model answer can be used without escalating.
         
-        return command
+        The command must be valid and its action must be among the actions
+        the input's wording points to; an unrelated action (or no clue in the
+        wording at all) means the small model may have guessed.
+        """
+        if command is None or "error" in command:
+            return False
+        ranked = self.router.rank(user_input)[:ROUTING_TOP_K]
+        return command["action"] in {action for action, _ in ranked}
+    
+    def _schema_for(self, specs: List) -> Optional[Dict]:
+        """Get the (memoized) output schema restricted to the given actions."""
+        if not self.structured_output:
+            return None
+        names = tuple(spec.name for spec in specs)
+        schema = self._schemas.get(names)
+        if schema is None:
+            schema = self._schemas[names] = build_action_schema(specs)
+        return schema
+    
+    def _query_model(self, model_name: str, user_input: str, system_prompt: str,
+                     response_format: Optional[Dict], plan: bool = False,
+                     screen: Optional[EncodedScreen] = None) -> Optional[Dict]:
+        """
+        Ask a model to convert the input using the given system prompt.
+        
+        Returns the validated command, or plan if plan is set (possibly an
+        {"error": ...} dict), or None if the reply contained no JSON object.
+        """
+        request = self.chat_request(model_name, user_input, system_prompt, response_format,
+                                    plan, screen)
+        
+        if self.stream:
+            candidates = self._stream_json(request)
+        else:
+            response = self.client.chat(**request)
+            candidates = extract_json_objects(response['message']['content'])
+        
+        try:
+            for candidate in candidates:
+                command = self.decode(candidate, plan)
+                if command is not None:
+                    return command
+        finally:
+            if self.stream:
+                # Cancels generation as soon as a command has been found
+                candidates.close()
+        return None
+    
+    def decode(self, candidate: str, plan: bool) -> Optional[Dict]:
+        """Validate a JSON candidate as a command (or plan); None if it is not JSON."""
+        try:
+            command_json = json.loads(candidate)
+        except json.JSONDecodeError:
+            return None
+        if plan:
+            return self._validate_plan(command_json)
+        return self._validate_command(command_json)
+    
+    def chat_request(self, model_name: str, user_input: str, system_prompt: str,
+                     response_format: Optional[Dict], plan: bool = False,
+                     screen: Optional[EncodedScreen] = None) -> Dict:
+        """Count the prompt and build the chat arguments for a model request."""
+        self._count_prompt(system_prompt)
+        return {
+            'model': model_name,
+            'messages': self._messages(system_prompt, user_input, plan, screen),
+            'options': PLAN_OPTIONS if plan else GENERATION_OPTIONS,
+            'format': response_format,
+            'keep_alive': self.keep_alive
+        }
+    
+    def _count_prompt(self, system_prompt: str):
+        """Record the estimated size of a prompt about to be sent."""
+        prompt_tokens = estimate_tokens(system_prompt)
+        with self._stats_lock:
+            self.parse_stats["prompt_tokens"] += prompt_tokens
+        print(f"Prompt: ~{prompt_tokens} tokens (full prompt ~{FULL_PROMPT_TOKENS})")
     
-    def _fallback_parse(self, user_input: str) -> Dict:
+    def _stream_json(self, request: Dict):
+        """
+        Stream the model reply and yield each complete top-level JSON object.
+        
+        Closing the generator closes the HTTP stream, which makes Ollama stop
+        generating, so trailing tokens and chatter are never produced.
+        """
+        stream = self.client.chat(stream=True, **request)
+        scanner = JsonObjectScanner()
+        try:
+            for chunk in stream:
+                for candidate in scanner.feed(chunk['message']['content']):
+                    yield candidate
+        finally:
+            close = getattr(stream, 'close', None)
+            if close is not None:
+                close()
+    
+    def count(self, source: str):
+        """Record which path resolved a command."""
+        with self._stats_lock:
+            self.parse_stats[source] += 1
+    
+    def get_parse_stats(self) -> Dict:
+        """Get how many commands were resolved by the fast path, the cache, the index and the model."""
+        with self._stats_lock:
+            stats = dict(self.parse_stats)
+            tiers = {name: dict(tier) for name, tier in self.tier_stats.items()}
+        total = stats["fast_path"] + stats["cache"] + stats["index"] + stats["model"]
+        if stats["model"]:
+            # Estimated prompt tokens sent versus always sending the full prompt
+            stats["prompt_tokens_per_request"] = stats["prompt_tokens"] / stats["model"]
+            stats["prompt_token_ratio"] = stats["prompt_tokens_per_request"] / FULL_PROMPT_TOKENS
+        stats["total"] = total
+        stats["bypass_ratio"] = (stats["fast_path"] + stats["cache"] + stats["index"]) / total if total else 0.0
+        for tier in tiers.values():
+            tier["mean_latency_ms"] = tier["seconds"] * 1000 / tier["requests"] if tier["requests"] else 0.0
+        stats["tiers"] = tiers
+        if self.screen_encoder is not None:
+            stats["screen_encoder"] = self.screen_encoder.get_stats()
+        if self.small_model_name:
+            small_requests = tiers[self.small_model_name]["requests"]
+            stats["escalation_rate"] = stats["escalations"] / small_requests if small_requests else 0.0
+        if self.parse_cache is not None:
+            stats["parse_cache"] = self.parse_cache.get_stats()
+        return stats
+    
+    def _validate_command(self, command: Dict) -> Dict:
+        """Validate and sanitize the parsed command against the action registry."""
+        return validate_command(command)
+    
+    def _validate_plan(self, plan: Dict) -> Dict:
+        """Validate every step of a plan; a bare command is taken as a one-step plan."""
+        steps = plan.get("actions") if "action" not in plan else [plan]
+        if not isinstance(steps, list) or not steps:
+            return {"error": "Plan has no actions"}
+        
+        commands = []
+        for index, step in enumerate(steps, 1):
+            if not isinstance(step, dict):
+                return {"error": f"Step {index} is not an action"}
+            command = self._validate_command(step)
+            if "error" in command:
+                return {"error": f"Step {index}: {command['error']}"}
+            commands.append(command)
+        return {"actions": commands}
+    
+    def fallback_parse(self, user_input: str) -> Dict:
         """Fallback parser for common commands when AI parsing fails."""
         user_input = user_input.lower().strip()
         
@@ -777,20 +973,310 @@ Convert this command: "{user_input}"
         try:
             models = self.client.list()
             available_models = [model.model for model in models.models]
+            return self.model_info(available_models, self.is_resident())
+        except Exception as e:
+            return self.model_info_error(e)
+    
+    def model_info(self, available_models: List[str], resident: Optional[bool]) -> Dict:
+        """Model information for a reachable Ollama."""
+        return {
+            "model_name": self.model_name,
+            "small_model_name": self.small_model_name if self.small_model_loaded else None,
+            "backend": "ollama",
+            "loaded": self.model_loaded,
+            "resident": resident,
+            "warmup_seconds": self.warmup_seconds,
+            "keep_alive": self.keep_alive,
+            "available_models": available_models,
+            "ollama_running": True
+        }
+    
+    def model_info_error(self, error: Exception) -> Dict:
+        """Model information when Ollama could not be reached."""
+        return {
+            "model_name": self.model_name,
+            "backend": "ollama",
+            "loaded": False,
+            "available_models": [],
+            "ollama_running": False,
+            "error": str(error)
+        }
+
+
+
+class AsyncGemmaController:
+    """
+    asyncio counterpart of GemmaController for the ASGI server.
+    
+    Everything that does not wait on Ollama (fast path, cache, intent index,
+    prompts, routing, validation and statistics) goes through the public
+    steps of a GemmaController core, so both servers resolve commands
+    identically. Model requests go through ollama.AsyncClient, so a request
+    waiting on generation holds no thread. It is deliberately not a
+    subclass: every method that talks to Ollama is a coroutine here and a
+    plain method on the core.
+    """
+    
+    def __init__(self, *args, **kwargs):
+        """Takes the same arguments as GemmaController."""
+        self.core = GemmaController(*args, **kwargs)
+        self.async_client = ollama.AsyncClient()
+        self._warming = asyncio.Lock()
+    
+    @property
+    def model_name(self) -> str:
+        return self.core.model_name
+    
+    @property
+    def model_loaded(self) -> bool:
+        return self.core.model_loaded
+    
+    @property
+    def screen_encoder(self) -> Optional[ScreenEncoder]:
+        return self.core.screen_encoder
+    
+    def matches_locally(self, user_input: str) -> bool:
+        """Whether the fast path or the intent index resolves the input."""
+        return self.core.matches_locally(user_input)
+    
+    def get_parse_stats(self) -> Dict:
+        """Get how many commands were resolved by each path (see GemmaController)."""
+        return self.core.get_parse_stats()
+    
+    async def load_model(self) -> bool:
+        """Check that the Ollama model is available and warm it up."""
+        core = self.core
+        try:
+            print(f"Checking Ollama model: {core.model_name}...")
+            models = await self.async_client.list()
+            available_models = [model.model for model in models.models]
+            
+            if core.check_available(available_models):
+                return core.mark_loaded(await self.warm_up())
+            return False
+            
+        except Exception as e:
+            print(f"Error checking Ollama model: {e}")
+            return False
+    
+    async def warm_up(self) -> bool:
+        """Load every tier and prime Ollama's prompt cache (see GemmaController.warm_up)."""
+        core = self.core
+        async with self._warming:
+            start = time.time()
+            for model_name in core.tiers():
+                try:
+                    await self.async_client.chat(**core.warm_up_request(model_name))
+                except Exception as e:
+                    if not core.warm_up_failed(model_name, e):
+                        return False
+            return core.finish_warm_up(start)
+    
+    async def parse_command(self, user_input: str, screenshot_available: bool = False,
+                            capture_screen: Optional[Callable[[], Awaitable[np.ndarray]]] = None
+                            ) -> Dict:
+        """
+        Parse user input into an Android command.
+        
+        Args:
+            user_input: Natural language command from user
+            screenshot_available: Whether a screenshot is available for context
+            capture_screen: Coroutine function returning the current RGBA frame;
+                in vision mode it is awaited only if the command needs the model
+        """
+        use_screen = self.core.screen_encoder is not None and capture_screen is not None
+        
+        resolved = self.core.resolve_locally(user_input, use_cache=not use_screen)
+        if resolved is not None:
+            return resolved[0]
+        return await self._resolve_with_model(user_input, capture_screen if use_screen else None)
+    
+    async def parse_commands(self, inputs: List[str],
+                             parallelism: int = BATCH_PARALLELISM) -> List[Dict]:
+        """
+        Parse many commands, querying the model for up to `parallelism` at once.
+        
+        Same results as GemmaController.parse_commands, but the model requests
+        are coroutines on the running loop instead of worker threads.
+        """
+        core = self.core
+        results, first, pending = core.begin_batch(inputs)
+        slots = asyncio.Semaphore(parallelism)
+        
+        async def parse(index: int):
+            async with slots:
+                start = time.perf_counter()
+                command = await self._resolve_with_model(inputs[index])
+                results[index] = {"input": inputs[index], "result": command, "source": "model",
+                                  "seconds": time.perf_counter() - start}
+        
+        await asyncio.gather(*(parse(index) for index in pending))
+        return core.finish_batch(inputs, results, first)
+    
+    async def _resolve_with_model(
+            self, user_input: str,
+            capture_screen: Optional[Callable[[], Awaitable[np.ndarray]]] = None) -> Dict:
+        """Parse with the model (and the screen, if a capture is given), falling back to rules."""
+        core = self.core
+        if not core.model_loaded:
+            return {"error": "Model not loaded"}
+        
+        core.count("model")
+        
+        try:
+            frame = None
+            if capture_screen is not None:
+                try:
+                    frame = await capture_screen()
+                except Exception as e:
+                    print(f"Screen capture for parsing failed, using text only: {e}")
+            
+            if frame is not None:
+                command = await self._parse_with_screen(user_input, frame)
+            else:
+                command = await self._parse_with_tiers(user_input)
+            return core.finish_model_parse(user_input, command, cacheable=frame is None)
+            
+        except Exception as e:
+            print(f"Error parsing command with Ollama: {e}")
+            return core.fallback_parse(user_input)
+    
+    async def _parse_with_tiers(self, user_input: str) -> Optional[Dict]:
+        """Ask the fastest model first and escalate while its answer is invalid or implausible."""
+        command = None
+        for model_name in self.core.tiers():
+            try:
+                command, error = await self._parse_with_model(model_name, user_input), None
+            except Exception as e:
+                command, error = None, e
+            if not self.core.escalate(model_name, user_input, command, error):
+                break
+        return command
+    
+    async def _parse_with_screen(self, user_input: str, frame: np.ndarray) -> Optional[Dict]:
+        """Ask the main model with the current screen attached, mapping coordinates back."""
+        core = self.core
+        core.count("vision")
+        # Resizing and JPEG encoding are CPU-bound
+        screen = await asyncio.get_running_loop().run_in_executor(
+            None, core.screen_encoder.encode, frame)
+        with core.timed(core.model_name):
+            command = await self._query_model(
+                core.model_name, user_input, SYSTEM_PROMPT,
+                ACTION_SCHEMA if core.structured_output else None, screen=screen)
+        
+        if command is not None and "error" not in command:
+            height, width = frame.shape[:2]
+            rescale_coordinates(command, (screen.width, screen.height), (width, height))
+        return command
+    
+    async def parse_plan(self, user_input: str) -> Dict:
+        """Parse a multi-step input into {"actions": [...]} (see GemmaController.parse_plan)."""
+        core = self.core
+        plan = core.resolve_plan_locally(user_input)
+        if plan is not None:
+            return plan
+        
+        if not core.model_loaded:
+            return {"error": "Model not loaded"}
+        
+        core.count("model")
+        
+        try:
+            with core.timed(core.model_name):
+                plan = await self._query_model(
+                    core.model_name, user_input, SYSTEM_PROMPT,
+                    PLAN_SCHEMA if core.structured_output else None, plan=True)
+        except Exception as e:
+            print(f"Error parsing plan with Ollama: {e}")
+            return {"error": f"Could not parse plan: {e}"}
+        
+        return core.finish_model_plan(user_input, plan)
+    
+    async def _parse_with_model(self, model_name: str, user_input: str) -> Optional[Dict]:
+        """Query one model, trying a pruned prompt first if enabled, and time it."""
+        core = self.core
+        with core.timed(model_name):
+            command = None
             
-            return {
-                "model_name": self.model_name,
-                "backend": "ollama",
-                "loaded": self.model_loaded,
-                "available_models": available_models,
-                "ollama_running": True
-            }
+            pruned = core.pruned_prompt(user_input)
+            if pruned is not None:
+                command = await self._query_model(model_name, user_input, *pruned)
+                if command is None or "error" in command:
+                    core.count("prompt_fallbacks")
+                    command = None
+            
+            if command is None:
+                command = await self._query_model(
+                    model_name, user_input, SYSTEM_PROMPT,
+                    ACTION_SCHEMA if core.structured_output else None)
+            return command
+    
+    async def _query_model(self, model_name: str, user_input: str, system_prompt: str,
+                           response_format: Optional[Dict], plan: bool = False,
+                           screen: Optional[EncodedScreen] = None) -> Optional[Dict]:
+        """Ask a model to convert the input; returns the first valid command (or plan) or None."""
+        core = self.core
+        request = core.chat_request(model_name, user_input, system_prompt, response_format,
+                                    plan, screen)
+        
+        if not core.stream:
+            response = await self.async_client.chat(**request)
+            for candidate in extract_json_objects(response['message']['content']):
+                command = core.decode(candidate, plan)
+                if command is not None:
+                    return command
+            return None
+        
+        candidates = self._stream_json(request)
+        try:
+            async for candidate in candidates:
+                command = core.decode(candidate, plan)
+                if command is not None:
+                    return command
+        finally:
+            # Cancels generation as soon as a command has been found
+            await candidates.aclose()
+        return None
+    
+    async def _stream_json(self, request: Dict) -> AsyncIterator[str]:
+        """Stream the model reply and yield each complete top-level JSON object."""
+        stream = await self.async_client.chat(stream=True, **request)
+        scanner = JsonObjectScanner()
+        try:
+            async for chunk in stream:
+                for candidate in scanner.feed(chunk['message']['content']):
+                    yield candidate
+        finally:
+            aclose = getattr(stream, 'aclose', None)
+            if aclose is not None:
+                await aclose()
+    
+    async def is_resident(self) -> Optional[bool]:
+        """Check whether Ollama currently has every model in memory (None if unknown)."""
+        try:
+            running = {model.model for model in (await self.async_client.ps()).models}
+            return all(model_name in running for model_name in self.core.tiers())
+        except Exception:
+            return None
+    
+    async def ensure_warm(self):
+        """Re-warm in the background if the model was unloaded (e.g. Ollama restarted)."""
+        if (not self.core.model_loaded or self._warming.locked()
+                or await self.is_resident() is not False):
+            return
+        asyncio.ensure_future(self._warm_up_once())
+    
+    async def _warm_up_once(self):
+        """Warm up unless another warm-up started since this one was scheduled."""
+        if not self._warming.locked():
+            await self.warm_up()
+    
+    async def get_model_info(self) -> Dict:
+        """Get information about the Ollama model."""
+        try:
+            models = await self.async_client.list()
+            available_models = [model.model for model in models.models]
+            return self.core.model_info(available_models, await self.is_resident())
         except Exception as e:
-            return {
-                "model_name": self.model_name,
-                "backend": "ollama",
-                "loaded": False,
-                "available_models": [],
-                "ollama_running": False,
-                "error": str(e)
-            } 
\ No newline at end of file
+            return self.core.model_info_error(e)
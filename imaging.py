@@ -0,0 +1,73 @@
+import io
+import struct
+from typing import Optional, Tuple
+import numpy as np
+from PIL import Image
+
+# `screencap` raw pixel formats with 4 bytes per pixel
+RAW_PIXEL_FORMATS = {1: "RGBA_8888", 2: "RGBX_8888", 5: "BGRA_8888"}
+
+
+def decode_raw_screencap(data: bytes) -> np.ndarray:
+    """
+    Decode raw `screencap` output into a (height, width, 4) RGBA array.
+    
+    The array is a read-only view over the received buffer, so no pixels are
+    copied (except for BGRA frames, which need their channels swapped).
+    """
+    if len(data) < 12:
+        raise ValueError("Raw screencap output too short")
+    
+    width, height, pixel_format = struct.unpack_from('<III', data)
+    if pixel_format not in RAW_PIXEL_FORMATS:
+        raise ValueError(f"Unsupported screencap pixel format: {pixel_format}")
+    
+    # Android 8+ adds a 4-byte color space field to the 12-byte header
+    frame_size = width * height * 4
+    header_size = 16 if len(data) >= 16 + frame_size else 12
+    if len(data) < header_size + frame_size:
+        raise ValueError("Truncated screencap frame")
+    
+    frame = np.frombuffer(data, dtype=np.uint8, count=frame_size, offset=header_size)
+    frame = frame.reshape(height, width, 4)
+    
+    if RAW_PIXEL_FORMATS[pixel_format] == "BGRA_8888":
+        frame = frame[..., [2, 1, 0, 3]]
+    
+    return frame
+
+
+def encode_frame(frame: np.ndarray, image_format: str = "PNG", max_width: Optional[int] = None,
+                 crop: Optional[Tuple[int, int, int, int]] = None, grayscale: bool = False,
+                 **options) -> bytes:
+    """
+    Encode an RGBA frame on the host (PNG by default, alpha dropped).
+    
+    Args:
+        frame: (height, width, 4) RGBA array
+        image_format: Pillow format name (PNG, JPEG, WEBP)
+        max_width: Downscale so the output is at most this wide
+        crop: Optional (x, y, width, height) region, applied before scaling
+        grayscale: Encode a single luminance channel
+        **options: Extra Pillow save options (e.g. quality)
+    """
+    if crop:
+        x, y, width, height = crop
+        frame = frame[max(0, y):max(0, y + height), max(0, x):max(0, x + width)]
+        if frame.size == 0:
+            raise ValueError("Crop region is outside the screen")
+    
+    image = Image.fromarray(frame[..., :3])
+    if max_width and image.width > max_width:
+        height = max(1, round(image.height * max_width / image.width))
+        image = image.resize((max_width, height), Image.BILINEAR)
+    if grayscale:
+        image = image.convert("L")
+    
+    if image_format.upper() == "PNG":
+        # Fast compression; size matters less than latency for live frames
+        options.setdefault("compress_level", 1)
+    
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format, **options)
+    return buffer.getvalue()
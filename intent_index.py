@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+"""
+Nearest-neighbour intent index over a labelled command corpus.
+
+Build the index offline, then load it (memory-mapped) in the controller:
+
+    python intent_index.py build
+    python intent_index.py query "snap the screen"
+"""
+
+import argparse
+import itertools
+import json
+import os
+import re
+import zlib
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from intent_matcher import DEFAULT_RULES, FILLER_WORDS, SLOT_VOCABULARIES, TOKEN_PATTERN, _expand, normalize
+from prompt_builder import EXAMPLES
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "intent_corpus.jsonl")
+DEFAULT_INDEX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "intent_index")
+
+# Character n-grams are hashed into a fixed number of columns, so the
+# vocabulary never has to be stored or looked up
+NGRAM_SIZES = (3, 4)
+N_FEATURES = 1 << 18
+
+# Minimum cosine similarity for a neighbour's command to be used
+DEFAULT_THRESHOLD = 0.7
+
+# Minimum share of the query's words the matched phrasing must account for,
+# so "set an alarm for 7" does not resolve to "set an alarm"
+MIN_COVERAGE = 0.75
+
+# Words that change what a single command would do: joined steps, negation,
+# repetition and questions. Queries containing them are left to the model
+REJECT_WORDS = {
+    "and", "then", "after", "before", "while", "until",
+    "not", "don't", "dont", "never", "without", "no",
+    "twice", "thrice", "times", "again", "every", "each", "repeat",
+    "what", "what's", "which", "why", "how", "where", "when", "who", "is", "are",
+}
+
+# Clause punctuation; a comma between two numbers ("tap 300, 700") is allowed
+CLAUSE_PUNCTUATION = re.compile(r"[;:?!]|,(?!\s*\d)")
+
+# Values substituted for "{kind}" markers when vectorizing corpus texts
+SAMPLE_VALUES = {
+    "number": ["5"],
+    "text": ["hello world"],
+    **{kind: list(phrases) for kind, phrases in SLOT_VOCABULARIES.items()},
+}
+
+# At most this many marker substitutions are indexed per corpus entry
+MAX_VARIANTS = 64
+
+MARKER_PATTERN = re.compile(r"\{(\w+)\}")
+
+ARRAYS = ("col_ptr", "row_idx", "values", "idf", "labels")
+
+Entry = Tuple[str, Dict]
+
+
+def _grams(text: str) -> Counter:
+    """Count the hashed character n-grams of the normalized text."""
+    # Numbers are slots, so every number looks the same to the index
+    words = ("#" if token[0].isdigit() else token for token, _, _ in normalize(text))
+    padded = f" {' '.join(words)} "
+    grams = Counter()
+    for size in NGRAM_SIZES:
+        for start in range(len(padded) - size + 1):
+            grams[zlib.crc32(padded[start:start + size].encode("utf-8")) % N_FEATURES] += 1
+    return grams
+
+
+def load_corpus(path: str = DEFAULT_CORPUS) -> List[Entry]:
+    """Read (text, command template) pairs from a JSON Lines file."""
+    entries = []
+    with open(path, encoding="utf-8") as corpus:
+        for line in corpus:
+            if line.strip():
+                record = json.loads(line)
+                entries.append((record["text"], record["command"]))
+    return entries
+
+
+def rule_entries() -> List[Entry]:
+    """Expand the fast-path rules into corpus entries (computed templates are skipped)."""
+    entries = []
+    for patterns, template in DEFAULT_RULES:
+        if callable(template):
+            continue
+        for pattern in patterns:
+            for tokens in _expand(pattern):
+                words, placeholders, numbers = [], {}, 0
+                for token in tokens:
+                    if token.startswith("{"):
+                        kind, _, name = token[1:-1].partition(":")
+                        if kind == "number":
+                            numbers += 1
+                            placeholders[name] = f"$number{numbers}"
+                        else:
+                            placeholders[name or kind] = f"${kind}"
+                        words.append(f"{{{kind}}}")
+                    else:
+                        words.append(token)
+                command = {key: placeholders.get(value[1:], value)
+                           if isinstance(value, str) and value.startswith("$") else value
+                           for key, value in template.items()}
+                entries.append((" ".join(words), command))
+    return entries
+
+
+def default_corpus(path: str = DEFAULT_CORPUS) -> List[Entry]:
+    """The shipped paraphrase corpus plus the fast-path rules and prompt examples."""
+    entries = load_corpus(path) + rule_entries() + [(user, command) for user, command in EXAMPLES]
+    unique = {}
+    for text, command in entries:
+        unique.setdefault((text.lower(), json.dumps(command, sort_keys=True)), (text, command))
+    return list(unique.values())
+
+
+def expand_markers(text: str) -> Iterable[str]:
+    """Yield the text with each "{kind}" marker replaced by sample values."""
+    kinds = MARKER_PATTERN.findall(text)
+    if not kinds:
+        yield text
+        return
+    pieces = MARKER_PATTERN.split(text)[::2]
+    combinations = itertools.product(*(SAMPLE_VALUES.get(kind, [kind]) for kind in kinds))
+    for values in itertools.islice(combinations, MAX_VARIANTS):
+        yield "".join(itertools.chain.from_iterable(itertools.zip_longest(pieces, values, fillvalue="")))
+
+
+def build_index(entries: List[Entry], path: str) -> "IntentIndex":
+    """
+    Vectorize the corpus and write the index to a directory.
+
+    Rows are sublinear TF-IDF vectors over hashed character n-grams,
+    L2-normalized so a dot product is the cosine similarity. The matrix is
+    stored column-major (CSC) so a query only reads the postings of the
+    n-grams it contains.
+    """
+    rows, cols, counts, labels = [], [], [], []
+    templates = []
+    text_prefix_words = set()
+    for text, command in entries:
+        label = len(templates)
+        templates.append({"text": text, "command": command})
+        if "{text}" in text:
+            text_prefix_words.update(token for token, _, _ in normalize(text.split("{text}")[0]))
+        for variant in expand_markers(text):
+            row = len(labels)
+            labels.append(label)
+            for col, count in _grams(variant).items():
+                rows.append(row)
+                cols.append(col)
+                counts.append(count)
+
+    n_rows = len(labels)
+    rows = np.asarray(rows, dtype=np.int32)
+    cols = np.asarray(cols, dtype=np.int64)
+    counts = np.asarray(counts, dtype=np.float32)
+
+    # Each (row, col) pair is unique, so bincount over cols is document frequency
+    df = np.bincount(cols, minlength=N_FEATURES)
+    idf = (np.log((1 + n_rows) / (1 + df)) + 1).astype(np.float32)
+    values = (1 + np.log(counts)) * idf[cols]
+    norms = np.sqrt(np.bincount(rows, weights=values * values, minlength=n_rows))
+    values = (values / norms[rows]).astype(np.float32)
+
+    order = np.argsort(cols, kind="stable")
+    arrays = {
+        "col_ptr": np.concatenate(([0], np.cumsum(df))).astype(np.int64),
+        "row_idx": rows[order],
+        "values": values[order],
+        "idf": idf,
+        "labels": np.asarray(labels, dtype=np.int32),
+    }
+
+    os.makedirs(path, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(path, f"{name}.npy"), array)
+    with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as meta:
+        json.dump({"ngram_sizes": list(NGRAM_SIZES), "n_features": N_FEATURES, "rows": n_rows,
+                   "templates": templates, "text_prefix_words": sorted(text_prefix_words)}, meta)
+    return IntentIndex(path)
+
+
+class IntentIndex:
+    """
+    Character n-gram TF-IDF index that maps paraphrases to known commands.
+
+    A query is vectorized the same way as the corpus and scored against
+    every row at once by accumulating the postings of its n-grams. The
+    nearest row's command template is used if its cosine similarity clears
+    the threshold and every slot in the template can be filled from the
+    query; otherwise there is no match and the caller asks the model.
+    """
+
+    def __init__(self, path: str = DEFAULT_INDEX_DIR, threshold: float = DEFAULT_THRESHOLD):
+        """
+        Args:
+            path: Directory written by build_index
+            threshold: Minimum cosine similarity for a match
+        """
+        self.path = path
+        self.threshold = threshold
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as meta:
+            self.meta = json.load(meta)
+        if tuple(self.meta["ngram_sizes"]) != NGRAM_SIZES or self.meta["n_features"] != N_FEATURES:
+            raise ValueError(f"Intent index at {path} was built with different settings; rebuild it")
+        # Memory-mapped so worker processes share the pages and startup is instant
+        for name in ARRAYS:
+            setattr(self, name, np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r"))
+        self.templates = self.meta["templates"]
+        self.text_prefix_words = set(self.meta["text_prefix_words"]) | FILLER_WORDS
+        self.vocabularies = {kind: sorted(((tuple(phrase.split()), value) for phrase, value in phrases.items()),
+                                          key=lambda item: -len(item[0]))
+                             for kind, phrases in SLOT_VOCABULARIES.items()}
+        self._coverage = [self._template_words(template["text"]) for template in self.templates]
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def search(self, text: str) -> Optional[Tuple[int, float]]:
+        """Return (template id, cosine similarity) of the nearest row, or None."""
+        grams = _grams(text)
+        if not grams:
+            return None
+        cols = np.fromiter(grams.keys(), dtype=np.int64, count=len(grams))
+        weights = (1 + np.log(np.fromiter(grams.values(), dtype=np.float32, count=len(grams)))) * self.idf[cols]
+        weights /= np.sqrt(np.dot(weights, weights))
+
+        starts, ends = self.col_ptr[cols], self.col_ptr[cols + 1]
+        present = ends > starts
+        if not present.any():
+            return None
+        postings = [slice(start, end) for start, end in zip(starts[present], ends[present])]
+        rows = np.concatenate([self.row_idx[span] for span in postings])
+        contributions = np.concatenate([self.values[span] * weight
+                                        for span, weight in zip(postings, weights[present])])
+        scores = np.bincount(rows, weights=contributions, minlength=len(self.labels))
+        best = int(np.argmax(scores))
+        return int(self.labels[best]), float(scores[best])
+
+    def match(self, text: str) -> Optional[Dict]:
+        """
+        Return the command for the nearest known phrasing, or None.
+
+        Besides clearing the similarity threshold, the query must be a
+        single plain command (see REJECT_WORDS) and the phrasing must
+        account for at least MIN_COVERAGE of its words.
+        """
+        if self._rejected(text):
+            return None
+        found = self.search(text)
+        if found is None or found[1] < self.threshold:
+            return None
+        if self.coverage(found[0], text) < MIN_COVERAGE:
+            return None
+        return self._fill(self.templates[found[0]]["command"], text)
+
+    @staticmethod
+    def _rejected(text: str) -> bool:
+        """True for queries with joined steps, negation, counts or questions."""
+        if CLAUSE_PUNCTUATION.search(text):
+            return True
+        return any(match.group().lower() in REJECT_WORDS for match in TOKEN_PATTERN.finditer(text))
+
+    def _template_words(self, text: str) -> Tuple[set, bool]:
+        """Words a template's phrasing accounts for, and whether it ends in free text."""
+        words = {token for token, _, _ in normalize(MARKER_PATTERN.sub(" ", text))}
+        kinds = set(MARKER_PATTERN.findall(text))
+        for kind in kinds:
+            for phrase, _ in self.vocabularies.get(kind, []):
+                words.update(phrase)
+        return words, "text" in kinds
+
+    def coverage(self, template_id: int, text: str) -> float:
+        """Share of the query's words accounted for by a template's phrasing and slots."""
+        words, free_text = self._coverage[template_id]
+        if free_text:
+            # The text slot takes whatever follows the command words
+            return 1.0
+        numbers = sum(1 for marker in MARKER_PATTERN.findall(self.templates[template_id]["text"])
+                      if marker == "number")
+        tokens = [token for token, _, _ in normalize(text)]
+        if not tokens:
+            return 0.0
+        covered = 0
+        for token in tokens:
+            if token in words:
+                covered += 1
+            elif token[0].isdigit():
+                if not numbers:
+                    # The command would silently drop or replace this number
+                    return 0.0
+                numbers -= 1
+                covered += 1
+        return covered / len(tokens)
+
+    def _fill(self, template: Dict, text: str) -> Optional[Dict]:
+        """Replace "$slot" placeholders with values from the query; None if one is missing."""
+        tokens = normalize(text)
+        numbers = [token for token, _, _ in tokens if token[0].isdigit()]
+        command = {}
+        for key, value in template.items():
+            if isinstance(value, str) and value.startswith("$"):
+                value = self._slot(value[1:], tokens, numbers, text)
+                if value is None:
+                    return None
+            command[key] = value
+        return command
+
+    def _slot(self, slot: str, tokens: List[Tuple[str, int, int]], numbers: List[str], text: str):
+        """Extract one slot value from the query."""
+        kind = slot.rstrip("0123456789")
+        if kind in ("number", "percent"):
+            # "$number2" is the second number in the query
+            position = int(slot[len(kind):] or 1) - 1
+            if position >= len(numbers):
+                return None
+            number = float(numbers[position])
+            if kind == "percent":
+                # Spoken as a percentage, set on the 0-255 scale
+                return round(number * 255 / 100)
+            return int(number) if number.is_integer() else number
+        if slot == "text":
+            # Free text follows the command words, verbatim from the original
+            for match in TOKEN_PATTERN.finditer(text):
+                if match.group().lower() not in self.text_prefix_words:
+                    return text[match.start():].strip().strip("\"'") or None
+            return None
+        words = [token for token, _, _ in tokens]
+        for phrase, value in self.vocabularies.get(slot, []):
+            for start in range(len(words) - len(phrase) + 1):
+                if tuple(words[start:start + len(phrase)]) == phrase:
+                    return value
+        return None
+
+
+def main():
+    """Build or query the intent index."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("build", help="vectorize the corpus and write the index")
+    build.add_argument("--corpus", default=DEFAULT_CORPUS, help="labelled JSON Lines corpus")
+    build.add_argument("--output", default=DEFAULT_INDEX_DIR, help="index directory")
+    query = subparsers.add_parser("query", help="look up commands in a built index")
+    query.add_argument("text", nargs="+", help="commands to look up")
+    query.add_argument("--index", default=DEFAULT_INDEX_DIR, help="index directory")
+    query.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="minimum similarity")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        index = build_index(default_corpus(args.corpus), args.output)
+        print(f"✅ Indexed {len(index)} rows ({len(index.templates)} templates) in {args.output}")
+    else:
+        index = IntentIndex(args.index, args.threshold)
+        for text in args.text:
+            found = index.search(text)
+            similarity = found[1] if found else 0.0
+            print(f"{text!r}: {index.match(text)} (similarity {similarity:.2f})")
+
+
+if __name__ == "__main__":
+    main()
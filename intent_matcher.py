@@ -0,0 +1,301 @@
+import itertools
+import re
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+# Words that carry no intent; dropped before matching
+FILLER_WORDS = {"please", "the", "a", "an", "my", "now", "can", "could", "would", "you", "just", "kindly"}
+
+TOKEN_PATTERN = re.compile(r"\d+(?:\.\d+)?|[a-z]+(?:'[a-z]+)?", re.IGNORECASE)
+
+# Boundaries between the steps of a multi-command input
+CLAUSE_SEPARATOR = re.compile(r"\s*(?:[,;]\s*(?:and\s+)?(?:then\s+)?|\s(?:and\s+then|and|then)\s+)", re.IGNORECASE)
+
+# Slot vocabularies: phrase -> value. Phrases may span several tokens.
+APP_PACKAGES = {
+    "camera": "com.android.camera",
+    "settings": "com.android.settings",
+    "browser": "com.android.chrome",
+    "chrome": "com.android.chrome",
+    "gallery": "com.google.android.apps.photos",
+    "photos": "com.google.android.apps.photos",
+    "calculator": "com.android.calculator2",
+    "contacts": "com.android.contacts",
+    "phone": "com.android.dialer",
+    "dialer": "com.android.dialer",
+    "messages": "com.android.mms",
+    "sms": "com.android.mms",
+    "clock": "com.android.deskclock",
+    "alarm": "com.android.deskclock",
+    "calendar": "com.android.calendar",
+    "maps": "com.google.android.apps.maps",
+    "google maps": "com.google.android.apps.maps",
+    "youtube": "com.google.android.youtube",
+    "play store": "com.android.vending",
+}
+
+TOGGLE_SETTINGS = {
+    "wifi": "wifi",
+    "wi fi": "wifi",
+    "bluetooth": "bluetooth",
+    "airplane mode": "airplane_mode",
+    "flight mode": "airplane_mode",
+    "location": "location",
+    "gps": "location",
+    "auto rotate": "auto_rotate",
+    "dark mode": "dark_mode",
+    "do not disturb": "do_not_disturb",
+    "dnd": "do_not_disturb",
+    "battery saver": "battery_saver",
+    "data saver": "data_saver",
+    "hotspot": "hotspot",
+    "nfc": "nfc",
+    "flashlight": "flashlight",
+    "torch": "flashlight",
+}
+
+SLOT_VOCABULARIES = {
+    "app": APP_PACKAGES,
+    "toggle": TOGGLE_SETTINGS,
+    "direction": {"up": "up", "down": "down", "left": "left", "right": "right"},
+    "state": {"on": True, "off": False},
+    "orientation": {"portrait": "portrait", "landscape": "landscape"},
+    "key": {
+        "back": "BACK", "home": "HOME", "menu": "MENU", "power": "POWER",
+        "enter": "ENTER", "delete": "DELETE", "backspace": "DELETE", "tab": "TAB",
+        "space": "SPACE", "search": "SEARCH", "volume up": "VOLUME_UP",
+        "volume down": "VOLUME_DOWN",
+    },
+}
+
+OPPOSITE_DIRECTIONS = {"up": "down", "down": "up", "left": "right", "right": "left"}
+
+CENTER = {"x": 540, "y": 960}
+
+Template = Union[Dict, Callable[[Dict], Dict]]
+
+# (patterns, action template). Patterns use "{kind}" / "{kind:name}" slots,
+# "[a|b]" for optional words and "(a|b)" for alternatives. String template
+# values starting with "$" are replaced by the slot of that name.
+DEFAULT_RULES: List[Tuple[List[str], Template]] = [
+    (["[take] screenshot", "[take] screen shot", "capture [screen]", "grab screenshot"],
+     {"action": "screenshot"}),
+    (["record [screen]", "start screen recording"], {"action": "screen_record", "duration": 30}),
+    (["record [screen] [for] {number:duration} (seconds|second|secs|s)"],
+     {"action": "screen_record", "duration": "$duration"}),
+    (["[go|navigate] back", "press back [button]"], {"action": "key", "keycode": "BACK"}),
+    (["[go] home", "go to home [screen]", "home screen", "press home [button]"],
+     {"action": "key", "keycode": "HOME"}),
+    (["press {key} [button|key]"], {"action": "key", "keycode": "$key"}),
+    (["[turn] volume up"], {"action": "key", "keycode": "VOLUME_UP"}),
+    (["[turn] volume down"], {"action": "key", "keycode": "VOLUME_DOWN"}),
+    (["[open|show] (recent|recents) [apps]", "[open] task switcher"], {"action": "recent_apps"}),
+    (["scroll {direction}"], {"action": "scroll", "direction": "$direction"}),
+    # A swipe moves the content the opposite way to a scroll
+    (["swipe {direction}"],
+     lambda slots: {"action": "scroll", "direction": OPPOSITE_DIRECTIONS[slots["direction"]]}),
+    (["(tap|click|touch) [in|on] [center|middle]", "(tap|click|touch) [in|on] center of screen"],
+     {"action": "tap", **CENTER}),
+    (["(tap|click|touch) [at|on] {number:x} [and] {number:y}"],
+     {"action": "tap", "x": "$x", "y": "$y"}),
+    (["double (tap|click) [in|on] [center|middle]"], {"action": "double_tap", **CENTER}),
+    (["double (tap|click) [at|on] {number:x} [and] {number:y}"],
+     {"action": "double_tap", "x": "$x", "y": "$y"}),
+    (["long press [in|on] [center|middle]"], {"action": "long_press", **CENTER, "duration": 1000}),
+    (["long press [at|on] {number:x} [and] {number:y}"],
+     {"action": "long_press", "x": "$x", "y": "$y", "duration": 1000}),
+    (["pinch [to] [zoom] [out]", "zoom out"], {"action": "pinch", **CENTER, "scale": 0.5}),
+    (["zoom [in]", "pinch [to] zoom in"], {"action": "zoom", **CENTER, "scale": 2.0}),
+    # Only "type": "write down my address" or "enter the settings" are not typing
+    (["type {text}"], {"action": "type", "text": "$text"}),
+    (["paste [text]"], {"action": "paste"}),
+    (["copy [text]"], {"action": "copy"}),
+    (["cut [text]"], {"action": "cut"}),
+    (["clear [text|input]"], {"action": "clear_text"}),
+    (["(turn|switch|toggle) {state} {toggle}", "(turn|switch|toggle) {toggle} {state}", "{toggle} {state}"],
+     {"action": "$toggle", "enabled": "$state"}),
+    (["(enable|activate) {toggle}"], {"action": "$toggle", "enabled": True}),
+    (["(disable|deactivate) {toggle}"], {"action": "$toggle", "enabled": False}),
+    (["[set] brightness [to] (max|maximum|full)", "max brightness"], {"action": "brightness", "level": 255}),
+    (["[set] brightness [to] (min|minimum)", "min brightness"], {"action": "brightness", "level": 0}),
+    # Brightness is spoken as a percentage but set on the 0-255 scale
+    (["[set] brightness [to] {number:percent} [percent]"],
+     lambda slots: {"action": "brightness", "level": round(slots["percent"] * 255 / 100)}),
+    (["[set] volume [to] {number:level} [percent]"], {"action": "volume", "level": "$level"}),
+    (["rotate [screen] [to] {orientation}", "[switch] to {orientation} [mode]"],
+     {"action": "rotate", "orientation": "$orientation"}),
+    (["(open|show|expand|pull down) (notifications|notification panel|notification shade)"],
+     {"action": "notification_panel", "expand": True}),
+    (["(close|hide|collapse) (notifications|notification panel|notification shade)"],
+     {"action": "notification_panel", "expand": False}),
+    (["[open|show] quick settings"], {"action": "quick_settings"}),
+    (["lock [screen|device|phone]"], {"action": "lock_screen"}),
+    (["unlock [screen|device|phone]"], {"action": "unlock_screen", "method": "swipe"}),
+    (["wake [up] [screen|device|phone]"], {"action": "wake_up"}),
+    (["(reboot|restart) [device|phone]"], {"action": "reboot", "mode": "normal"}),
+    (["(shutdown|shut down|power off) [device|phone]"], {"action": "shutdown"}),
+    (["(open|launch|start|run) {app} [app]"], {"action": "app", "package": "$app"}),
+    (["[get|show] (device|phone) (info|information)"], {"action": "get_device_info"}),
+    (["[get|show] battery (info|information|status|level)"], {"action": "get_battery_info"}),
+    (["[get|show] storage (info|information)"], {"action": "get_storage_info"}),
+    (["[get|show] network (info|information)"], {"action": "get_network_info"}),
+    (["[get|show|list] running apps"], {"action": "get_running_apps"}),
+    (["[get|show|list] installed apps"], {"action": "get_installed_apps"}),
+    (["(dump|show|get) ui [hierarchy]"], {"action": "ui_hierarchy", "format": "xml"}),
+    (["(wait|sleep|pause) [for] {number:seconds} [seconds|second|secs|s]"],
+     {"action": "wait", "seconds": "$seconds"}),
+]
+
+
+def normalize(text: str) -> List[Tuple[str, int, int]]:
+    """Lowercase and tokenize text into (token, start, end), dropping filler words."""
+    tokens = [(match.group().lower(), match.start(), match.end()) for match in TOKEN_PATTERN.finditer(text)]
+    return [token for token in tokens if token[0] not in FILLER_WORDS]
+
+
+def split_clauses(text: str) -> List[str]:
+    """Split a multi-command input on commas, "and" and "then"."""
+    return [clause for clause in CLAUSE_SEPARATOR.split(text) if clause.strip()]
+
+
+def _expand(pattern: str) -> List[List[str]]:
+    """Expand "[a|b]" optional and "(a|b)" alternative groups into token sequences."""
+    parts = re.findall(r"\[[^\]]*\]|\([^)]*\)|\{[^}]*\}|[^\s\[\(\{]+", pattern)
+    choices = []
+    for part in parts:
+        if part.startswith("["):
+            choices.append([option.split() for option in part[1:-1].split("|")] + [[]])
+        elif part.startswith("("):
+            choices.append([option.split() for option in part[1:-1].split("|")])
+        else:
+            choices.append([[part]])
+    return [list(itertools.chain.from_iterable(combination))
+            for combination in itertools.product(*choices)]
+
+
+class _Node:
+    """Trie node: literal token edges, slot edges and the rule accepted here."""
+    __slots__ = ("literals", "slots", "rule")
+
+    def __init__(self):
+        self.literals: Dict[str, "_Node"] = {}
+        self.slots: Dict[Tuple[str, str], "_Node"] = {}
+        self.rule: Optional[int] = None
+
+
+class IntentMatcher:
+    """
+    Rule-based intent parser compiled into a token trie.
+
+    Every pattern of every rule is expanded and merged into one trie over
+    normalized tokens, so matching walks the input once (with backtracking
+    only at slot edges) regardless of how many rules exist. Only inputs that
+    a pattern covers completely are matched; anything else returns None and
+    is left to the language model.
+    """
+
+    def __init__(self, rules: Optional[List[Tuple[List[str], Template]]] = None,
+                 vocabularies: Optional[Dict[str, Dict[str, object]]] = None):
+        """
+        Args:
+            rules: (patterns, template) pairs; earlier rules win ties
+            vocabularies: Slot kind -> {phrase: value} for phrase slots
+        """
+        self.rules = rules if rules is not None else DEFAULT_RULES
+        self.vocabularies = {}
+        for kind, phrases in (vocabularies or SLOT_VOCABULARIES).items():
+            compiled = {tuple(phrase.split()): value for phrase, value in phrases.items()}
+            # Longest phrase first so "play store" wins over a shorter prefix
+            self.vocabularies[kind] = sorted(compiled.items(), key=lambda item: -len(item[0]))
+        self.root = _Node()
+        for index, (patterns, _) in enumerate(self.rules):
+            for pattern in patterns:
+                for tokens in _expand(pattern):
+                    self._insert(tokens, index)
+
+    def _insert(self, tokens: List[str], rule: int):
+        """Add one expanded pattern to the trie."""
+        node = self.root
+        for token in tokens:
+            if token.startswith("{"):
+                kind, _, name = token[1:-1].partition(":")
+                node = node.slots.setdefault((kind, name or kind), _Node())
+            else:
+                node = node.literals.setdefault(token, _Node())
+        # Earlier rules take precedence when patterns collide
+        if node.rule is None or rule < node.rule:
+            node.rule = rule
+
+    def match(self, text: str) -> Optional[Dict]:
+        """Return the command for text, or None without a complete match."""
+        tokens = normalize(text)
+        if not tokens:
+            return None
+        found = self._walk(self.root, tokens, 0, {}, text)
+        if found is None:
+            return None
+        rule, slots = found
+        template = self.rules[rule][1]
+        if callable(template):
+            return template(slots)
+        return {key: slots[value[1:]] if isinstance(value, str) and value.startswith("$") else value
+                for key, value in template.items()}
+
+    def match_plan(self, text: str,
+                   fallback: Optional[Callable[[str], Optional[Dict]]] = None
+                   ) -> Optional[List[Dict]]:
+        """
+        Return one command per clause, or None unless every clause matches.
+
+        Clauses the rules do not match are passed to fallback if one is
+        given (e.g. IntentIndex.match).
+        """
+        commands = []
+        for clause in split_clauses(text):
+            command = self.match(clause)
+            if command is None and fallback is not None:
+                command = fallback(clause)
+            if command is None:
+                return None
+            commands.append(command)
+        return commands or None
+    
+    def _walk(self, node: _Node, tokens: List[Tuple[str, int, int]], position: int,
+              slots: Dict, text: str) -> Optional[Tuple[int, Dict]]:
+        """Depth-first search for the best complete match from position."""
+        if position == len(tokens):
+            return (node.rule, slots) if node.rule is not None else None
+
+        candidates = []
+        child = node.literals.get(tokens[position][0])
+        if child is not None:
+            found = self._walk(child, tokens, position + 1, slots, text)
+            if found is not None:
+                candidates.append(found)
+
+        for (kind, name), child in node.slots.items():
+            for value, end in self._slot_values(kind, tokens, position, text):
+                found = self._walk(child, tokens, end, dict(slots, **{name: value}), text)
+                if found is not None:
+                    candidates.append(found)
+                    break
+
+        return min(candidates, key=lambda candidate: candidate[0]) if candidates else None
+
+    def _slot_values(self, kind: str, tokens: List[Tuple[str, int, int]], position: int, text: str):
+        """Yield (value, next position) for every way the slot can consume tokens."""
+        token = tokens[position][0]
+        if kind == "number":
+            if token[0].isdigit():
+                number = float(token)
+                yield (int(number) if number.is_integer() else number), position + 1
+        elif kind == "text":
+            # Free text runs to the end of the input, taken verbatim from the
+            # original string (filler words and casing included)
+            start = tokens[position - 1][2] if position else 0
+            value = text[start:].strip().strip("\"'")
+            if value:
+                yield value, len(tokens)
+        else:
+            for phrase, value in self.vocabularies.get(kind, []):
+                if tuple(t for t, _, _ in tokens[position:position + len(phrase)]) == phrase:
+                    yield value, position + len(phrase)
@@ -0,0 +1,55 @@
+from typing import List
+
+
+class JsonObjectScanner:
+    """
+    Incremental scanner that finds complete top-level JSON objects in text.
+
+    Text can arrive in arbitrary chunks (e.g. streamed model tokens). Braces
+    are counted outside of strings only, with escapes honored, so nested
+    objects and braces inside string values are handled. Anything outside an
+    object (prose, code fences) is ignored.
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self._parts: List[str] = []
+
+    def feed(self, chunk: str) -> List[str]:
+        """Consume a chunk and return the objects it completes (usually none or one)."""
+        objects = []
+        start = 0
+        for index, char in enumerate(chunk):
+            if self.depth == 0:
+                if char == "{":
+                    self.depth = 1
+                    start = index
+                continue
+
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char == "{":
+                self.depth += 1
+            elif char == "}":
+                self.depth -= 1
+                if self.depth == 0:
+                    objects.append("".join(self._parts) + chunk[start:index + 1])
+                    self._parts = []
+
+        if self.depth:
+            self._parts.append(chunk[start:])
+        return objects
+
+
+def extract_json_objects(text: str) -> List[str]:
+    """Return every complete top-level JSON object found in text."""
+    return JsonObjectScanner().feed(text)
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Load test: concurrent connections and memory, threaded Flask vs. ASGI server
+Runs each server against a fake adb (no device or Ollama needed), opens many
+concurrent connections and reads the server's RSS and thread count from /proc
+"""
+
+import argparse
+import asyncio
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+from benchmark import make_fake_adb, print_separator
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Each server is started on the given port with the fake adb in PATH
+SERVERS = {
+    "threaded": [sys.executable, "-c",
+                 "import sys; from app import app; "
+                 "app.run(host='127.0.0.1', port=int(sys.argv[1]), threaded=True)"],
+    "asgi": [sys.executable, "-m", "uvicorn", "asgi:app", "--host", "127.0.0.1",
+             "--log-level", "warning", "--port"],
+}
+
+# The fake adb server runs in its own process so the load generator does not
+# slow it down; it prints its port once listening
+FAKE_ADB_SERVER = [sys.executable, "-c",
+                   "import time; from benchmark import start_fake_adb_server; "
+                   "print(start_fake_adb_server().server_address[1], flush=True); time.sleep(1e9)"]
+
+# A 360x640 RGBA frame in raw `screencap` format, with changing content so
+# the stream keeps publishing
+FAKE_SCREENCAP = """#!{python}
+import struct, sys, time
+width, height = 360, 640
+shade = int(time.time() * 10) % 256
+sys.stdout.buffer.write(struct.pack('<IIII', width, height, 1, 0) + bytes([shade]) * (width * height * 4))
+"""
+
+
+def free_port() -> int:
+    """Pick an unused local port."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def process_stats(pid: int) -> Dict:
+    """Read resident memory (MB) and thread count of a process."""
+    stats = {}
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            key, _, value = line.partition(":")
+            if key == "VmRSS":
+                stats["rss_mb"] = int(value.split()[0]) / 1024
+            elif key == "Threads":
+                stats["threads"] = int(value)
+    return stats
+
+
+def wait_ready(port: int, process: subprocess.Popen, timeout: float = 30.0):
+    """Wait until the server accepts connections."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with code {process.returncode}")
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+
+async def open_stream(port: int, path: str, hold: asyncio.Event, connected: List[float]) -> bool:
+    """Request a streaming endpoint and keep the connection open until hold is set.
+
+    The time the response started is appended to connected.
+    """
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), 10)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    try:
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+        await writer.drain()
+        status_line = await asyncio.wait_for(reader.readline(), 30)
+        if b" 200 " not in status_line:
+            return False
+        connected.append(time.perf_counter())
+        # Keep reading so the server never blocks on a full socket buffer
+        while not hold.is_set():
+            try:
+                if not await asyncio.wait_for(reader.read(65536), 0.5):
+                    return False
+            except asyncio.TimeoutError:
+                pass
+        return True
+    except (OSError, asyncio.TimeoutError):
+        return False
+    finally:
+        writer.close()
+
+
+async def fetch(port: int, path: str) -> float:
+    """Issue one request on a new connection; returns seconds taken, or -1 on failure."""
+    start = time.perf_counter()
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), 10)
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n".encode())
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), 30)
+        writer.close()
+    except (OSError, asyncio.TimeoutError):
+        return -1.0
+    return time.perf_counter() - start if b" 200 " in response.split(b"\r\n", 1)[0] else -1.0
+
+
+async def hold_streams(port: int, pid: int, connections: int, hold_seconds: float) -> Dict:
+    """Open concurrent MJPEG viewers, hold them, and sample the server while they are open."""
+    hold = asyncio.Event()
+    connected: List[float] = []
+    start = time.perf_counter()
+    tasks = [asyncio.ensure_future(open_stream(port, "/api/stream", hold, connected))
+             for _ in range(connections)]
+    await asyncio.sleep(hold_seconds)
+    stats = process_stats(pid)
+    # Only viewers whose response had started count as connected
+    stats["connected"] = len(connected)
+    stats["last_connect_ms"] = (max(connected) - start) * 1000 if connected else 0.0
+    hold.set()
+    results = await asyncio.gather(*tasks)
+    stats["held"] = sum(results)
+    return stats
+
+
+async def burst_status(port: int, pid: int, connections: int) -> Dict:
+    """Fire concurrent /api/status requests and report latency."""
+    timings = await asyncio.gather(*[fetch(port, "/api/status") for _ in range(connections)])
+    stats = process_stats(pid)
+    succeeded = sorted(timing for timing in timings if timing >= 0)
+    stats["succeeded"] = len(succeeded)
+    if succeeded:
+        stats["p50_ms"] = succeeded[len(succeeded) // 2] * 1000
+        stats["max_ms"] = succeeded[-1] * 1000
+    return stats
+
+
+def run_server(name: str, connections: int, hold_seconds: float, adb_port: int):
+    """Start one server, run both scenarios against it and print the results."""
+    print_separator(f"{name} server ({connections} connections)")
+    port = free_port()
+    env = dict(os.environ, ANDROID_ADB_SERVER_PORT=str(adb_port), PYTHONUNBUFFERED="1")
+    process = subprocess.Popen(SERVERS[name] + [str(port)], cwd=BASE_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready(port, process)
+        # Let startup work (status refresh, model loading attempt) settle
+        time.sleep(2)
+        # The first status request builds the snapshot; time the steady state
+        asyncio.run(fetch(port, "/api/status"))
+        idle = process_stats(process.pid)
+        print(f"  idle         {idle['rss_mb']:7.1f} MB RSS   {idle['threads']:5d} threads")
+
+        status = asyncio.run(burst_status(port, process.pid, connections))
+        print(f"  /api/status  {status['succeeded']:5d}/{connections} ok   "
+              f"p50 {status.get('p50_ms', 0):7.1f} ms   max {status.get('max_ms', 0):7.1f} ms")
+
+        stream = asyncio.run(hold_streams(port, process.pid, connections, hold_seconds))
+        print(f"  /api/stream  {stream['connected']:5d}/{connections} streaming after {hold_seconds:.0f}s "
+              f"(last started at {stream['last_connect_ms']:.0f} ms)   {stream['held']:5d} held to the end")
+        print(f"  under load   {stream['rss_mb']:7.1f} MB RSS   {stream['threads']:5d} threads   "
+              f"(+{stream['rss_mb'] - idle['rss_mb']:.1f} MB)")
+    finally:
+        process.terminate()
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main():
+    """Main load test function."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--connections', type=int, default=200, help='concurrent connections')
+    parser.add_argument('--hold', type=float, default=10.0, help='seconds to hold stream connections')
+    parser.add_argument('servers', nargs='*', default=['threaded', 'asgi'], help='servers: threaded, asgi')
+    args = parser.parse_args()
+
+    # Every connection is a file descriptor on both ends
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = min(hard, max(soft, args.connections * 4 + 256))
+    resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+
+    with tempfile.TemporaryDirectory() as directory:
+        make_fake_adb(directory)
+        screencap = os.path.join(directory, 'screencap')
+        with open(screencap, 'w') as f:
+            f.write(FAKE_SCREENCAP.format(python=sys.executable))
+        os.chmod(screencap, 0o755)
+        adb_server = subprocess.Popen(FAKE_ADB_SERVER, cwd=BASE_DIR, stdout=subprocess.PIPE, text=True)
+        try:
+            adb_port = int(adb_server.stdout.readline())
+            for name in args.servers:
+                run_server(name, args.connections, args.hold, adb_port)
+        finally:
+            adb_server.kill()
+            adb_server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+
+def normalize_command(user_input: str) -> str:
+    """Normalize a command for cache lookup.
+
+    Whitespace is collapsed and trailing punctuation dropped. Case is kept
+    because it can change the result (e.g. the text of a type action).
+    """
+    return " ".join(user_input.split()).rstrip(".!?")
+
+
+class ParseCache:
+    """
+    Two-tier cache of parsed commands: an in-memory LRU in front of an
+    optional SQLite file.
+
+    Entries are keyed on the normalized input, model name and prompt version,
+    so changing either invalidates old results. The SQLite tier survives
+    restarts and can be shared by several worker processes (WAL mode).
+    """
+
+    def __init__(self, max_entries: int = 256, path: Optional[str] = None):
+        """
+        Args:
+            max_entries: Capacity of the in-memory tier
+            path: SQLite file for the persistent tier (None for memory only)
+        """
+        self.max_entries = max_entries
+        self.path = path
+        self.entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+        self._lock = threading.Lock()
+        # sqlite3 connections cannot be shared between threads
+        self._local = threading.local()
+
+        if path:
+            connection = self._connection()
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS parse_cache "
+                "(key TEXT PRIMARY KEY, command TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            connection.commit()
+
+    @staticmethod
+    def make_key(user_input: str, model_name: str, prompt_version: str) -> str:
+        """Build the cache key for an input under a model and prompt version."""
+        return f"{model_name}\x1f{prompt_version}\x1f{normalize_command(user_input)}"
+
+    def _connection(self) -> sqlite3.Connection:
+        """Get this thread's SQLite connection."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5.0)
+            self._local.connection = connection
+        return connection
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Get a copy of the cached command, or None on a miss."""
+        with self._lock:
+            command = self.entries.get(key)
+            if command is not None:
+                self.entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return dict(command)
+
+        if self.path:
+            try:
+                row = self._connection().execute(
+                    "SELECT command FROM parse_cache WHERE key = ?", (key,)
+                ).fetchone()
+            except sqlite3.Error as e:
+                print(f"Parse cache read failed: {e}")
+                row = None
+            if row is not None:
+                command = json.loads(row[0])
+                with self._lock:
+                    self.stats["disk_hits"] += 1
+                self._remember(key, command)
+                return dict(command)
+
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def put(self, key: str, command: Dict):
+        """Store a validated command in both tiers."""
+        command = dict(command)
+        self._remember(key, command)
+
+        if self.path:
+            try:
+                connection = self._connection()
+                connection.execute(
+                    "INSERT OR REPLACE INTO parse_cache (key, command, created) VALUES (?, ?, ?)",
+                    (key, json.dumps(command), time.time())
+                )
+                connection.commit()
+            except sqlite3.Error as e:
+                print(f"Parse cache write failed: {e}")
+
+    def _remember(self, key: str, command: Dict):
+        """Insert into the memory tier, evicting the least recently used entry."""
+        with self._lock:
+            self.entries[key] = command
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def clear(self):
+        """Drop every entry from both tiers."""
+        with self._lock:
+            self.entries.clear()
+        if self.path:
+            connection = self._connection()
+            connection.execute("DELETE FROM parse_cache")
+            connection.commit()
+
+    def get_stats(self) -> Dict:
+        """Get hit/miss/eviction counts and the memory tier size."""
+        with self._lock:
+            stats = dict(self.stats, size=len(self.entries), max_entries=self.max_entries,
+                         persistent=bool(self.path))
+        lookups = stats["hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_ratio"] = (stats["hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,202 @@
+import json
+import re
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+from action_registry import ACTION_SPECS, ActionSpec, prompt_action_list
+
+PROMPT_HEADER = "You are an Android device controller. Convert natural language commands into structured JSON actions."
+
+PROMPT_FOOTER = """IMPORTANT: Respond ONLY with valid JSON. No explanations or additional text.
+
+Convert this command: "{user_input}"
+"""
+
+# Few-shot examples: (user input, expected command)
+EXAMPLES: List[Tuple[str, Dict]] = [
+    ("Take a screenshot", {"action": "screenshot"}),
+    ("Record screen for 30 seconds", {"action": "screen_record", "duration": 30}),
+    ("Go back", {"action": "key", "keycode": "BACK"}),
+    ("Open camera", {"action": "app", "package": "com.android.camera"}),
+    ("Type hello world", {"action": "type", "text": "hello world"}),
+    ("Scroll down", {"action": "scroll", "direction": "down"}),
+    ("Long press in the center", {"action": "long_press", "x": 540, "y": 960, "duration": 1000}),
+    ("Turn on WiFi", {"action": "wifi", "enabled": True}),
+    ("Set brightness to 50%", {"action": "brightness", "level": 128}),
+    ("Rotate to landscape", {"action": "rotate", "orientation": "landscape"}),
+    ("Enable dark mode", {"action": "dark_mode", "enabled": True}),
+    ("Get device info", {"action": "get_device_info"}),
+    ("Find element with text Login", {"action": "find_element", "method": "text", "value": "Login"}),
+    ("Swipe from left to right", {"action": "swipe", "start_x": 100, "start_y": 960, "end_x": 980,
+                                  "end_y": 960, "duration": 300}),
+    ("Pinch to zoom out", {"action": "pinch", "x": 540, "y": 960, "scale": 0.5}),
+    ("Open notification panel", {"action": "notification_panel", "expand": True}),
+    ("Turn on flashlight", {"action": "flashlight", "enabled": True}),
+    ("Reboot device", {"action": "reboot", "mode": "normal"}),
+    ("Wait 3 seconds", {"action": "wait", "seconds": 3}),
+]
+
+# Words users say for an action beyond those in its name and parameters
+ACTION_KEYWORDS = {
+    "tap": "click touch press hit select button",
+    "long_press": "hold",
+    "double_tap": "twice",
+    "swipe": "slide",
+    "pinch": "shrink smaller",
+    "zoom": "enlarge bigger magnify",
+    "type": "write enter input text say",
+    "clear_text": "erase empty field",
+    "key": "press button back home menu power enter",
+    "app": "open launch start run application",
+    "app_info": "details application",
+    "force_stop": "kill close quit",
+    "uninstall": "remove delete",
+    "screenshot": "capture snapshot screen picture",
+    "screen_record": "video recording",
+    "scroll": "page down up",
+    "fling": "flick fast",
+    "drag": "move",
+    "rotate": "orientation turn",
+    "brightness": "bright dim screen light",
+    "volume": "sound loud quiet louder quieter mute",
+    "wifi": "wireless internet network",
+    "airplane_mode": "flight plane",
+    "location": "gps",
+    "notification_panel": "notifications shade",
+    "recent_apps": "recents switcher multitask",
+    "split_screen": "side",
+    "picture_in_picture": "pip",
+    "accessibility": "talkback magnification",
+    "input_method": "keyboard ime",
+    "language": "locale",
+    "timezone": "time zone",
+    "sleep_timeout": "screen timeout sleep",
+    "font_size": "text larger smaller",
+    "dark_mode": "night theme",
+    "do_not_disturb": "silent quiet dnd",
+    "hotspot": "tether tethering",
+    "cast_screen": "mirror chromecast",
+    "reboot": "restart",
+    "shutdown": "power off turn",
+    "wake_up": "wake",
+    "lock_screen": "lock",
+    "unlock_screen": "unlock pin password",
+    "emergency_call": "emergency 911",
+    "flashlight": "torch light",
+    "vibrate": "buzz",
+    "play_sound": "audio music",
+    "tts": "speak say read aloud",
+    "ocr": "read recognize",
+    "find_element": "find locate search",
+    "wait_for_element": "appear until",
+    "assert_element": "check verify exists",
+    "get_battery_info": "charge charging",
+    "get_running_apps": "processes",
+    "get_installed_apps": "list",
+    "shell_command": "run execute",
+    "file_operation": "file copy move delete folder",
+    "permission": "grant revoke allow",
+    "monkey_test": "random events",
+    "ui_hierarchy": "dump layout tree",
+    "compare_screenshots": "diff difference",
+    "conditional": "if else",
+    "loop": "repeat times",
+    "wait": "pause sleep delay seconds",
+}
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Rough BPE-style token estimate: words, numbers and punctuation marks
+TOKEN_ESTIMATE_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the token count of a prompt (words and punctuation)."""
+    return len(TOKEN_ESTIMATE_PATTERN.findall(text))
+
+
+def _terms(text: str) -> List[str]:
+    """Lowercase words with a trailing plural "s" stripped."""
+    words = WORD_PATTERN.findall(text.lower().replace("_", " "))
+    return [word[:-1] if len(word) > 3 and word.endswith("s") else word for word in words]
+
+
+def render_prompt(specs: List[ActionSpec], examples: List[Tuple[str, Dict]]) -> str:
+    """Render a system prompt listing the given actions and examples."""
+    shots = "\n\n".join(f'User: "{user}"\nResponse: {json.dumps(command)}' for user, command in examples)
+    return (f"{PROMPT_HEADER}\n\nAvailable actions:\n{prompt_action_list(specs)}\n\n"
+            f"Examples:\n{shots}\n\n{PROMPT_FOOTER}")
+
+
+class PromptBuilder:
+    """
+    Builds a system prompt containing only the actions relevant to an input.
+
+    Actions are scored against the input with a small inverted index over
+    their names, parameter names and values, keyword synonyms and the inputs
+    of their examples. The top-k actions and their examples go into the
+    prompt; when nothing scores, the caller should use the full prompt.
+    """
+
+    # Term weights by where the term came from
+    NAME_WEIGHT = 3.0
+    KEYWORD_WEIGHT = 2.0
+    EXAMPLE_WEIGHT = 1.5
+    VALUE_WEIGHT = 1.0
+    PARAM_WEIGHT = 0.5
+
+    def __init__(self, specs: Optional[List[ActionSpec]] = None,
+                 examples: Optional[List[Tuple[str, Dict]]] = None,
+                 top_k: int = 8, max_examples: int = 4):
+        """
+        Args:
+            specs: Actions to choose from (defaults to the whole registry)
+            examples: Few-shot examples to choose from
+            top_k: Maximum number of actions per prompt
+            max_examples: Maximum number of examples per prompt
+        """
+        self.specs = specs or ACTION_SPECS
+        self.examples = examples if examples is not None else EXAMPLES
+        self.top_k = top_k
+        self.max_examples = max_examples
+        self.index: Dict[str, Dict[str, float]] = defaultdict(dict)
+
+        for spec in self.specs:
+            self._add(spec.name, _terms(spec.name), self.NAME_WEIGHT)
+            self._add(spec.name, _terms(ACTION_KEYWORDS.get(spec.name, "")), self.KEYWORD_WEIGHT)
+            for param in spec.params:
+                self._add(spec.name, _terms(param.name), self.PARAM_WEIGHT)
+                if param.choices:
+                    self._add(spec.name, _terms(" ".join(param.choices)), self.VALUE_WEIGHT)
+        for user, command in self.examples:
+            self._add(command["action"], _terms(user), self.EXAMPLE_WEIGHT)
+
+    def _add(self, action: str, terms: List[str], weight: float):
+        """Index terms for an action, keeping the highest weight per term."""
+        for term in terms:
+            postings = self.index[term]
+            postings[action] = max(postings.get(action, 0.0), weight)
+
+    def rank(self, user_input: str) -> List[Tuple[str, float]]:
+        """Score actions against the input, best first (only actions that scored)."""
+        scores: Dict[str, float] = defaultdict(float)
+        for term in set(_terms(user_input)):
+            for action, weight in self.index.get(term, {}).items():
+                scores[action] += weight
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+    def build(self, user_input: str) -> Optional[Tuple[str, List[ActionSpec]]]:
+        """
+        Build a pruned prompt for the input.
+
+        Returns (prompt, selected specs), or None if no action matched and
+        the full prompt should be used.
+        """
+        ranked = self.rank(user_input)[:self.top_k]
+        if not ranked:
+            return None
+
+        selected = {action for action, _ in ranked}
+        # Keep registry order so prompts for similar inputs share a prefix
+        specs = [spec for spec in self.specs if spec.name in selected]
+        examples = [example for example in self.examples if example[1]["action"] in selected]
+        return render_prompt(specs, examples[:self.max_examples]), specs
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Pipelined runner for natural-language command scripts
+Parses the next commands while the current one executes on the device
+
+A script has one step per line:
+
+    # Blank lines and lines starting with # are ignored
+    open settings
+    wait 2
+    expect app com.android.settings
+    expect text Wi-Fi
+    expect no text Error
+    tap the wifi toggle
+
+`wait N` sleeps on the host. `expect` checks the foreground app or the text
+on screen, polling until it holds or --expect-timeout passes. Every other
+line is a command for the parser.
+
+    python run_script.py flows/settings.txt --lookahead 2 --on-failure continue
+"""
+
+import argparse
+import json
+import re
+import sys
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from gemma_controller import GemmaController
+from android_controller import AndroidController
+
+WAIT_PATTERN = re.compile(r"^wait\s+(\d+(?:\.\d+)?)\s*(?:s|secs?|seconds?)?$", re.IGNORECASE)
+EXPECT_PATTERN = re.compile(r"^expect\s+(no\s+)?(app|text)\s+(.+)$", re.IGNORECASE)
+
+# Seconds between polls of a pending expectation
+EXPECT_POLL_INTERVAL = 0.5
+
+FAILURE_POLICIES = ("stop", "continue")
+
+
+class Step:
+    """One line of a script: a command to parse, a wait or an expectation."""
+
+    def __init__(self, line: int, text: str, kind: str, seconds: float = 0.0,
+                 target: Optional[str] = None, value: Optional[str] = None, negate: bool = False):
+        self.line = line
+        self.text = text
+        self.kind = kind
+        self.seconds = seconds
+        self.target = target
+        self.value = value
+        self.negate = negate
+
+
+def parse_script(lines: List[str]) -> List[Step]:
+    """Turn script lines into steps."""
+    steps = []
+    for number, raw in enumerate(lines, 1):
+        text = raw.strip()
+        if not text or text.startswith("#"):
+            continue
+        wait = WAIT_PATTERN.match(text)
+        expect = EXPECT_PATTERN.match(text)
+        if wait:
+            steps.append(Step(number, text, "wait", seconds=float(wait.group(1))))
+        elif expect:
+            steps.append(Step(number, text, "expect", target=expect.group(2).lower(),
+                              value=expect.group(3).strip().strip("\"'"), negate=bool(expect.group(1))))
+        else:
+            steps.append(Step(number, text, "command"))
+    return steps
+
+
+def load_script(path: str) -> List[Step]:
+    """Read and parse a script file."""
+    with open(path, encoding="utf-8") as script:
+        return parse_script(script.readlines())
+
+
+class ScriptRunner:
+    """
+    Runs script steps in order while parsing upcoming commands ahead.
+
+    A single parse thread works up to `lookahead` commands ahead of the
+    step being executed, so model latency overlaps device time and idle
+    waits. Lookahead 0 parses each command only when it is reached.
+    Commands are parsed from text alone: a screen-dependent (vision) parse
+    cannot run ahead of the actions that change the screen.
+    """
+
+    def __init__(self, gemma: GemmaController, android: AndroidController, lookahead: int = 2,
+                 on_failure: str = "stop", expect_timeout: float = 5.0):
+        """
+        Args:
+            gemma: Parses commands (fast path, cache, index, then the model)
+            android: Executes parsed commands
+            lookahead: How many commands may be parsed ahead of execution
+            on_failure: "stop" skips the remaining steps after a failure,
+                "continue" runs them anyway
+            expect_timeout: Seconds an expectation may take to hold
+        """
+        if on_failure not in FAILURE_POLICIES:
+            raise ValueError(f"on_failure must be one of: {', '.join(FAILURE_POLICIES)}")
+        self.gemma = gemma
+        self.android = android
+        self.lookahead = max(0, lookahead)
+        self.on_failure = on_failure
+        self.expect_timeout = expect_timeout
+
+    def run(self, steps: List[Step]) -> List[Dict]:
+        """
+        Run the steps and return one result per step.
+
+        Each result has the step's line, text and kind, its status (passed,
+        failed or skipped), a message, and timings in seconds: parse (time
+        the parser spent), parse_wait (time execution waited for the parse)
+        and execute.
+        """
+        results = []
+        parses: Dict[int, Future] = {}
+        scheduled = 0
+        failed = False
+
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="parse") as parser:
+            for index, step in enumerate(steps):
+                if failed and self.on_failure == "stop":
+                    results.append(self._result(step, "skipped", "Skipped after an earlier failure"))
+                    continue
+
+                # Queue this step's parse and up to `lookahead` later commands
+                while scheduled < len(steps) and (
+                        scheduled <= index or self._commands_between(steps, index + 1, scheduled) < self.lookahead):
+                    if steps[scheduled].kind == "command":
+                        parses[scheduled] = parser.submit(self._timed_parse, steps[scheduled].text)
+                    scheduled += 1
+
+                if step.kind == "command":
+                    result = self._run_command(step, parses.pop(index))
+                elif step.kind == "wait":
+                    start = time.perf_counter()
+                    time.sleep(step.seconds)
+                    result = self._result(step, "passed", f"Waited {step.seconds:g} seconds",
+                                          execute=time.perf_counter() - start)
+                else:
+                    result = self._run_expect(step)
+
+                results.append(result)
+                if result["status"] == "failed":
+                    failed = True
+                    if self.on_failure == "stop":
+                        # Parses that have not started are dropped
+                        for future in parses.values():
+                            future.cancel()
+        return results
+
+    @staticmethod
+    def _commands_between(steps: List[Step], start: int, end: int) -> int:
+        """Count command steps in steps[start:end]."""
+        return sum(1 for step in steps[start:end] if step.kind == "command")
+
+    def _timed_parse(self, text: str) -> Tuple[Dict, float]:
+        """Parse a command and return (command, seconds taken)."""
+        start = time.perf_counter()
+        command = self.gemma.parse_command(text)
+        return command, time.perf_counter() - start
+
+    def _run_command(self, step: Step, parse: Future) -> Dict:
+        """Wait for a command's parse and execute it."""
+        start = time.perf_counter()
+        try:
+            command, parse_seconds = parse.result()
+        except Exception as e:
+            command, parse_seconds = {"error": str(e)}, time.perf_counter() - start
+        parse_wait = time.perf_counter() - start
+
+        if "error" in command:
+            return self._result(step, "failed", f"Parse error: {command['error']}",
+                                parse=parse_seconds, parse_wait=parse_wait)
+
+        start = time.perf_counter()
+        outcome = self.android.execute_command(dict(command))
+        execute = time.perf_counter() - start
+        status = "failed" if "error" in outcome else "passed"
+        message = outcome.get("error") or outcome.get("message", "Command executed")
+        return self._result(step, status, message, command=command, parse=parse_seconds,
+                            parse_wait=parse_wait, execute=execute)
+
+    def _run_expect(self, step: Step) -> Dict:
+        """Poll the device until the expectation holds or the timeout passes."""
+        start = time.perf_counter()
+        deadline = time.monotonic() + self.expect_timeout
+        while True:
+            holds, observed = self._check(step)
+            if holds or time.monotonic() >= deadline:
+                break
+            time.sleep(EXPECT_POLL_INTERVAL)
+        execute = time.perf_counter() - start
+
+        if holds:
+            return self._result(step, "passed", observed, execute=execute)
+        return self._result(step, "failed", f"Expectation not met after {self.expect_timeout:g}s: {observed}",
+                            execute=execute)
+
+    def _check(self, step: Step) -> Tuple[bool, str]:
+        """Evaluate an expectation once: (holds, what was observed)."""
+        if step.target == "app":
+            found = self.android.get_foreground_app()
+            if "error" in found:
+                return False, found["error"]
+            holds = found["package"] == step.value
+            observed = f"foreground app is {found['package']}"
+        else:
+            found = self.android.get_screen_text()
+            if "error" in found:
+                return False, found["error"]
+            value = step.value.lower()
+            holds = any(value in text.lower() for text in found["texts"])
+            observed = f"'{step.value}' {'is' if holds else 'is not'} on screen"
+        return holds != step.negate, observed
+
+    @staticmethod
+    def _result(step: Step, status: str, message: str, command: Optional[Dict] = None,
+                parse: float = 0.0, parse_wait: float = 0.0, execute: float = 0.0) -> Dict:
+        """Build a step result."""
+        return {"line": step.line, "text": step.text, "kind": step.kind, "status": status,
+                "message": message, "command": command, "parse": parse, "parse_wait": parse_wait,
+                "execute": execute}
+
+
+def print_report(results: List[Dict], wall_seconds: float):
+    """Print per-step timings and a summary of how much parsing was overlapped."""
+    icons = {"passed": "✅", "failed": "❌", "skipped": "⏭️ "}
+    print(f"\n{'':3}{'line':>5}  {'step':<40} {'parse':>9} {'waited':>9} {'execute':>9}")
+    for result in results:
+        text = result["text"] if len(result["text"]) <= 40 else result["text"][:37] + "..."
+        print(f"{icons[result['status']]} {result['line']:5d}  {text:<40} "
+              f"{result['parse'] * 1000:7.0f}ms {result['parse_wait'] * 1000:7.0f}ms "
+              f"{result['execute'] * 1000:7.0f}ms")
+        if result["status"] == "failed":
+            print(f"{'':10}{result['message']}")
+
+    parse = sum(result["parse"] for result in results)
+    waited = sum(result["parse_wait"] for result in results)
+    execute = sum(result["execute"] for result in results)
+    counts = {status: sum(1 for result in results if result["status"] == status) for status in icons}
+    print(f"\n{counts['passed']} passed, {counts['failed']} failed, {counts['skipped']} skipped "
+          f"in {wall_seconds:.2f}s")
+    print(f"Parsing {parse:.2f}s, of which {parse - waited:.2f}s overlapped execution; "
+          f"executing {execute:.2f}s (serial estimate {parse + execute:.2f}s)")
+
+
+def main():
+    """Run a command script against the connected device."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("script", help="command script, one step per line")
+    parser.add_argument("--lookahead", type=int, default=2, help="commands parsed ahead of execution (0 = serial)")
+    parser.add_argument("--on-failure", choices=FAILURE_POLICIES, default="stop",
+                        help="stop at the first failure or continue with the remaining steps")
+    parser.add_argument("--expect-timeout", type=float, default=5.0, help="seconds an expectation may take to hold")
+    parser.add_argument("--device", help="serial of the device to use (default: first connected)")
+    parser.add_argument("--model", default="gemma3:latest", help="Ollama model")
+    parser.add_argument("--report", help="also write the results as JSON to this file")
+    args = parser.parse_args()
+
+    try:
+        steps = load_script(args.script)
+    except OSError as e:
+        print(f"❌ Cannot read script: {e}")
+        sys.exit(2)
+
+    android = AndroidController(device_id=args.device)
+    connection = android.check_adb_connection()
+    if "error" in connection:
+        print(f"❌ Android connection failed: {connection['error']}")
+        sys.exit(2)
+
+    gemma = GemmaController(args.model)
+    if not gemma.load_model():
+        # Known commands still resolve locally; the rest fail to parse
+        print("⚠️ Model not loaded; only commands resolved without the model "
+              "will run")
+
+    print(f"📜 Running {len(steps)} steps from {args.script} on {android.device_id} "
+          f"(lookahead {args.lookahead}, on failure: {args.on_failure})")
+    runner = ScriptRunner(gemma, android, lookahead=args.lookahead, on_failure=args.on_failure,
+                          expect_timeout=args.expect_timeout)
+    start = time.perf_counter()
+    try:
+        results = runner.run(steps)
+    finally:
+        android.close()
+    print_report(results, time.perf_counter() - start)
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as report:
+            json.dump(results, report, indent=2)
+
+    sys.exit(1 if any(result["status"] == "failed" for result in results) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import base64
+import hashlib
+import math
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+import numpy as np
+from imaging import encode_frame
+
+# Gemma 3's vision encoder sees 896x896 inputs as 64x64 patches of 14 pixels;
+# larger images cost upload and resize time without adding detail
+PATCH_SIZE = 14
+DEFAULT_PATCH_BUDGET = 4096
+
+# Command keys holding screen coordinates, by axis
+X_KEYS = ("x", "start_x", "end_x")
+Y_KEYS = ("y", "start_y", "end_y")
+
+
+class EncodedScreen:
+    """A screenshot prepared for a vision request."""
+
+    __slots__ = ("image", "width", "height")
+
+    def __init__(self, image: str, width: int, height: int):
+        self.image = image  # base64 JPEG
+        self.width = width
+        self.height = height
+
+
+class ScreenEncoder:
+    """
+    Turns device frames into small images for multimodal requests.
+
+    Frames are downscaled to fit a patch budget, optionally converted to
+    grayscale and JPEG-compressed. Encodings are cached by frame content, so
+    consecutive commands on an unchanged screen reuse the same image.
+    """
+
+    def __init__(self, patch_budget: int = DEFAULT_PATCH_BUDGET, grayscale: bool = False,
+                 quality: int = 70, cache_size: int = 4):
+        """
+        Args:
+            patch_budget: Maximum number of PATCH_SIZE x PATCH_SIZE patches per image
+            grayscale: Send a single luminance channel (smaller, loses color cues)
+            quality: JPEG quality (1-100)
+            cache_size: Number of recent screens whose encodings are kept
+        """
+        self.patch_budget = patch_budget
+        self.grayscale = grayscale
+        self.quality = quality
+        self.cache_size = cache_size
+        self.entries: "OrderedDict[bytes, EncodedScreen]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+
+    def target_size(self, width: int, height: int) -> Tuple[int, int]:
+        """Largest size with the frame's aspect ratio that fits the patch budget."""
+        max_pixels = self.patch_budget * PATCH_SIZE * PATCH_SIZE
+        scale = min(1.0, math.sqrt(max_pixels / (width * height)))
+        return max(1, int(width * scale)), max(1, int(height * scale))
+
+    def encode(self, frame: np.ndarray) -> EncodedScreen:
+        """Encode an RGBA frame, reusing the cached image if the screen is unchanged."""
+        digest = hashlib.blake2b(np.ascontiguousarray(frame), digest_size=16).digest()
+        with self._lock:
+            screen = self.entries.get(digest)
+            if screen is not None:
+                self.entries.move_to_end(digest)
+                self.stats["hits"] += 1
+                return screen
+            self.stats["misses"] += 1
+
+        height, width = frame.shape[:2]
+        target_width, target_height = self.target_size(width, height)
+        data = encode_frame(frame, "JPEG", max_width=target_width, grayscale=self.grayscale,
+                            quality=self.quality)
+        screen = EncodedScreen(base64.b64encode(data).decode("ascii"), target_width,
+                               max(1, round(height * target_width / width)))
+
+        with self._lock:
+            self.entries[digest] = screen
+            while len(self.entries) > self.cache_size:
+                self.entries.popitem(last=False)
+        return screen
+
+    def get_stats(self) -> Dict:
+        """Get encoding cache hits and misses."""
+        with self._lock:
+            return dict(self.stats, size=len(self.entries))
+
+
+def rescale_coordinates(command: Dict, image_size: Tuple[int, int],
+                        screen_size: Optional[Tuple[int, int]]) -> Dict:
+    """Map coordinates given in screenshot pixels back to device pixels, in place."""
+    if not screen_size:
+        return command
+    scale_x = screen_size[0] / image_size[0]
+    scale_y = screen_size[1] / image_size[1]
+    for keys, scale, limit in ((X_KEYS, scale_x, screen_size[0]), (Y_KEYS, scale_y, screen_size[1])):
+        for key in keys:
+            if isinstance(command.get(key), (int, float)):
+                command[key] = min(limit - 1, max(0, round(command[key] * scale)))
+    return command
@@ -0,0 +1,259 @@
+import asyncio
+import hashlib
+import threading
+import time
+import numpy as np
+from typing import Awaitable, Callable, Dict, Iterator, Optional, Tuple
+from imaging import encode_frame
+
+
+class FrameBroadcaster:
+    """One capture loop per device whose JPEG frames are shared by all viewers.
+
+    Viewers never queue frames: each one waits for a sequence number newer
+    than the last it sent and then takes whatever frame is latest, so slow
+    clients simply skip frames instead of backing up the capture loop.
+    """
+
+    def __init__(self, capture: Callable[[], np.ndarray], capture_slots: threading.Semaphore,
+                 max_fps: float = 10.0, min_fps: float = 1.0,
+                 max_width: int = 720, quality: int = 70):
+        """
+        Args:
+            capture: Returns a fresh RGBA frame for the device
+            capture_slots: Semaphore bounding concurrent captures across devices
+        """
+        self.capture = capture
+        self.capture_slots = capture_slots
+        self.max_fps = max_fps
+        self.min_fps = min_fps
+        self.max_width = max_width
+        self.quality = quality
+
+        self.subscribers = 0
+        self.sequence = 0
+        self.frame: Optional[bytes] = None
+        self.fps = 0.0
+        self.last_error: Optional[str] = None
+        self._thread: Optional[threading.Thread] = None
+        self._condition = threading.Condition()
+
+    def subscribe(self):
+        """Register a viewer and make sure the capture loop is running."""
+        with self._condition:
+            self.subscribers += 1
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._capture_loop)
+                self._thread.daemon = True
+                self._thread.start()
+
+    def unsubscribe(self):
+        """Remove a viewer; the loop stops once nobody is watching."""
+        with self._condition:
+            self.subscribers = max(0, self.subscribers - 1)
+            self._condition.notify_all()
+
+    def wait_frame(self, last_sequence: int, timeout: float = 5.0) -> Tuple[int, Optional[bytes]]:
+        """Block until a frame newer than last_sequence exists, or until timeout."""
+        with self._condition:
+            self._condition.wait_for(lambda: self.sequence > last_sequence, timeout=timeout)
+            return self.sequence, self.frame
+
+    def frames(self, timeout: float = 5.0, max_empty_waits: int = 3) -> Iterator[bytes]:
+        """Yield frames for one viewer, subscribed for as long as the generator runs.
+
+        Ends once max_empty_waits waits in a row see no frame at all, so a
+        device that never produces one cannot hold the viewer open forever.
+        A static screen repeats its last frame every timeout seconds, which
+        keeps the connection alive and detects viewers that went away.
+        """
+        self.subscribe()
+        try:
+            sequence = 0
+            empty_waits = 0
+            while empty_waits < max_empty_waits:
+                sequence, frame = self.wait_frame(sequence, timeout)
+                if frame is None:
+                    empty_waits += 1
+                    continue
+                empty_waits = 0
+                yield frame
+        finally:
+            # Runs when the viewer disconnects and the generator is closed
+            self.unsubscribe()
+
+    def _publish(self, frame: bytes):
+        """Make a new encoded frame visible to every viewer."""
+        with self._condition:
+            self.frame = frame
+            self.sequence += 1
+            self._condition.notify_all()
+
+    def _capture_loop(self):
+        """Capture, encode and publish frames while there are subscribers."""
+        interval = 1.0 / self.max_fps
+        last_digest = None
+
+        while True:
+            with self._condition:
+                if self.subscribers == 0:
+                    self._thread = None
+                    return
+
+            started = time.monotonic()
+            try:
+                # Bound how many devices capture at once across the process
+                with self.capture_slots:
+                    frame = self.capture()
+
+                digest = hashlib.blake2b(np.ascontiguousarray(frame), digest_size=16).digest()
+                if digest == last_digest:
+                    # Static screen: back off towards min_fps
+                    interval = min(1.0 / self.min_fps, interval * 1.5)
+                else:
+                    last_digest = digest
+                    interval = 1.0 / self.max_fps
+                    self._publish(encode_frame(frame, "JPEG", max_width=self.max_width,
+                                               quality=self.quality))
+                self.last_error = None
+
+            except Exception as e:
+                print(f"Stream capture failed: {e}")
+                self.last_error = str(e)
+                interval = 1.0 / self.min_fps
+
+            # A slow device sets the pace on its own; only sleep off the remainder
+            elapsed = time.monotonic() - started
+            self.fps = 1.0 / max(elapsed, interval)
+            time.sleep(max(0.0, interval - elapsed))
+
+    def get_stats(self) -> Dict:
+        """Get viewer and frame rate statistics."""
+        return {
+            "subscribers": self.subscribers,
+            "frames": self.sequence,
+            "fps": round(self.fps, 1),
+            "last_error": self.last_error,
+        }
+
+
+class StreamHub:
+    """Keeps one FrameBroadcaster per device and caps concurrent captures."""
+
+    def __init__(self, max_concurrent_captures: int = 2, **broadcaster_options):
+        self.capture_slots = threading.Semaphore(max_concurrent_captures)
+        self.broadcaster_options = broadcaster_options
+        self.broadcasters: Dict[str, FrameBroadcaster] = {}
+        self._lock = threading.Lock()
+
+    def broadcaster(self, device_id: str, capture: Callable[[], np.ndarray]) -> FrameBroadcaster:
+        """Get or create the broadcaster for a device (capture is used on creation)."""
+        with self._lock:
+            broadcaster = self.broadcasters.get(device_id)
+            if broadcaster is None:
+                broadcaster = FrameBroadcaster(capture, self.capture_slots,
+                                               **self.broadcaster_options)
+                self.broadcasters[device_id] = broadcaster
+            return broadcaster
+
+    def get_stats(self) -> Dict:
+        """Get per-device stream statistics."""
+        with self._lock:
+            return {device_id: broadcaster.get_stats()
+                    for device_id, broadcaster in self.broadcasters.items()}
+
+
+class AsyncFrameBroadcaster:
+    """asyncio counterpart of FrameBroadcaster for the ASGI server.
+
+    The capture loop is a task on the event loop instead of a thread, and
+    JPEG encoding runs in the default executor. Viewers skip frames the
+    same way: each waits for a sequence newer than the last it sent.
+    """
+
+    def __init__(self, capture: Callable[[], Awaitable[np.ndarray]], max_fps: float = 10.0,
+                 min_fps: float = 1.0, max_width: int = 720, quality: int = 70):
+        """
+        Args:
+            capture: Coroutine function returning a fresh RGBA frame for the device
+        """
+        self.capture = capture
+        self.max_fps = max_fps
+        self.min_fps = min_fps
+        self.max_width = max_width
+        self.quality = quality
+
+        self.subscribers = 0
+        self.sequence = 0
+        self.frame: Optional[bytes] = None
+        self.fps = 0.0
+        self.last_error: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+        self._condition = asyncio.Condition()
+
+    def subscribe(self):
+        """Register a viewer and make sure the capture loop is running."""
+        self.subscribers += 1
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._capture_loop())
+
+    def unsubscribe(self):
+        """Remove a viewer; the loop stops once nobody is watching."""
+        self.subscribers = max(0, self.subscribers - 1)
+
+    async def wait_frame(self, last_sequence: int, timeout: float = 5.0) -> Tuple[int, Optional[bytes]]:
+        """Wait until a frame newer than last_sequence exists, or until timeout."""
+        async with self._condition:
+            try:
+                await asyncio.wait_for(
+                    self._condition.wait_for(lambda: self.sequence > last_sequence), timeout)
+            except asyncio.TimeoutError:
+                pass
+            return self.sequence, self.frame
+
+    async def _publish(self, frame: bytes):
+        """Make a new encoded frame visible to every viewer."""
+        async with self._condition:
+            self.frame = frame
+            self.sequence += 1
+            self._condition.notify_all()
+
+    async def _capture_loop(self):
+        """Capture, encode and publish frames while there are subscribers."""
+        loop = asyncio.get_running_loop()
+        interval = 1.0 / self.max_fps
+        last_digest = None
+
+        while self.subscribers > 0:
+            started = time.monotonic()
+            try:
+                frame = await self.capture()
+                digest = hashlib.blake2b(np.ascontiguousarray(frame), digest_size=16).digest()
+                if digest == last_digest:
+                    # Static screen: back off towards min_fps
+                    interval = min(1.0 / self.min_fps, interval * 1.5)
+                else:
+                    last_digest = digest
+                    interval = 1.0 / self.max_fps
+                    await self._publish(await loop.run_in_executor(
+                        None, lambda: encode_frame(frame, "JPEG", max_width=self.max_width,
+                                                   quality=self.quality)))
+                self.last_error = None
+
+            except Exception as e:
+                print(f"Stream capture failed: {e}")
+                self.last_error = str(e)
+                interval = 1.0 / self.min_fps
+
+            elapsed = time.monotonic() - started
+            self.fps = 1.0 / max(elapsed, interval)
+            await asyncio.sleep(max(0.0, interval - elapsed))
+
+    def get_stats(self) -> Dict:
+        """Get viewer and frame rate statistics."""
+        return {
+            "subscribers": self.subscribers,
+            "frames": self.sequence,
+            "fps": round(self.fps, 1),
+            "last_error": self.last_error,
+        }
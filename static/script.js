@@ -1,6 +1,7 @@
 // Global state
 let isReady = false;
 let currentScreenshot = null;
+let liveView = false;
 
 // DOM elements
 const commandInput = document.getElementById('command-input');
@@ -14,6 +15,8 @@ const modelStatus = document.getElementById('model-status');
 const androidStatus = document.getElementById('android-status');
 const modelText = document.getElementById('model-text');
 const androidText = document.getElementById('android-text');
+const liveBtn = document.getElementById('live-btn');
+const screenshotPlaceholder = screenshotContainer.innerHTML;
 
 // Initialize the application
 document.addEventListener('DOMContentLoaded', function() {
@@ -185,7 +188,8 @@ async function sendCommand() {
             
             // If it was a screenshot command, update the screenshot
             if (result.parsed_command.action === 'screenshot' && result.result.screenshot) {
-                updateScreenshot(result.result.screenshot);
+                stopLiveView();
+                updateScreenshot(`data:image/png;base64,${result.result.screenshot}`);
             }
         } else {
             addLogEntry(command, result.error || 'Command failed', 'error');
@@ -208,17 +212,29 @@ async function executeQuickCommand(command) {
     await sendCommand();
 }
 
+function screenshotUrl() {
+    // Ask for a frame sized to the panel instead of the full device resolution
+    const width = Math.round(screenshotContainer.clientWidth * (window.devicePixelRatio || 1));
+    const params = new URLSearchParams({ format: 'jpeg', quality: '80' });
+    if (width > 0) {
+        params.set('width', width);
+    }
+    return `/api/screenshot/image?${params}`;
+}
+
 async function takeScreenshot() {
+    stopLiveView();
     showLoading(true);
     
     try {
-        const response = await fetch('/api/screenshot');
-        const result = await response.json();
+        const response = await fetch(screenshotUrl());
         
-        if (result.success && result.screenshot) {
-            updateScreenshot(result.screenshot);
+        if (response.ok) {
+            const blob = await response.blob();
+            updateScreenshot(URL.createObjectURL(blob));
             addLogEntry('Screenshot', 'Screenshot captured successfully', 'success');
         } else {
+            const result = await response.json();
             addLogEntry('Screenshot', result.error || 'Screenshot failed', 'error');
         }
     } catch (error) {
@@ -229,10 +245,15 @@ async function takeScreenshot() {
     }
 }
 
-function updateScreenshot(base64Image) {
-    currentScreenshot = base64Image;
+function updateScreenshot(imageUrl) {
+    // Release the previous frame if it was a blob URL
+    if (currentScreenshot && currentScreenshot.startsWith('blob:')) {
+        URL.revokeObjectURL(currentScreenshot);
+    }
+    
+    currentScreenshot = imageUrl;
     screenshotContainer.innerHTML = `
-        <img src="data:image/png;base64,${base64Image}" 
+        <img src="${imageUrl}" 
              alt="Device Screenshot" 
              class="screenshot-image"
              onclick="openScreenshotModal()" />
@@ -240,6 +261,36 @@ function updateScreenshot(base64Image) {
     screenshotContainer.classList.add('has-image');
 }
 
+function toggleLiveView() {
+    if (liveView) {
+        stopLiveView();
+        screenshotContainer.innerHTML = screenshotPlaceholder;
+        screenshotContainer.classList.remove('has-image');
+        currentScreenshot = null;
+        return;
+    }
+    
+    // The server shares one capture loop between all open live views
+    liveView = true;
+    liveBtn.classList.add('active');
+    liveBtn.innerHTML = '<i class="fas fa-stop"></i> Stop Live';
+    updateScreenshot('/api/stream');
+}
+
+function stopLiveView() {
+    if (!liveView) return;
+    
+    liveView = false;
+    liveBtn.classList.remove('active');
+    liveBtn.innerHTML = '<i class="fas fa-video"></i> Live View';
+    
+    // Dropping the image source closes the stream connection
+    const img = screenshotContainer.querySelector('img');
+    if (img) {
+        img.removeAttribute('src');
+    }
+}
+
 function openScreenshotModal() {
     if (!currentScreenshot) return;
     
@@ -260,7 +311,7 @@ function openScreenshotModal() {
     `;
     
     const img = document.createElement('img');
-    img.src = `data:image/png;base64,${currentScreenshot}`;
+    img.src = currentScreenshot;
     img.style.cssText = `
         max-width: 90%;
         max-height: 90%;
@@ -320,6 +371,7 @@ window.debugFunctions = {
     getStatus: () => fetch('/api/status').then(r => r.json()),
     getDeviceInfo: () => fetch('/api/device_info').then(r => r.json()),
     takeScreenshot: () => fetch('/api/screenshot').then(r => r.json()),
+    screenshotImage: (params = '') => fetch(`/api/screenshot/image?${params}`).then(r => r.blob()),
     sendCommand: (cmd) => fetch('/api/command', {
         method: 'POST',
         headers: {'Content-Type': 'application/json'},
@@ -0,0 +1,80 @@
+import json
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+
+class StatusMonitor:
+    """Refreshes system status on a background thread and serves a cached snapshot.
+
+    The snapshot is serialized once per change, so serving it costs a lock
+    and a reference copy no matter how many clients are polling. The version
+    only increases when the content actually changes, which makes it usable
+    as an ETag.
+    """
+
+    def __init__(self, collect: Callable[[], Dict], interval: float = 5.0):
+        """
+        Args:
+            collect: Builds the status dict (may be slow: runs adb and Ollama calls)
+            interval: Seconds between background refreshes
+        """
+        self.collect = collect
+        self.interval = interval
+        self.version = 0
+        self.updated_at: Optional[float] = None
+        self._body: Optional[bytes] = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start the background refresh thread (idempotent)."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        """Stop the background refresh thread."""
+        self._stopped.set()
+        self._wake.set()
+
+    def refresh(self):
+        """Ask the background thread to refresh now (e.g. after a state change)."""
+        self._wake.set()
+
+    def _run(self):
+        """Refresh loop: collect, then sleep until the interval passes or a wake-up."""
+        while not self._stopped.is_set():
+            self.update()
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def update(self) -> int:
+        """Collect status now and publish it if it changed. Returns the version."""
+        try:
+            status = self.collect()
+        except Exception as e:
+            status = {"error": f"Status check failed: {str(e)}"}
+
+        body = json.dumps(status, sort_keys=True).encode('utf-8')
+        with self._lock:
+            self.updated_at = time.time()
+            if body != self._body:
+                self._body = body
+                self.version += 1
+            return self.version
+
+    def snapshot(self) -> Tuple[int, bytes]:
+        """Get (version, JSON body), collecting synchronously if nothing is cached yet."""
+        with self._lock:
+            if self._body is not None:
+                return self.version, self._body
+        self.update()
+        with self._lock:
+            return self.version, self._body
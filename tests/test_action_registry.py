@@ -0,0 +1,130 @@
+"""Table tests for validate_command against the if/elif validator it replaced."""
+
+import copy
+
+import pytest
+
+from action_registry import (ACTION_SPECS, ActionSpec, build_action_schema, integer,
+                             number, validate_command)
+
+# (command, what the old validator returned); None means it returned an error.
+# Error wording differs between the two, so only the presence of an error is
+# compared.
+SAME_AS_OLD = [
+    ({"action": "tap", "x": 5000, "y": -3}, {"action": "tap", "x": 1080, "y": 0}),
+    ({"action": "tap", "x": "10", "y": 20.7}, {"action": "tap", "x": 10, "y": 20}),
+    ({"action": "tap", "x": 1}, None),
+    ({"action": "long_press", "x": 1, "y": 2},
+     {"action": "long_press", "x": 1, "y": 2, "duration": 1000}),
+    ({"action": "swipe", "start_x": 0, "start_y": 0, "end_x": 2000, "end_y": 100,
+      "duration": 10},
+     {"action": "swipe", "start_x": 0, "start_y": 0, "end_x": 1080, "end_y": 100,
+      "duration": 100}),
+    ({"action": "pinch", "x": 1, "y": 1, "scale": 50},
+     {"action": "pinch", "x": 1, "y": 1, "scale": 10.0}),
+    ({"action": "type", "text": "x" * 1200}, {"action": "type", "text": "x" * 1000}),
+    ({"action": "type"}, None),
+    ({"action": "key", "keycode": "HOME"}, {"action": "key", "keycode": "HOME"}),
+    ({"action": "key", "keycode": "HOOM"}, None),
+    ({"action": "scroll", "direction": "down"},
+     {"action": "scroll", "direction": "down", "distance": 500}),
+    ({"action": "scroll", "direction": "sideways"}, None),
+    ({"action": "volume", "level": 150},
+     {"action": "volume", "level": 100, "stream": "music"}),
+    ({"action": "volume", "level": 10, "stream": "radio"}, None),
+    ({"action": "brightness", "level": 300}, {"action": "brightness", "level": 255}),
+    ({"action": "wifi", "enabled": True}, {"action": "wifi", "enabled": True}),
+    ({"action": "wifi"}, None),
+    ({"action": "unlock_screen", "method": "pin"}, None),
+    ({"action": "unlock_screen", "method": "pin", "credential": "1234"},
+     {"action": "unlock_screen", "method": "pin", "credential": "1234"}),
+    ({"action": "tts", "text": "hi"}, {"action": "tts", "text": "hi", "language": "en"}),
+    ({"action": "tts", "text": "hi", "language": "xx"}, None),
+    ({"action": "vibrate", "pattern": "buzz"}, None),
+    ({"action": "play_sound", "file": "a.mp3", "volume": 3},
+     {"action": "play_sound", "file": "a.mp3", "volume": 1.0}),
+    ({"action": "font_size", "scale": 0.1}, {"action": "font_size", "scale": 0.5}),
+    ({"action": "sleep_timeout", "seconds": 5},
+     {"action": "sleep_timeout", "seconds": 15}),
+    ({"action": "screen_record"}, {"action": "screen_record", "duration": 30}),
+    ({"action": "reboot"}, {"action": "reboot"}),
+    ({"action": "backup"}, {"action": "backup"}),
+    ({"action": "teleport"}, {"action": "teleport"}),
+    ({"foo": 1}, None),
+]
+
+# Deliberate differences: (command, old result, new result). The old
+# validator never checked optional enums, list and object shapes, and used
+# bool(), which turned "false" into True.
+CHANGED_FROM_OLD = [
+    ({"action": "reboot", "mode": "sideways"},
+     {"action": "reboot", "mode": "sideways"}, None),
+    ({"action": "backup", "type": "everything"},
+     {"action": "backup", "type": "everything"}, None),
+    ({"action": "log_capture", "level": "loud"},
+     {"action": "log_capture", "level": "loud"}, None),
+    ({"action": "log_capture", "duration": "7"},
+     {"action": "log_capture", "duration": "7"},
+     {"action": "log_capture", "duration": 7}),
+    ({"action": "loop", "count": 2, "actions": "back"},
+     {"action": "loop", "count": 2, "actions": "back"}, None),
+    ({"action": "wifi", "enabled": "false"},
+     {"action": "wifi", "enabled": True}, {"action": "wifi", "enabled": False}),
+    ({"action": "wifi", "enabled": 1}, {"action": "wifi", "enabled": True}, None),
+    ({"action": "assert_element", "method": "text", "value": "OK", "exists": 3.7},
+     {"action": "assert_element", "method": "text", "value": "OK", "exists": 3.7},
+     None),
+]
+
+
+def check(command, expected):
+    result = validate_command(copy.deepcopy(command))
+    if expected is None:
+        assert "error" in result
+    else:
+        assert result == expected
+
+
+@pytest.mark.parametrize("command, expected", SAME_AS_OLD)
+def test_matches_old_validator(command, expected):
+    check(command, expected)
+
+
+@pytest.mark.parametrize("command, old, expected", CHANGED_FROM_OLD)
+def test_deliberate_changes_from_old_validator(command, old, expected):
+    check(command, expected)
+
+
+@pytest.mark.parametrize("value, expected", [
+    (True, True), (False, False), ("true", True), ("false", False), (" False ", False),
+    (1, None), (0, None), (3.7, None), ("yes", None), ("", None), (None, None),
+])
+def test_bool_coercion(value, expected):
+    command = {"action": "wifi", "enabled": value}
+    check(command, None if expected is None else {"action": "wifi", "enabled": expected})
+
+
+def test_object_fields_are_checked():
+    command = {"action": "conditional", "then": {"action": "back"},
+               "condition": {"method": "text", "value": "OK", "exists": "false"}}
+    assert validate_command(command)["condition"]["exists"] is False
+    command["condition"]["exists"] = 3.7
+    assert "error" in validate_command(command)
+
+
+@pytest.mark.parametrize("param, value, expected", [
+    (integer("n", minimum=1), -5, 1),
+    (integer("n", minimum=1), 50, 50),
+    (number("n", maximum=2.0), 7, 2.0),
+    (number("n", maximum=2.0), -7, -7.0),
+])
+def test_one_sided_bounds(param, value, expected):
+    command = {"action": "custom", "n": value}
+    assert ActionSpec("custom", [param]).checks[0](command) is None
+    assert command["n"] == expected
+
+
+def test_schema_has_one_branch_per_action():
+    branches = build_action_schema()["anyOf"]
+    assert [branch["properties"]["action"]["const"] for branch in branches] == [
+        spec.name for spec in ACTION_SPECS]
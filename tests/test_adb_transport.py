@@ -0,0 +1,117 @@
+"""Tests for the adb transports, run against the fake adb from benchmark.py."""
+
+import asyncio
+import os
+import subprocess
+
+import pytest
+
+from adb_transport import (
+    SHELL_INCOMPLETE_RETURNCODE, AdbError, AdbSocketTransport,
+    AsyncAdbSocketTransport, ShellSession, SubprocessTransport, quote_args,
+)
+from benchmark import FAKE_SERIAL, make_fake_adb, start_fake_adb_server
+
+
+@pytest.fixture
+def adb_path(tmp_path, monkeypatch):
+    """A fake adb binary; device-side tools are found through PATH."""
+    # make_fake_adb prepends to PATH; restore it after the test
+    monkeypatch.setenv("PATH", os.environ["PATH"])
+    return make_fake_adb(str(tmp_path))
+
+
+@pytest.fixture
+def session(adb_path):
+    session = ShellSession(FAKE_SERIAL, adb_path, timeout=2.0)
+    yield session
+    session.close()
+
+
+def test_quote_args_quotes_each_argument():
+    assert quote_args(["echo", "don't", "a b"]) == "echo 'don'\"'\"'t' 'a b'"
+
+
+@pytest.mark.parametrize("text", ["don't stop", 'say "hi"', "a & b; c", "$HOME"])
+def test_session_round_trips_shell_metacharacters(session, text):
+    result = session.run(["echo", text])
+    assert result.returncode == 0
+    assert result.stdout == text + "\n"
+
+
+def test_session_keeps_working_after_an_apostrophe(session):
+    assert session.run(["input", "text", "don't%sstop"]).returncode == 0
+    assert session.run(["input", "tap", "10", "20"]).returncode == 0
+
+
+def test_session_reports_exit_status(session):
+    result = session.run(["sh", "-c", "echo oops; exit 3"])
+    assert result.returncode == 3
+    assert result.stderr == "oops\n"
+
+
+def test_hung_command_times_out_and_session_recovers(session):
+    with pytest.raises(subprocess.TimeoutExpired):
+        session.run(["sleep", "10"], timeout=0.5)
+    assert not session.is_alive()
+    assert session.run(["echo", "back"]).stdout == "back\n"
+
+
+def test_subprocess_transport_quotes_arguments(adb_path):
+    transport = SubprocessTransport(adb_path)
+    assert transport.shell(FAKE_SERIAL, ["echo", "don't stop"]).stdout == "don't stop\n"
+    assert transport.exec_out(FAKE_SERIAL, ["printf", "%s", "a b"]) == b"a b"
+
+
+@pytest.fixture
+def adb_server(adb_path):
+    server = start_fake_adb_server()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def socket_transports(server):
+    port = server.server_address[1]
+    return AdbSocketTransport(port=port), AsyncAdbSocketTransport(port=port)
+
+
+def test_socket_shell_reports_exit_status(adb_server):
+    args = ["sh", "-c", "echo oops; exit 3"]
+    sync, async_ = socket_transports(adb_server)
+    for result in (sync.shell(FAKE_SERIAL, args),
+                   asyncio.run(async_.shell(FAKE_SERIAL, args))):
+        assert result.returncode == 3
+        assert result.stderr == "oops\n"
+
+
+def test_socket_shell_without_exit_status_is_a_failure(adb_server):
+    # Killing the service's shell cuts the output off before the marker
+    args = ["sh", "-c", "echo partial; kill -9 $PPID"]
+    sync, async_ = socket_transports(adb_server)
+    for result in (sync.shell(FAKE_SERIAL, args),
+                   asyncio.run(async_.shell(FAKE_SERIAL, args))):
+        assert result.returncode == SHELL_INCOMPLETE_RETURNCODE
+        assert result.stdout == ""
+        assert result.stderr.startswith("partial\n")
+
+
+def test_socket_shell_quotes_arguments(adb_server):
+    sync, async_ = socket_transports(adb_server)
+    assert sync.shell(FAKE_SERIAL, ["echo", "don't stop"]).stdout == "don't stop\n"
+    result = asyncio.run(async_.shell(FAKE_SERIAL, ["echo", "don't stop"]))
+    assert result.stdout == "don't stop\n"
+
+
+def test_pull_evicts_sync_socket_after_an_error(adb_server, tmp_path):
+    transport, _ = socket_transports(adb_server)
+    present = tmp_path / "present.bin"
+    present.write_bytes(b"data")
+    try:
+        with pytest.raises(AdbError):
+            transport.pull(FAKE_SERIAL, str(tmp_path / "missing.bin"))
+        assert FAKE_SERIAL not in transport.sync_sockets
+        assert transport.pull(FAKE_SERIAL, str(present)) == b"data"
+        assert FAKE_SERIAL in transport.sync_sockets
+    finally:
+        transport.close()
@@ -0,0 +1,92 @@
+"""Tests for frame decoding, the frame cache and raw capture fallback."""
+
+import io
+import struct
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from android_controller import RAW_CAPTURE_FAILURE_LIMIT, AndroidController, FrameCache
+from imaging import decode_raw_screencap
+
+
+def raw_frame(width, height, pixel_format=1, pixel=(1, 2, 3, 4), color_space=True):
+    header = struct.pack('<III', width, height, pixel_format)
+    if color_space:
+        header += struct.pack('<I', 0)
+    return header + bytes(pixel) * (width * height)
+
+
+@pytest.mark.parametrize("color_space", [True, False])
+def test_decode_raw_screencap_reads_both_header_sizes(color_space):
+    frame = decode_raw_screencap(raw_frame(3, 2, color_space=color_space))
+    assert frame.shape == (2, 3, 4)
+    assert tuple(frame[0, 0]) == (1, 2, 3, 4)
+
+
+def test_decode_raw_screencap_swaps_bgra_channels():
+    frame = decode_raw_screencap(raw_frame(2, 2, pixel_format=5))
+    assert tuple(frame[1, 1]) == (3, 2, 1, 4)
+
+
+@pytest.mark.parametrize("data", [
+    b"short",
+    raw_frame(2, 2, pixel_format=4),
+    raw_frame(4, 4)[:-10],
+])
+def test_decode_raw_screencap_rejects_bad_frames(data):
+    with pytest.raises(ValueError):
+        decode_raw_screencap(data)
+
+
+def test_frame_cache_reuses_until_invalidated():
+    cache = FrameCache(ttl=60)
+    captures = []
+
+    def capture():
+        captures.append(1)
+        return np.zeros((1, 1, 4), dtype=np.uint8)
+
+    cache.get("serial", capture)
+    cache.get("serial", capture)
+    assert len(captures) == 1
+    cache.invalidate("serial")
+    cache.get("serial", capture)
+    assert len(captures) == 2
+    cache.get("serial", capture, max_age=0)
+    assert len(captures) == 3
+
+
+class ScreencapTransport:
+    """Answers `screencap` with queued raw outputs."""
+
+    def __init__(self, outputs):
+        self.outputs = list(outputs)
+
+    def exec_out(self, serial, args, timeout=None):
+        return self.outputs.pop(0)
+
+
+def png_controller(outputs):
+    controller = AndroidController(transport=ScreencapTransport(outputs),
+                                   device_id="serial", frame_cache_ttl=0)
+    buffer = io.BytesIO()
+    Image.new('RGBA', (2, 2)).save(buffer, format='PNG')
+    controller._capture_png_on_device = lambda: buffer.getvalue()
+    return controller
+
+
+def test_single_raw_failure_keeps_raw_mode():
+    controller = png_controller([b"short", raw_frame(2, 2)])
+    assert controller._grab_frame().shape == (2, 2, 4)
+    assert controller.capture_mode == "raw"
+    assert tuple(controller._grab_frame()[0, 0]) == (1, 2, 3, 4)
+    assert controller.raw_capture_failures == 0
+
+
+def test_consecutive_raw_failures_switch_to_png():
+    controller = png_controller([b"short"] * RAW_CAPTURE_FAILURE_LIMIT)
+    for _ in range(RAW_CAPTURE_FAILURE_LIMIT):
+        controller._grab_frame()
+    assert controller.capture_mode == "png"
@@ -0,0 +1,56 @@
+"""Tests for the Flask server's command endpoint."""
+
+from concurrent.futures import Future
+
+import pytest
+
+import app as server
+
+
+class PendingExecutor:
+    """Keeps submitted work queued so the test controls when (if ever) it runs."""
+
+    def __init__(self):
+        self.futures = []
+
+    def submit(self, function, *args, **kwargs):
+        future = Future()
+        self.futures.append(future)
+        return future
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(server, "model_loaded", True)
+    return server.app.test_client()
+
+
+def test_parse_is_cancelled_when_the_device_is_not_ready(client, monkeypatch):
+    executor = PendingExecutor()
+    monkeypatch.setattr(server, "parse_executor", executor)
+    monkeypatch.setattr(server.android, "check_adb_connection",
+                        lambda: {"error": "no devices"})
+
+    response = client.post("/api/command", json={"command": "tap the login button"})
+    assert response.status_code == 503
+    assert [future.cancelled() for future in executor.futures] == [True]
+
+
+@pytest.mark.parametrize("command, precaptured", [
+    ("go back", False),
+    ("tap the login button", True),
+])
+def test_precapture_only_when_the_model_is_needed(monkeypatch, command, precaptured):
+    submitted = []
+
+    def submit_call(serial, function, *args, **kwargs):
+        submitted.append(serial)
+        return Future()
+
+    monkeypatch.setattr(server, "PRECAPTURE_SCREEN", True)
+    monkeypatch.setattr(server.gemma, "screen_encoder", object())
+    monkeypatch.setattr(server.device_pool, "submit_call", submit_call)
+    monkeypatch.setattr(server.device_pool, "controller", lambda serial: None)
+
+    server.capture_target_screen("serial", command)
+    assert bool(submitted) == precaptured
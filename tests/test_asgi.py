@@ -0,0 +1,108 @@
+"""Tests for the ASGI server's endpoints, driven without a real server."""
+
+import asyncio
+import json
+import os
+import re
+
+import numpy as np
+import pytest
+
+import asgi
+from gemma_controller import QUICK_COMMANDS
+
+SCRIPT_PATH = os.path.join(asgi.STATIC_DIR, "script.js")
+
+
+def request(method, path, query=b"", headers=()):
+    """Run one request through the app and return (status, headers, body)."""
+    scope = {"type": "http", "method": method, "path": path,
+             "query_string": query, "headers": list(headers)}
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(asgi.app(scope, receive, send))
+    start = messages[0]
+    body = b"".join(message.get("body", b"") for message in messages[1:])
+    return start["status"], dict(start["headers"]), body
+
+
+@pytest.fixture
+def device(monkeypatch):
+    frame = np.zeros((40, 30, 4), dtype=np.uint8)
+    frame[..., 0] = 200
+
+    async def check_adb_connection():
+        return {"success": True, "device_id": "emulator-5554"}
+
+    async def capture_frame(max_age=None):
+        return frame
+
+    async def get_device_info():
+        return {"device_id": "emulator-5554", "model": "Pixel"}
+
+    monkeypatch.setattr(asgi.android, "check_adb_connection", check_adb_connection)
+    monkeypatch.setattr(asgi.android, "capture_frame", capture_frame)
+    monkeypatch.setattr(asgi.android, "get_device_info", get_device_info)
+
+
+def test_every_endpoint_the_ui_calls_is_routed():
+    with open(SCRIPT_PATH) as script:
+        paths = set(re.findall(r"'(/api/[\w/]+)'|`(/api/[\w/]+)\?", script.read()))
+    routed = {path for _, path in asgi.ROUTES}
+    assert {path for pair in paths for path in pair if path} <= routed
+
+
+def test_quick_commands():
+    status, _, body = request("GET", "/api/quick_commands")
+    assert status == 200
+    assert json.loads(body) == QUICK_COMMANDS
+
+
+def test_device_info(device):
+    status, _, body = request("GET", "/api/device_info")
+    assert status == 200
+    assert json.loads(body)["model"] == "Pixel"
+
+
+def test_screenshot_image_is_encoded_and_revalidated(device):
+    status, headers, body = request("GET", "/api/screenshot/image",
+                                    b"format=png&width=15")
+    assert status == 200
+    assert headers[b"content-type"] == b"image/png"
+    assert body.startswith(b"\x89PNG")
+
+    status, _, body = request("GET", "/api/screenshot/image", b"format=png&width=15",
+                              [(b"if-none-match", headers[b"etag"])])
+    assert status == 304
+    assert body == b""
+
+
+def test_screenshot_image_rejects_bad_options(device):
+    status, _, body = request("GET", "/api/screenshot/image", b"format=gif")
+    assert status == 400
+    assert "Unsupported format" in json.loads(body)["error"]
+
+
+def test_load_model_starts_loading_once(monkeypatch):
+    started = []
+
+    async def load_model():
+        started.append(True)
+
+    monkeypatch.setattr(asgi, "load_model", load_model)
+    monkeypatch.setattr(asgi, "model_loaded", False)
+    monkeypatch.setattr(asgi, "loading_model", False)
+    status, _, body = request("POST", "/api/load_model")
+    assert status == 200
+    assert json.loads(body) == {"message": "Model loading started"}
+    assert started == [True]
+
+    monkeypatch.setattr(asgi, "model_loaded", True)
+    _, _, body = request("POST", "/api/load_model")
+    assert json.loads(body) == {"message": "Model already loaded"}
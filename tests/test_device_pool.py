@@ -0,0 +1,75 @@
+"""Tests for device workers and broadcasts."""
+
+import threading
+import time
+
+import pytest
+
+from device_pool import (
+    DeadlineExceededError, DevicePool, DeviceWorker, QueueFullError,
+)
+
+
+class FakeController:
+    def __init__(self, serial):
+        self.device_id = serial
+
+    def check_adb_connection(self):
+        return {"success": True}
+
+    def execute_command(self, command):
+        return {"success": True, "serial": self.device_id}
+
+    def close(self, release_transport=True):
+        pass
+
+
+def blocked_worker(serial="serial", max_queue=32):
+    """A worker whose thread is stuck in a call until the returned event is set."""
+    worker = DeviceWorker(FakeController(serial), max_queue=max_queue)
+    release = threading.Event()
+    started = threading.Event()
+
+    def block():
+        started.set()
+        release.wait(5)
+
+    worker.submit_call(block)
+    assert started.wait(5)
+    return worker, release
+
+
+def test_cancelled_work_is_skipped_and_worker_keeps_running():
+    worker, release = blocked_worker()
+    cancelled = worker.submit({"action": "back"})
+    expired = worker.submit({"action": "back"}, deadline=time.monotonic())
+    after = worker.submit({"action": "home"})
+    assert cancelled.cancel()
+    assert expired.cancel()
+    release.set()
+    assert after.result(5) == {"success": True, "serial": "serial"}
+    assert worker.get_stats()["pending"] == 0
+    worker.stop()
+
+
+def test_expired_work_fails_with_deadline_error():
+    worker, release = blocked_worker()
+    expired = worker.submit({"action": "back"}, deadline=time.monotonic())
+    release.set()
+    with pytest.raises(DeadlineExceededError):
+        expired.result(5)
+    worker.stop()
+
+
+def test_broadcast_reports_a_full_queue_per_device():
+    pool = DevicePool(transport=None)
+    busy, release = blocked_worker("busy", max_queue=1)
+    idle = DeviceWorker(FakeController("idle"))
+    pool.workers = {"busy": busy, "idle": idle}
+
+    futures = pool.broadcast({"action": "back"})
+    assert futures["idle"].result(5)["serial"] == "idle"
+    with pytest.raises(QueueFullError):
+        futures["busy"].result(0)
+    release.set()
+    pool.close()
@@ -0,0 +1,65 @@
+"""Tests for the track-devices backed device registry."""
+
+import threading
+
+from device_registry import DeviceRegistry
+
+
+class FakeTransport:
+    """Streams the given device lists, then holds the stream open until released."""
+
+    def __init__(self, *device_lists):
+        self.device_lists = device_lists
+        self.release = threading.Event()
+
+    def track_devices(self):
+        yield from self.device_lists
+        self.release.wait(5)
+        raise ConnectionResetError("stream closed")
+
+
+def test_listeners_see_every_transition():
+    registry = DeviceRegistry(FakeTransport())
+    transitions = []
+    registry.add_listener(lambda *transition: transitions.append(transition))
+
+    registry._apply([{"id": "a", "status": "unauthorized"}])
+    registry._apply([{"id": "a", "status": "device"}, {"id": "b", "status": "device"}])
+    registry._apply([{"id": "b", "status": "device"}])
+
+    assert len(transitions) == 4
+    assert set(transitions) == {("a", None, "unauthorized"),
+                                ("a", "unauthorized", "device"),
+                                ("b", None, "device"),
+                                ("a", "device", None)}
+    assert registry.get_devices() == [{"id": "b", "status": "device"}]
+    assert registry.get_state("a") is None
+
+
+def test_failing_listener_does_not_stop_the_others():
+    registry = DeviceRegistry(FakeTransport())
+    seen = []
+
+    def broken(*transition):
+        raise RuntimeError("listener bug")
+
+    registry.add_listener(broken)
+    registry.add_listener(lambda serial, old, new: seen.append(serial))
+    registry._apply([{"id": "a", "status": "device"}])
+    assert seen == ["a"]
+
+
+def test_start_syncs_from_the_stream_and_drops_sync_when_it_ends():
+    transport = FakeTransport([{"id": "a", "status": "device"}])
+    registry = DeviceRegistry(transport, reconnect_delay=5.0)
+    registry.start()
+    try:
+        assert registry.wait_synced(timeout=2)
+        assert registry.connected
+        assert registry.get_state("a") == "device"
+    finally:
+        registry.stop()
+        transport.release.set()
+    registry._thread.join(timeout=2)
+    assert not registry.is_synced()
+    assert registry.last_error == "stream closed"
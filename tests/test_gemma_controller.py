@@ -0,0 +1,180 @@
+"""Tests for GemmaController and AsyncGemmaController with stub Ollama clients."""
+
+import asyncio
+import inspect
+import json
+
+import pytest
+
+from gemma_controller import AsyncGemmaController, GemmaController
+
+REPLIES = {
+    "tap the login button": {"action": "tap", "x": 10, "y": 20},
+    "swipe from the top": {"action": "swipe", "x1": 1, "y1": 2, "x2": 3, "y2": 4},
+}
+
+INPUTS = ["go back", "tap the login button", "go  back.", "swipe from the top",
+          "tap the login button"]
+
+
+def reply_for(messages):
+    """The canned reply for the quoted command in the user message."""
+    command = messages[-1]["content"].split('"')[1]
+    return json.dumps(REPLIES[command])
+
+
+class StubClient:
+    """Answers chat like ollama.Client, streaming the reply in small pieces."""
+
+    def __init__(self):
+        self.requests = 0
+
+    def chat(self, model, messages, options, format=None, stream=False,
+             keep_alive=None):
+        self.requests += 1
+        content = reply_for(messages)
+        if not stream:
+            return {"message": {"content": content}}
+        return iter([{"message": {"content": content[i:i + 5]}}
+                     for i in range(0, len(content), 5)])
+
+
+class StubAsyncClient:
+    """Answers chat like ollama.AsyncClient."""
+
+    def __init__(self):
+        self.requests = 0
+
+    async def chat(self, model, messages, options, format=None, stream=False,
+                   keep_alive=None):
+        self.requests += 1
+        content = reply_for(messages)
+        if not stream:
+            return {"message": {"content": content}}
+
+        async def chunks():
+            for i in range(0, len(content), 5):
+                yield {"message": {"content": content[i:i + 5]}}
+        return chunks()
+
+
+class UnusedClient:
+    """Fails the test if the async controller falls back to blocking calls."""
+
+    def chat(self, *args, **kwargs):
+        raise AssertionError("the blocking client was used")
+
+
+def make_sync(stream):
+    controller = GemmaController(intent_index_dir=None, cache_size=0, stream=stream)
+    controller.client = StubClient()
+    controller.model_loaded = True
+    return controller
+
+
+def make_async(stream):
+    controller = AsyncGemmaController(intent_index_dir=None, cache_size=0,
+                                      stream=stream)
+    controller.core.client = UnusedClient()
+    controller.async_client = StubAsyncClient()
+    controller.core.model_loaded = True
+    return controller
+
+
+def without_timing(results):
+    return [{key: value for key, value in result.items() if key != "seconds"}
+            for result in results]
+
+
+@pytest.mark.parametrize("stream", [True, False])
+def test_async_parse_commands_matches_the_sync_controller(stream):
+    sync = make_sync(stream)
+    async_ = make_async(stream)
+
+    expected = sync.parse_commands(INPUTS)
+    results = asyncio.run(async_.parse_commands(INPUTS))
+
+    assert without_timing(results) == without_timing(expected)
+    assert [result["source"] for result in results] == [
+        "fast_path", "model", "duplicate", "model", "duplicate"]
+    assert async_.async_client.requests == sync.client.requests == 2
+    assert async_.get_parse_stats()["model"] == 2
+
+
+def test_async_parse_plan_uses_the_async_client():
+    controller = make_async(stream=True)
+    controller.core.intent_matcher = None
+
+    plan = asyncio.run(controller.parse_plan("tap the login button"))
+    assert plan == {"actions": [REPLIES["tap the login button"]]}
+    assert controller.async_client.requests == 1
+
+
+def test_async_controller_is_not_a_sync_controller():
+    controller = make_async(stream=True)
+    assert not isinstance(controller, GemmaController)
+    for name in ("load_model", "warm_up", "parse_command", "parse_commands",
+                 "parse_plan", "is_resident", "ensure_warm", "get_model_info"):
+        assert inspect.iscoroutinefunction(getattr(controller, name)), name
+
+
+def test_plan_resolves_locally_through_the_matcher():
+    controller = make_sync(stream=False)
+
+    plan = controller.parse_plan("open settings, then go back")
+    assert plan == {"actions": [{"action": "app", "package": "com.android.settings"},
+                                {"action": "key", "keycode": "BACK"}]}
+    assert controller.client.requests == 0
+    assert controller.get_parse_stats()["fast_path"] == 1
+
+
+class SlowWarmUpClient:
+    """Records how many warm-up requests are in flight at once."""
+
+    def __init__(self):
+        self.active = self.peak = self.requests = 0
+
+    async def chat(self, **request):
+        self.active += 1
+        self.requests += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(0.01)
+        self.active -= 1
+
+
+def test_async_warm_ups_do_not_overlap():
+    controller = make_async(stream=True)
+    controller.async_client = SlowWarmUpClient()
+
+    async def warm_twice():
+        return await asyncio.gather(controller.warm_up(), controller.warm_up())
+
+    assert asyncio.run(warm_twice()) == [True, True]
+    assert controller.async_client.peak == 1
+    assert controller.async_client.requests == 2
+
+
+@pytest.mark.parametrize("answer, escalated", [
+    ({"action": "tap", "x": 10, "y": 20}, False),
+    ({"action": "wifi", "enabled": True}, True),
+    (None, True),
+])
+def test_escalate_decides_from_the_small_model_answer(answer, escalated):
+    controller = GemmaController(intent_index_dir=None, cache_size=0,
+                                 small_model_name="small")
+    controller.small_model_loaded = True
+
+    assert controller.escalate("small", "tap the login button", answer) is escalated
+    assert controller.escalate(controller.model_name, "tap the login button",
+                               answer) is False
+    assert controller.get_parse_stats()["escalations"] == int(escalated)
+
+
+def test_only_the_last_tier_raises_errors():
+    controller = GemmaController(intent_index_dir=None, cache_size=0,
+                                 small_model_name="small")
+    controller.small_model_loaded = True
+
+    assert controller.escalate("small", "go back", None, ValueError("down"))
+    with pytest.raises(ValueError):
+        controller.escalate(controller.model_name, "go back", None, ValueError("down"))
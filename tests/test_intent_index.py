@@ -0,0 +1,54 @@
+"""Tests for the nearest-neighbour intent index."""
+
+import pytest
+
+from intent_index import build_index, default_corpus
+
+
+@pytest.fixture(scope="module")
+def index(tmp_path_factory):
+    return build_index(default_corpus(), str(tmp_path_factory.mktemp("index")))
+
+
+@pytest.mark.parametrize("text, command", [
+    ("snap the screen", {"action": "screenshot"}),
+    ("take a screenshot please", {"action": "screenshot"}),
+    ("navigate back", {"action": "key", "keycode": "BACK"}),
+    ("launch settings", {"action": "app", "package": "com.android.settings"}),
+    ("turn the wifi on", {"action": "wifi", "enabled": True}),
+    ("switch off bluetooth", {"action": "bluetooth", "enabled": False}),
+    ("tap at 300, 700", {"action": "tap", "x": 300, "y": 700}),
+    ("wait 2 seconds", {"action": "wait", "seconds": 2}),
+])
+def test_paraphrases_match(index, text, command):
+    assert index.match(text) == command
+
+
+@pytest.mark.parametrize("text", [
+    # Joined steps
+    "open the calculator and type 5",
+    "open settings then wifi",
+    "open settings, wifi",
+    # Negation
+    "do not take a screenshot",
+    "don't go back",
+    # Counts
+    "scroll down twice",
+    "go back three times",
+    # Words or numbers the matched phrasing does not account for
+    "set an alarm for 7",
+    "set brightness to 20%",
+    "scroll down 3",
+    # Questions and commands only the model can resolve
+    "what is on the screen",
+    "tap the login button",
+    "open my latest email",
+])
+def test_model_only_inputs_do_not_match(index, text):
+    assert index.match(text) is None
+
+
+def test_coverage_counts_slot_words(index):
+    template, _ = index.search("open the camera")
+    assert index.coverage(template, "open the camera") == 1.0
+    assert index.coverage(template, "open the camera app for me") < 0.75
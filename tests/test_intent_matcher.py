@@ -0,0 +1,61 @@
+"""Tests for the rule-based fast path."""
+
+import pytest
+
+from intent_matcher import IntentMatcher
+
+
+@pytest.fixture(scope="module")
+def matcher():
+    return IntentMatcher()
+
+
+@pytest.mark.parametrize("text, command", [
+    ("go back", {"action": "key", "keycode": "BACK"}),
+    ("press enter", {"action": "key", "keycode": "ENTER"}),
+    ("please open the settings", {"action": "app", "package": "com.android.settings"}),
+    ("scroll down", {"action": "scroll", "direction": "down"}),
+    ("tap at 300, 700", {"action": "tap", "x": 300, "y": 700}),
+    ("wait 2 seconds", {"action": "wait", "seconds": 2}),
+    ("type hello world", {"action": "type", "text": "hello world"}),
+    ('Type "Don\'t stop"', {"action": "type", "text": "Don't stop"}),
+])
+def test_match(matcher, text, command):
+    assert matcher.match(text) == command
+
+
+@pytest.mark.parametrize("text", [
+    "enter the settings",
+    "write down my address",
+    "enter hello",
+    "open settings and go back",
+    "open the calculator and type 5",
+    "tap the login button",
+    "what is on the screen",
+    "",
+])
+def test_no_match_is_left_to_the_model(matcher, text):
+    assert matcher.match(text) is None
+
+
+def test_match_plan_needs_every_clause(matcher):
+    assert matcher.match_plan("open settings and go back") == [
+        {"action": "app", "package": "com.android.settings"},
+        {"action": "key", "keycode": "BACK"},
+    ]
+    assert matcher.match_plan("open settings and enter the wifi menu") is None
+
+
+def test_match_plan_falls_back_per_clause(matcher):
+    asked = []
+
+    def fallback(clause):
+        asked.append(clause)
+        return {"action": "tap", "x": 1, "y": 2} if "wifi" in clause else None
+
+    assert matcher.match_plan("open settings and enter the wifi menu", fallback) == [
+        {"action": "app", "package": "com.android.settings"},
+        {"action": "tap", "x": 1, "y": 2},
+    ]
+    assert asked == ["enter the wifi menu"]
+    assert matcher.match_plan("open settings and do something", fallback) is None
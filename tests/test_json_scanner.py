@@ -0,0 +1,44 @@
+"""Tests for the incremental JSON object scanner used on streamed replies."""
+
+import json
+
+import pytest
+
+from json_scanner import JsonObjectScanner, extract_json_objects
+
+REPLY = ('Sure! ```json\n{"action": "type", "text": "a {brace} and \\"quote\\"", '
+         '"extras": {"nested": {"deep": 1}}}\n``` done')
+
+
+def test_extract_ignores_prose_and_code_fences():
+    objects = extract_json_objects(REPLY)
+    assert len(objects) == 1
+    assert json.loads(objects[0]) == {
+        "action": "type", "text": 'a {brace} and "quote"',
+        "extras": {"nested": {"deep": 1}}}
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, len(REPLY)])
+def test_chunked_feed_matches_whole_text(size):
+    scanner = JsonObjectScanner()
+    objects = []
+    for start in range(0, len(REPLY), size):
+        objects += scanner.feed(REPLY[start:start + size])
+    assert objects == extract_json_objects(REPLY)
+
+
+def test_object_is_returned_by_the_chunk_that_completes_it():
+    scanner = JsonObjectScanner()
+    assert scanner.feed('{"action": "tap", "x": ') == []
+    assert scanner.feed('1}{"action"') == ['{"action": "tap", "x": 1}']
+    assert scanner.feed(': "screenshot"}') == ['{"action": "screenshot"}']
+
+
+def test_escaped_backslash_before_closing_quote():
+    objects = extract_json_objects('{"text": "C:\\\\"} trailing }')
+    assert [json.loads(obj) for obj in objects] == [{"text": "C:\\"}]
+
+
+def test_incomplete_object_is_not_returned():
+    assert extract_json_objects('{"action": "tap", "x": {') == []
+    assert extract_json_objects("no json here }") == []
@@ -0,0 +1,69 @@
+"""Tests for the two-tier parse cache."""
+
+import pytest
+
+from parse_cache import ParseCache, normalize_command
+
+TAP = {"action": "tap", "x": 10, "y": 20}
+
+
+@pytest.mark.parametrize("text, normalized", [
+    ("go  back", "go back"),
+    ("  go back.  ", "go back"),
+    ("go back?!", "go back"),
+    ("Type Hello", "Type Hello"),
+])
+def test_normalize_command(text, normalized):
+    assert normalize_command(text) == normalized
+
+
+def test_key_depends_on_model_and_prompt_version():
+    key = ParseCache.make_key("go back", "gemma3", "v1")
+    assert key == ParseCache.make_key("go  back.", "gemma3", "v1")
+    assert key != ParseCache.make_key("go back", "gemma2:2b", "v1")
+    assert key != ParseCache.make_key("go back", "gemma3", "v2")
+
+
+def test_get_returns_a_copy():
+    cache = ParseCache()
+    cache.put("key", TAP)
+    cache.get("key")["x"] = 999
+    assert cache.get("key") == TAP
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ParseCache(max_entries=2)
+    cache.put("a", {"action": "a"})
+    cache.put("b", {"action": "b"})
+    cache.get("a")
+    cache.put("c", {"action": "c"})
+
+    assert cache.get("b") is None
+    assert cache.get("a") == {"action": "a"}
+    assert cache.get("c") == {"action": "c"}
+    stats = cache.get_stats()
+    assert stats["evictions"] == 1
+    assert stats["size"] == 2
+    assert (stats["hits"], stats["misses"]) == (3, 1)
+
+
+def test_sqlite_tier_survives_a_new_instance(tmp_path):
+    path = str(tmp_path / "cache.db")
+    ParseCache(path=path).put("key", TAP)
+
+    cache = ParseCache(path=path)
+    assert cache.get("key") == TAP
+    assert cache.get("key") == TAP
+    stats = cache.get_stats()
+    assert (stats["disk_hits"], stats["hits"]) == (1, 1)
+    assert stats["persistent"]
+
+
+def test_clear_empties_both_tiers(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = ParseCache(path=path)
+    cache.put("key", TAP)
+    cache.clear()
+
+    assert cache.get("key") is None
+    assert ParseCache(path=path).get("key") is None
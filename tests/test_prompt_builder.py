@@ -0,0 +1,33 @@
+"""Tests for relevance-pruned prompts."""
+
+from action_registry import ACTION_SPECS
+from prompt_builder import PROMPT_FOOTER, PROMPT_HEADER, PromptBuilder, render_prompt
+
+
+def test_rank_prefers_name_and_keyword_matches():
+    builder = PromptBuilder()
+    ranked = [action for action, _ in builder.rank("click the login button")]
+    assert ranked[0] == "tap"
+    assert builder.rank("xyzzy") == []
+
+
+def test_build_keeps_registry_order_and_limits():
+    builder = PromptBuilder(top_k=3, max_examples=2)
+    prompt, specs = builder.build("turn on wifi and bluetooth")
+
+    names = [spec.name for spec in specs]
+    registry_order = [spec.name for spec in ACTION_SPECS if spec.name in names]
+    assert names == registry_order
+    assert len(specs) <= 3 and {"wifi", "bluetooth"} <= set(names)
+    assert prompt.startswith(PROMPT_HEADER)
+    assert prompt.endswith(PROMPT_FOOTER)
+    assert prompt.count('User: "') <= 2
+
+
+def test_build_returns_none_without_a_match():
+    assert PromptBuilder().build("xyzzy") is None
+
+
+def test_pruned_prompt_is_shorter_than_the_full_prompt():
+    prompt, _ = PromptBuilder().build("take a screenshot")
+    assert len(prompt) < len(render_prompt(ACTION_SPECS, []))
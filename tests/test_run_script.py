@@ -0,0 +1,113 @@
+"""Tests for the pipelined script runner with fake parser and device."""
+
+import threading
+
+import pytest
+
+import run_script
+from run_script import ScriptRunner, parse_script
+
+SCRIPT = """
+# Settings flow
+open settings
+wait 0.5s
+expect app com.android.settings
+expect no text "Error"
+tap the wifi toggle
+"""
+
+
+class FakeGemma:
+    """Parses "<action> ..." into {"action": <action>}; "bad ..." fails."""
+
+    def __init__(self):
+        self.parsed = []
+        self.lock = threading.Lock()
+
+    def parse_command(self, text):
+        with self.lock:
+            self.parsed.append(text)
+        if text.startswith("bad"):
+            return {"error": "could not parse"}
+        return {"action": text.split()[0]}
+
+
+class FakeAndroid:
+    def __init__(self, package="com.android.settings", texts=()):
+        self.executed = []
+        self.package = package
+        self.texts = list(texts)
+
+    def execute_command(self, command):
+        self.executed.append(command["action"])
+        if command["action"] == "fail":
+            return {"error": "device said no"}
+        return {"success": True, "message": f"Ran {command['action']}"}
+
+    def get_foreground_app(self):
+        return {"package": self.package}
+
+    def get_screen_text(self):
+        return {"texts": self.texts}
+
+
+@pytest.fixture(autouse=True)
+def fast_polling(monkeypatch):
+    monkeypatch.setattr(run_script, "EXPECT_POLL_INTERVAL", 0.01)
+
+
+def test_parse_script():
+    steps = parse_script(SCRIPT.splitlines())
+    assert [(step.line, step.kind) for step in steps] == [
+        (3, "command"), (4, "wait"), (5, "expect"), (6, "expect"), (7, "command")]
+    assert steps[1].seconds == 0.5
+    assert (steps[2].target, steps[2].value, steps[2].negate) == (
+        "app", "com.android.settings", False)
+    assert (steps[3].target, steps[3].value, steps[3].negate) == ("text", "Error", True)
+
+
+def test_run_passes_every_step(monkeypatch):
+    monkeypatch.setattr(run_script.time, "sleep", lambda seconds: None)
+    android = FakeAndroid(texts=["Wi-Fi", "Bluetooth"])
+    runner = ScriptRunner(FakeGemma(), android, lookahead=2, expect_timeout=0.1)
+
+    results = runner.run(parse_script(SCRIPT.splitlines()))
+    assert [result["status"] for result in results] == ["passed"] * 5
+    assert android.executed == ["open", "tap"]
+    assert results[0]["command"] == {"action": "open"}
+
+
+@pytest.mark.parametrize("on_failure, statuses, executed", [
+    ("stop", ["passed", "failed", "skipped", "skipped"], ["open", "fail"]),
+    ("continue", ["passed", "failed", "failed", "passed"], ["open", "fail", "tap"]),
+])
+def test_failure_policy(on_failure, statuses, executed):
+    android = FakeAndroid()
+    runner = ScriptRunner(FakeGemma(), android, lookahead=1, on_failure=on_failure)
+
+    steps = parse_script(["open settings", "fail now", "bad input", "tap it"])
+    results = runner.run(steps)
+    assert [result["status"] for result in results] == statuses
+    assert android.executed == executed
+
+
+def test_expect_times_out_with_what_was_observed():
+    runner = ScriptRunner(FakeGemma(), FakeAndroid(package="com.example"),
+                          expect_timeout=0.05)
+
+    result, = runner.run(parse_script(["expect app com.android.settings"]))
+    assert result["status"] == "failed"
+    assert "foreground app is com.example" in result["message"]
+
+
+def test_lookahead_zero_parses_in_step_order():
+    gemma = FakeGemma()
+    runner = ScriptRunner(gemma, FakeAndroid(), lookahead=0)
+
+    runner.run(parse_script(["open a", "tap b", "swipe c"]))
+    assert gemma.parsed == ["open a", "tap b", "swipe c"]
+
+
+def test_unknown_failure_policy_is_rejected():
+    with pytest.raises(ValueError):
+        ScriptRunner(FakeGemma(), FakeAndroid(), on_failure="retry")
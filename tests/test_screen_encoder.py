@@ -0,0 +1,57 @@
+"""Tests for vision-request screen encoding and coordinate rescaling."""
+
+import base64
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from screen_encoder import PATCH_SIZE, ScreenEncoder, rescale_coordinates
+
+
+def frame(width=1080, height=1920, value=128):
+    return np.full((height, width, 4), value, dtype=np.uint8)
+
+
+def test_target_size_fits_the_patch_budget():
+    encoder = ScreenEncoder(patch_budget=256)
+    width, height = encoder.target_size(1080, 1920)
+    assert width * height <= 256 * PATCH_SIZE * PATCH_SIZE
+    assert abs(width / height - 1080 / 1920) < 0.01
+    assert encoder.target_size(100, 200) == (100, 200)
+
+
+def test_encode_downscales_and_reuses_unchanged_screens():
+    encoder = ScreenEncoder(patch_budget=256, grayscale=True)
+    screen = encoder.encode(frame())
+    image = Image.open(io.BytesIO(base64.b64decode(screen.image)))
+    assert image.format == "JPEG"
+    assert image.mode == "L"
+    assert image.size == (screen.width, screen.height)
+
+    assert encoder.encode(frame()) is screen
+    encoder.encode(frame(value=0))
+    assert encoder.get_stats() == {"hits": 1, "misses": 2, "size": 2}
+
+
+def test_cache_keeps_only_recent_screens():
+    encoder = ScreenEncoder(patch_budget=16, cache_size=2)
+    for value in range(3):
+        encoder.encode(frame(value=value))
+    assert encoder.get_stats()["size"] == 2
+
+
+@pytest.mark.parametrize("command, expected", [
+    ({"action": "tap", "x": 270, "y": 480}, {"action": "tap", "x": 540, "y": 960}),
+    ({"action": "swipe", "start_x": 0, "start_y": 0, "end_x": 540, "end_y": 960},
+     {"action": "swipe", "start_x": 0, "start_y": 0, "end_x": 1079, "end_y": 1919}),
+    ({"action": "key", "keycode": "BACK"}, {"action": "key", "keycode": "BACK"}),
+])
+def test_rescale_coordinates(command, expected):
+    assert rescale_coordinates(command, (540, 960), (1080, 1920)) == expected
+
+
+def test_rescale_without_screen_size_leaves_command_alone():
+    command = {"action": "tap", "x": 5, "y": 6}
+    assert rescale_coordinates(dict(command), (540, 960), None) == command
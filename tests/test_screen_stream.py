@@ -0,0 +1,28 @@
+"""Tests for the shared MJPEG frame broadcaster."""
+
+import threading
+
+import numpy as np
+
+from screen_stream import FrameBroadcaster
+
+
+def test_frames_ends_when_no_frame_ever_arrives():
+    def failing_capture():
+        raise RuntimeError("no device")
+
+    broadcaster = FrameBroadcaster(failing_capture, threading.Semaphore(1))
+    assert list(broadcaster.frames(timeout=0.05, max_empty_waits=2)) == []
+    assert broadcaster.subscribers == 0
+
+
+def test_frames_yields_and_unsubscribes_on_close():
+    def capture():
+        return np.zeros((4, 4, 4), dtype=np.uint8)
+
+    broadcaster = FrameBroadcaster(capture, threading.Semaphore(1))
+    frames = broadcaster.frames(timeout=1.0)
+    assert next(frames).startswith(b"\xff\xd8")
+    assert broadcaster.subscribers == 1
+    frames.close()
+    assert broadcaster.subscribers == 0
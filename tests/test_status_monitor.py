@@ -0,0 +1,37 @@
+"""Tests for the background-refreshed status snapshot."""
+
+import json
+
+from status_monitor import StatusMonitor
+
+
+def test_snapshot_collects_once_when_nothing_is_cached():
+    calls = []
+
+    def collect():
+        calls.append(True)
+        return {"model_loaded": True}
+
+    monitor = StatusMonitor(collect)
+    version, body = monitor.snapshot()
+    assert (version, json.loads(body)) == (1, {"model_loaded": True})
+    assert monitor.snapshot() == (version, body)
+    assert len(calls) == 1
+
+
+def test_version_changes_only_with_content():
+    status = {"devices": 1}
+    monitor = StatusMonitor(lambda: dict(status))
+
+    assert monitor.update() == 1
+    assert monitor.update() == 1
+    status["devices"] = 2
+    assert monitor.update() == 2
+
+
+def test_collect_failure_is_published_as_an_error():
+    def collect():
+        raise RuntimeError("adb hung")
+
+    _, body = StatusMonitor(collect).snapshot()
+    assert json.loads(body) == {"error": "Status check failed: adb hung"}